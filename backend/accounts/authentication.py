@@ -8,32 +8,121 @@ from django.db.models import Q # Import Q object for OR queries
 import logging
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 from django.utils.translation import gettext_lazy as _
+from django.core.cache import cache
+import pickle
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 UserModel = get_user_model() # <--- DEFINE UserModel HERE
 
+# Resolved users are cached so authenticated requests skip the public-schema
+# user query. The local cache is per process and keyed by (user id, token jti);
+# Redis is shared and keyed by user id. Saves and deletes of a User clear the
+# Redis entry (see accounts/signals.py); the short local TTL bounds how long
+# another process can keep serving a deactivated user.
+_local_user_cache = {}
+_local_user_cache_lock = threading.Lock()
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def _cache_ttls():
+    return (
+        getattr(settings, 'AUTH_USER_CACHE_LOCAL_TTL', 5),
+        getattr(settings, 'AUTH_USER_CACHE_TTL', 300),
+    )
+
+
+def _local_get(user_id, jti):
+    with _local_user_cache_lock:
+        entry = _local_user_cache.get((user_id, jti))
+        if entry is None:
+            return None
+        data, expires = entry
+        if expires < time.monotonic():
+            del _local_user_cache[(user_id, jti)]
+            return None
+        return data
+
+
+def _local_put(user_id, jti, data, ttl):
+    with _local_user_cache_lock:
+        # Expired tokens never come back, so drop stale entries as we go
+        if len(_local_user_cache) >= getattr(settings, 'AUTH_USER_CACHE_LOCAL_SIZE', 1000):
+            now = time.monotonic()
+            for key in [key for key, (_, expires) in _local_user_cache.items() if expires < now]:
+                del _local_user_cache[key]
+            if len(_local_user_cache) >= getattr(settings, 'AUTH_USER_CACHE_LOCAL_SIZE', 1000):
+                _local_user_cache.clear()
+        _local_user_cache[(user_id, jti)] = (data, time.monotonic() + ttl)
+
+
+def invalidate_cached_user(user_id):
+    """Forget a user in this process and in Redis, e.g. after it was saved"""
+    user_id = str(user_id)
+    with _local_user_cache_lock:
+        for key in [key for key in _local_user_cache if key[0] == user_id]:
+            del _local_user_cache[key]
+    try:
+        cache.delete(user_cache_key(user_id))
+    except Exception as e:
+        logger.warning(f"Could not invalidate cached user {user_id}: {e}")
+
+
 class PublicSchemaJWTAuthentication(JWTAuthentication):
     """
     Authenticates user based on JWT token, but always performs
     user lookup in the public schema.
     """
+    def _load_user(self, user_id):
+        """Pickled public-schema user, from Redis or the database"""
+        key = user_cache_key(user_id)
+        try:
+            data = cache.get(key)
+            if data is not None:
+                return data
+        except Exception as e:
+            logger.warning(f"User cache unavailable, falling back to the database: {e}")
+
+        # Force user lookup into the public schema
+        with schema_context(settings.PUBLIC_SCHEMA_NAME):
+            user = UserModel.objects.get(**{settings.SIMPLE_JWT['USER_ID_FIELD']: user_id})
+        data = pickle.dumps(user)
+
+        try:
+            cache.set(key, data, _cache_ttls()[1])
+        except Exception as e:
+            logger.warning(f"Could not cache user {user_id}: {e}")
+        return data
+
     def get_user(self, validated_token):
         """
         Attempts to find and return a user using the given validated token.
-        Forces the lookup to occur in the public schema.
+        Forces the lookup to occur in the public schema; the result is cached.
         """
         try:
             user_id = validated_token[settings.SIMPLE_JWT['USER_ID_CLAIM']]
         except KeyError:
             raise InvalidToken(_("Token contained no recognizable user identification"))
 
-        try:
-            # Force user lookup into the public schema
-            with schema_context(settings.PUBLIC_SCHEMA_NAME):
-                user = UserModel.objects.get(**{settings.SIMPLE_JWT['USER_ID_FIELD']: user_id})
-        except UserModel.DoesNotExist:
-            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        user_id = str(user_id)
+        jti = validated_token.get(settings.SIMPLE_JWT.get('JTI_CLAIM', 'jti'), '')
+        local_ttl = _cache_ttls()[0]
+
+        data = _local_get(user_id, jti)
+        if data is None:
+            try:
+                data = self._load_user(user_id)
+            except UserModel.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            _local_put(user_id, jti, data, local_ttl)
+
+        # A fresh instance per request, so nothing leaks between requests
+        user = pickle.loads(data)
 
         if not user.is_active:
             raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
@@ -0,0 +1,48 @@
+# backend/accounts/signals.py
+"""
+Keep the JWT user cache (accounts/authentication.py) in step with User rows.
+
+Users live in the public schema and are mirrored into each tenant's schema
+by tenants/utils.py. The cache is keyed by the public user's id, so a save
+or delete in a tenant schema is mapped back to the public user by username.
+Invalidation runs on commit, so a request can't re-cache the old row
+between the save and the end of its transaction.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_tenants.utils import schema_context
+
+from .authentication import invalidate_cached_user
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+def _public_user_ids(instance):
+    """Cache keys to clear for a User saved or deleted in the current schema"""
+    if getattr(connection, 'schema_name', settings.PUBLIC_SCHEMA_NAME) == settings.PUBLIC_SCHEMA_NAME:
+        return [instance.pk]
+    # A tenant-schema mirror - find the public user it mirrors
+    with schema_context(settings.PUBLIC_SCHEMA_NAME):
+        return list(User.objects.filter(username=instance.username).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User, dispatch_uid='accounts-user-cache-save')
+@receiver(post_delete, sender=User, dispatch_uid='accounts-user-cache-delete')
+def invalidate_user_cache(sender, instance, **kwargs):
+    try:
+        user_ids = _public_user_ids(instance)
+    except Exception as e:
+        logger.warning(f"Could not resolve public user for {instance.username}: {e}")
+        user_ids = [instance.pk]
+
+    def invalidate():
+        for user_id in user_ids:
+            invalidate_cached_user(user_id)
+
+    transaction.on_commit(invalidate)
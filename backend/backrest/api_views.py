@@ -16,13 +16,13 @@ from .serializers import (
     BackrestPlanSerializer, BackrestOperationSerializer, BackrestSnapshotSerializer, BackrestLogSerializer
 )
 from .services import BackrestService
+from .listing import SparseFieldsViewMixin
 import logging
 import os
 import tempfile
 import subprocess
 import json
 import bcrypt
-from django.db.models import Q
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
@@ -55,40 +55,12 @@ class ServerViewSet(viewsets.ModelViewSet):
         server = self.get_object()
         
         try:
-            # Test connection using SSH
-            import paramiko
-            import tempfile
-            import os
-            
-            # Create temporary key file
-            with tempfile.NamedTemporaryFile(delete=False) as key_file:
-                key_path = key_file.name
-                key_file.write(server.ssh_key.private_key.encode())
-            
-            # Set proper permissions
-            os.chmod(key_path, 0o600)
-            
-            # Initialize SSH client
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Connect to server
-            client.connect(
-                hostname=server.hostname,
-                port=server.ssh_port, 
-                username=server.ssh_user,
-                key_filename=key_path,
-                timeout=10
-            )
+            # Test connection using a pooled SSH session
+            from .ssh import ssh_pool
             
             # Execute test command
-            stdin, stdout, stderr = client.exec_command('uname -a')
-            output = stdout.read().decode('utf-8').strip()
-            error = stderr.read().decode('utf-8').strip()
-            
-            # Close connection and clean up
-            client.close()
-            os.unlink(key_path)
+            exit_status, output, error = ssh_pool.exec_command(server, 'uname -a', timeout=10)
+            output = output.strip()
             
             return Response({
                 "status": "success", 
@@ -656,35 +628,74 @@ class BackrestRepositoryViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def sync_snapshots(self, request, pk=None):
-        """Sync snapshots from Backrest"""
+        """Queue a snapshot sync from Backrest; large repos don't fit in a request"""
+        from .tasks import sync_repository_snapshots
+        
         repository = self.get_object()
         
         try:
-            backrest_service = BackrestService(repository.server)
-            snapshots = backrest_service.get_snapshots(repository.repository_id)
-            
-            # Create or update snapshot records
-            for snapshot_data in snapshots:
-                BackrestSnapshot.objects.update_or_create(
-                    repository=repository,
-                    snapshot_id=snapshot_data['id'],
-                    defaults={
-                        'tenant': repository.tenant,
-                        'time': snapshot_data['time'],
-                        'hostname': snapshot_data.get('hostname', ''),
-                        'username': snapshot_data.get('username', ''),
-                        'summary': snapshot_data.get('summary', {}),
-                        'size_bytes': snapshot_data.get('size', 0),
-                        'file_count': snapshot_data.get('fileCount', 0)
-                    }
-                )
-            
-            return Response({"status": "snapshots synced", "count": len(snapshots)})
+            result = sync_repository_snapshots.delay(request.tenant.id, repository.id)
+            return Response(
+                {"status": "snapshot sync queued", "task_id": result.id},
+                status=status.HTTP_202_ACCEPTED
+            )
         except Exception as e:
             return Response(
                 {"error": f"Failed to sync snapshots: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    @action(detail=True, methods=['get'])
+    def retention_preview(self, request, pk=None):
+        """Snapshots monthly retention would keep and forget (?month=YYYY-MM, default last month); changes nothing"""
+        from .retention import MONTH_TAG_RE, RetentionEngine
+        
+        repository = self.get_object()
+        tag = None
+        if request.query_params.get('month'):
+            tag = f"month-{request.query_params['month']}"
+            if not MONTH_TAG_RE.match(tag):
+                return Response(
+                    {"error": "month must look like YYYY-MM"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        try:
+            return Response(RetentionEngine(tag=tag, dry_run=True).apply(repository))
+        except Exception as e:
+            logger.exception(f"Retention preview failed for repository {repository.name}")
+            return Response(
+                {"error": f"Failed to preview retention: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    
+    @action(detail=True, methods=['get'])
+    def catalog_search(self, request, pk=None):
+        """Find which snapshots contain a file: ?path=/etc/hosts or ?glob=/etc/nginx/*.conf"""
+        from .catalog import search_catalog
+        
+        repository = self.get_object()
+        pattern = request.query_params.get('path') or request.query_params.get('glob')
+        if not pattern:
+            return Response(
+                {"error": "path or glob is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+        except ValueError:
+            limit = 100
+        
+        try:
+            results = search_catalog(request.tenant, repository, pattern, limit=max(limit, 1))
+            return Response({"results": results})
+        except Exception as e:
+            logger.exception(f"Catalog search failed for repository {repository.name}")
+            return Response(
+                {"error": f"Failed to search catalog: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
 class BackrestPlanViewSet(viewsets.ModelViewSet):
     """API endpoint for Backrest plans"""
@@ -728,6 +739,7 @@ class BackrestPlanViewSet(viewsets.ModelViewSet):
                 tenant=self.request.tenant,
                 plan_id=plan_id
             )
+            self._materialize_schedule(plan)
             
             # IMPORTANT: Best practice is to return the created object
             return plan
@@ -746,11 +758,34 @@ class BackrestPlanViewSet(viewsets.ModelViewSet):
             # Log the error but continue
             logger.warning(f"Created plan in database but Backrest API call failed: {str(e)}")
     
+    def perform_update(self, serializer):
+        plan = serializer.save()
+        # The schedule may have changed - replace the plan's upcoming occurrences
+        self._materialize_schedule(plan)
+    
+    def _materialize_schedule(self, plan):
+        from .schedules import materialize_occurrences
+        try:
+            materialize_occurrences(self.request.tenant, plans=[plan])
+        except Exception as e:
+            logger.warning(f"Could not materialize schedule for plan {plan.plan_id}: {str(e)}")
+    
     @action(detail=True, methods=['post'])
     def trigger_backup(self, request, pk=None):
         """Trigger a backup for a plan and record it in the database"""
         plan = self.get_object()
         
+        # Counter lookup on the tenant row, no snapshot scan
+        from django.conf import settings
+        if getattr(settings, 'BACKREST_ENFORCE_STORAGE_QUOTA', True):
+            from .storage import quota_status
+            quota = quota_status(request.tenant)
+            if quota["exceeded"]:
+                return Response(
+                    {"error": "Storage quota exceeded", "quota": quota},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+        
         try:
             # Get the backrest service
             backrest_service = BackrestService(plan.repository.server)
@@ -773,6 +808,10 @@ class BackrestPlanViewSet(viewsets.ModelViewSet):
                     # Other errors are real problems
                     raise
             
+            # Pick up the new operation's progress on the next sync tick
+            from .polling import poll_soon
+            poll_soon(plan.repository.server)
+            
             # Extract operation ID from the response
             operation_id = response.get('operation_id') or response.get('id')
             if not operation_id:
@@ -847,13 +886,51 @@ class BackrestPlanViewSet(viewsets.ModelViewSet):
                 "message": f"Failed to trigger backup: {str(e)}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class BackrestOperationViewSet(viewsets.ReadOnlyModelViewSet):
+class BackrestOperationViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoint for Backrest operations"""
     serializer_class = BackrestOperationSerializer
     permission_classes = [permissions.IsAuthenticated, IsTenantAdminOrOwner]
+    # Scheduled occurrences have no started_at yet, so page on when they run
+    cursor_ordering = ('-sort_time', '-id')
     
     def get_queryset(self):
-        return BackrestOperation.objects.filter(tenant=self.request.tenant)
+        from django.db.models import DateTimeField, Value
+        from django.db.models.functions import Coalesce
+        from datetime import datetime, timezone as dt_timezone
+        
+        queryset = BackrestOperation.objects.filter(tenant=self.request.tenant).annotate(
+            sort_time=Coalesce(
+                'started_at', 'scheduled_at',
+                Value(datetime(1970, 1, 1, tzinfo=dt_timezone.utc), output_field=DateTimeField()),
+            )
+        )
+        return self.optimize_queryset(queryset)
+    
+    @action(detail=False, methods=['get'])
+    def upcoming(self, request):
+        """Scheduled backups in the next `hours` (default: the schedule horizon)"""
+        from .schedules import upcoming_occurrences
+        
+        hours = request.query_params.get('hours')
+        try:
+            hours = int(hours) if hours else None
+        except ValueError:
+            hours = None
+        
+        occurrences = upcoming_occurrences(hours).filter(tenant=request.tenant)
+        return Response([
+            {
+                'id': op.id,
+                'operation_id': op.operation_id,
+                'plan': op.plan_id,
+                'plan_name': op.plan.name if op.plan else None,
+                'repository': op.repository_id,
+                'repository_name': op.repository.name,
+                'scheduled_at': op.scheduled_at,
+                'display_status': op.get_display_status(),
+            }
+            for op in occurrences
+        ])
     
     @action(detail=False, methods=['post'])
     def sync_operations(self, request):
@@ -863,7 +940,10 @@ class BackrestOperationViewSet(viewsets.ReadOnlyModelViewSet):
         tenant = request.tenant
         
         try:
-            repos = BackrestRepository.objects.filter(tenant=tenant)
+            from .sync import OperationUpserter, PlanResolver
+            
+            repos = BackrestRepository.objects.filter(tenant=tenant).select_related('server')
+            plan_resolver = PlanResolver(tenant)
             
             operations_updated = 0
             operations_completed = 0
@@ -875,89 +955,18 @@ class BackrestOperationViewSet(viewsets.ReadOnlyModelViewSet):
                     # Get operations from Backrest
                     backrest_operations = backrest_service.get_operations(repository_id=repo.repository_id)
                     
-                    for op_data in backrest_operations:
-                        op_id = op_data.get('id')
-                        if not op_id:
-                            continue
-                        
-                        # IMPROVED FILTERING: Only process our operation IDs and ignore the rest
-                        if not str(op_id).startswith('op_'):
-                            logger.info(f"Skipping non-app operation: {op_id}")
-                            continue
-                        
-                        # Default status in case we need it
-                        status = 'unknown'
-                        
-                        # Safely get and transform status
-                        raw_status = op_data.get('status', '')
-                        if raw_status:
-                            status = raw_status.replace('STATUS_', '').lower()
-                            if status == 'inprogress':
-                                status = 'running'
-                            elif status == 'success':
-                                status = 'completed'
-                        
-                        # Try to find existing operation in database
-                        try:
-                            operation = BackrestOperation.objects.get(operation_id=op_id)
-                            
-                            # Update operation status if changed
-                            if operation.status != status:
-                                old_status = operation.status
-                                operation.status = status
-                                operations_updated += 1
-                                logger.info(f"Updated operation {op_id} status from {old_status} to {status}")
-                            
-                            # If operation is completed now, update all the fields
-                            if status in ['completed', 'failed', 'canceled'] and not operation.completed_at:
-                                # Set the completion time
-                                operation.completed_at = timezone.now()
-                                operations_completed += 1
-                                
-                                # Update snapshot_id if available
-                                if 'snapshot_id' in op_data and op_data['snapshot_id']:
-                                    operation.snapshot_id = op_data['snapshot_id']
-                                
-                                # Update stats if available
-                                if 'stats' in op_data and op_data['stats']:
-                                    operation.stats = op_data['stats']
-                                
-                                # Update error message if available
-                                if status == 'failed' and 'error' in op_data and op_data['error']:
-                                    operation.error = op_data['error']
-                                
-                                logger.info(f"Operation {op_id} marked as {status} with completion time: {operation.completed_at}")
-                        
-                        except BackrestOperation.DoesNotExist:
-                            # This is a new operation from Backrest, create it
-                            # Only create if it appears to be one of our operations
-                            if str(op_id).startswith('op_'):
-                                plan = None
-                                if 'plan_id' in op_data and op_data['plan_id']:
-                                    from .models import BackrestPlan
-                                    plans = BackrestPlan.objects.filter(plan_id=op_data['plan_id'])
-                                    if plans.exists():
-                                        plan = plans.first()
-                            
-                                # Set completed_at if already completed
-                                completed_at = None
-                                if status in ['completed', 'failed', 'canceled']:
-                                    completed_at = timezone.now()
-                                
-                                BackrestOperation.objects.create(
-                                    tenant=request.tenant,
-                                    repository=repo,
-                                    plan=plan,
-                                    operation_id=op_id,
-                                    operation_type=op_data.get('type', 'unknown'),
-                                    status=status,
-                                    started_at=timezone.now(),
-                                    completed_at=completed_at,
-                                    snapshot_id=op_data.get('snapshot_id'),
-                                    stats=op_data.get('stats'),
-                                    error=op_data.get('error') if status == 'failed' else None
-                                )
-                                operations_updated += 1
+                    # Only process our operation IDs and ignore the rest
+                    app_operations = [
+                        op_data for op_data in backrest_operations
+                        if str(op_data.get('id', '')).startswith('op_')
+                    ]
+                    skipped = len(backrest_operations) - len(app_operations)
+                    if skipped:
+                        logger.info(f"Skipping {skipped} non-app operations for repo {repo.repository_id}")
+                    
+                    result = OperationUpserter(tenant, repo, plan_resolver=plan_resolver).upsert(app_operations)
+                    operations_updated += result['added'] + result['updated']
+                    operations_completed += result['completed']
                 
                 except Exception as repo_error:
                     logger.error(f"Error syncing operations for repo {repo.repository_id}: {str(repo_error)}")
@@ -1025,13 +1034,14 @@ class BackrestOperationViewSet(viewsets.ReadOnlyModelViewSet):
                 'message': f'Failed to sync operations: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class BackrestSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
+class BackrestSnapshotViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoint for Backrest snapshots"""
     serializer_class = BackrestSnapshotSerializer
     permission_classes = [permissions.IsAuthenticated, IsTenantAdminOrOwner]
+    cursor_ordering = ('-time', '-id')
     
     def get_queryset(self):
-        return BackrestSnapshot.objects.filter(tenant=self.request.tenant)
+        return self.optimize_queryset(BackrestSnapshot.objects.filter(tenant=self.request.tenant))
     
     @action(detail=True, methods=['post'])
     def restore(self, request, pk=None):
@@ -1046,11 +1056,11 @@ class BackrestSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
         server = self.get_object()
         
         try:
-            import requests
+            from . import http_pool
             
             # Try to connect to Backrest
             url = f"http://{server.hostname}:{server.backrest_port}/v1.Backrest/GetVersion"
-            response = requests.post(url, json={})
+            response = http_pool.request('post', url, json={})
             
             if response.status_code == 200:
                 return Response({
@@ -1190,16 +1200,24 @@ class BackrestSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
         try:
             # First get all repositories with their servers
             from .models import BackrestRepository
-            repos = BackrestRepository.objects.filter(tenant=request.tenant)
+            from .async_service import fan_out
+            repos = list(BackrestRepository.objects.filter(tenant=request.tenant).select_related('server'))
+            
+            # Fetch each server's config once, concurrently
+            servers = {repo.server_id: repo.server for repo in repos}
+            configs = fan_out(
+                (server_id, server, lambda service: service.get_config())
+                for server_id, server in servers.items()
+            )
             
             plans_added = []
             
             for repo in repos:
-                backrest_service = BackrestService(repo.server)
-                
                 try:
                     # Get current config from Backrest
-                    config = backrest_service.get_config()
+                    config = configs[repo.server_id]
+                    if isinstance(config, Exception):
+                        raise config
                     
                     if 'plans' in config and isinstance(config['plans'], list):
                         for plan_data in config['plans']:
@@ -1324,13 +1342,20 @@ class BackrestSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
                 'message': f'Error checking logs: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class BackrestLogViewSet(viewsets.ReadOnlyModelViewSet):
+class BackrestLogViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoint for Backrest logs"""
     serializer_class = BackrestLogSerializer
     permission_classes = [permissions.IsAuthenticated, IsTenantAdminOrOwner]
+    cursor_ordering = ('-timestamp', '-id')
+    
+    def get_cursor_ordering(self):
+        if self.request.query_params.get('search') and self.request.query_params.get('ordering') == 'rank':
+            return ('-search_rank', '-id')
+        return self.cursor_ordering
     
     def get_queryset(self):
-        queryset = BackrestLog.objects.filter(tenant=self.request.tenant)
+        # The tsvector is only needed in WHERE, never in the response
+        queryset = BackrestLog.objects.filter(tenant=self.request.tenant).defer('search_vector')
         
         # Allow filtering by various parameters
         server_id = self.request.query_params.get('server_id')
@@ -1345,12 +1370,17 @@ class BackrestLogViewSet(viewsets.ReadOnlyModelViewSet):
         if source:
             queryset = queryset.filter(source__icontains=source)
             
+        # Full-text search through the GIN index on search_vector (see search.py)
         search = self.request.query_params.get('search')
+        ordering = self.request.query_params.get('ordering')
         if search:
-            queryset = queryset.filter(
-                Q(message__icontains=search) | 
-                Q(error__icontains=search) |
-                Q(logger_name__icontains=search)
+            from .search import search_logs
+            queryset = search_logs(
+                queryset,
+                search,
+                mode=self.request.query_params.get('search_mode', 'websearch'),
+                rank=ordering == 'rank',
+                highlight=self.request.query_params.get('highlight', '').lower() in ('1', 'true', 'yes'),
             )
             
         # Limit to recent logs by default (last 7 days)
@@ -1364,7 +1394,12 @@ class BackrestLogViewSet(viewsets.ReadOnlyModelViewSet):
             since = timezone.now() - timedelta(days=days)
             queryset = queryset.filter(timestamp__gte=since)
             
-        return queryset.order_by('-timestamp')
+        if search and ordering == 'rank':
+            queryset = queryset.order_by('-search_rank', '-timestamp')
+        else:
+            queryset = queryset.order_by('-timestamp')
+        # server_name comes from the server - optimize_queryset joins it instead of a query per row
+        return self.optimize_queryset(queryset)
     
     @action(detail=False, methods=['post'])
     def sync_logs(self, request):
@@ -1457,19 +1492,18 @@ class CheckBackrestServiceStatusView(APIView):
             server = Server.objects.get(id=server_id)
             
             try:
-                # Use paramiko to SSH into the server and run systemctl command
-                client = get_ssh_client_for_server(server)
-                
-                # First check with systemctl
-                stdin, stdout, stderr = client.exec_command('systemctl is-active backrest')
-                status = stdout.read().decode('utf-8').strip()
-                
-                # Also check if process is running as a backup check
-                stdin, stdout, stderr = client.exec_command('pgrep -f backrest')
-                process_output = stdout.read().decode('utf-8').strip()
-                is_running = len(process_output) > 0
+                # Use a pooled SSH session to run the systemctl command
+                from .ssh import ssh_pool
                 
-                client.close()
+                with ssh_pool.session(server) as client:
+                    # First check with systemctl
+                    stdin, stdout, stderr = client.exec_command('systemctl is-active backrest')
+                    status = stdout.read().decode('utf-8').strip()
+                    
+                    # Also check if process is running as a backup check
+                    stdin, stdout, stderr = client.exec_command('pgrep -f backrest')
+                    process_output = stdout.read().decode('utf-8').strip()
+                    is_running = len(process_output) > 0
                 
                 # If service is active or process is running, create/update a BackrestInstance record
                 if status == 'active' or is_running:
@@ -1557,28 +1591,88 @@ class BackrestStatusView(APIView):
 def get_ssh_client_for_server(server):
     """
     Helper function to create and return a paramiko SSHClient for a given server.
+
+    The client is not pooled - the caller owns it and must close it.
     """
-    import paramiko
-    import tempfile
-    import os
+    from .ssh import connect_client
 
-    # Create temporary key file
-    with tempfile.NamedTemporaryFile(delete=False, mode='w') as key_file:
-        key_path = key_file.name
-        key_file.write(server.ssh_key.private_key)
+    return connect_client(server, timeout=10)
 
-    os.chmod(key_path, 0o600)
+class BackrestHookView(APIView):
+    """
+    Receives operation events from Backrest plan/repo webhook hooks.
 
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(
-        hostname=server.hostname,
-        port=server.ssh_port,
-        username=server.ssh_user,
-        key_filename=key_path,
-        timeout=10
-    )
-    # Clean up key file after connection is established
-    os.unlink(key_path)
-    return client
+    Backrest can't send auth headers, so the server's webhook token is part
+    of the URL. Runs in the tenant schema of the requesting domain, so a
+    server id only resolves within its own tenant.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    
+    def post(self, request, server_id, token):
+        import secrets
+        from .hooks import apply_hook_event
+        
+        server = Server.objects.filter(id=server_id).first()
+        if server is None or not secrets.compare_digest(server.webhook_token, token):
+            return Response({"error": "Invalid hook URL"}, status=status.HTTP_403_FORBIDDEN)
+        
+        # Parse the body ourselves - Backrest doesn't always send a JSON content type
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            return Response({"error": "Expected a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            operation = apply_hook_event(server, payload)
+        except Exception as e:
+            logger.exception(f"Failed to apply hook event from {server.hostname}: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        if operation is None:
+            return Response({"status": "ignored"})
+        return Response({
+            "status": "applied",
+            "operation_id": operation.operation_id,
+            "operation_status": operation.status
+        })
 
+class BackrestMetricsView(APIView):
+    """Per task/route resource usage aggregated in this process (see backrest/instrumentation.py)"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        from .instrumentation import get_metrics, get_budget
+        
+        metrics = get_metrics()
+        for name, entry in metrics.items():
+            entry['budget'] = get_budget(name)
+        return Response({"pid": os.getpid(), "metrics": metrics})
+
+class StorageUsageView(APIView):
+    """The tenant's storage usage from the rollup counters, per repository, with daily history"""
+    
+    def get(self, request):
+        from tenants.models import TenantStorageUsage
+        from .storage import quota_status
+        
+        try:
+            days = max(1, min(int(request.query_params.get('days', 30)), 366))
+        except ValueError:
+            days = 30
+        
+        repositories = BackrestRepository.objects.filter(tenant=request.tenant).values(
+            'id', 'repository_id', 'name', 'storage_used_bytes', 'storage_measured_at', 'snapshot_count'
+        ).order_by('name')
+        history = TenantStorageUsage.objects.filter(
+            tenant_id=request.tenant.id,
+            date__gte=timezone.localdate() - timedelta(days=days - 1)
+        ).values('date', 'used_bytes', 'snapshot_count', 'repositories').order_by('date')
+        
+        return Response({
+            "quota": quota_status(request.tenant),
+            "repositories": list(repositories),
+            "history": list(history),
+        })
@@ -4,4 +4,9 @@ from django.apps import AppConfig
 class BackrestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backrest'
+
+    def ready(self):
+        from .instrumentation import connect_celery_signals
+        connect_celery_signals()
+        from . import signals  # noqa: F401 - marks tenants due when servers are added
     
\ No newline at end of file
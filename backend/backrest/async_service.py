@@ -0,0 +1,192 @@
+# backend/backrest/async_service.py
+"""
+Asyncio counterpart of BackrestService.
+
+Lets sync tasks poll many Backrest servers at once instead of waiting on
+each one in turn. Use `fan_out()` from synchronous code (celery tasks,
+DRF views) to run one call per server under a bounded concurrency limit.
+"""
+import asyncio
+import logging
+import time
+import uuid
+
+import httpx
+from django.conf import settings
+
+from .http_pool import is_idempotent_rpc, RETRY_STATUS_CODES
+from .instrumentation import record_http_call
+from .services import apply_config_changes
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBackrestService:
+    """Async service for interacting with the Backrest API"""
+
+    def __init__(self, server, client=None, base_url=None):
+        self.server = server
+        self.base_url = base_url or f"http://{server.hostname}:{server.backrest_port}"
+        # A shared client can be passed in so many services reuse one connection pool
+        self._client = client
+        self._owns_client = client is None
+        self.token = None
+
+    async def __aenter__(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _make_request(self, method, endpoint, data=None, auth_required=True, timeout=30):
+        """Make a request to the Backrest API, retrying idempotent RPCs"""
+        url = f"{self.base_url}{endpoint}"
+        logger.debug(f"Making async {method} request to {url}")
+
+        headers = {'Content-Type': 'application/json'}
+        if self.token and auth_required:
+            headers['Authorization'] = f"Bearer {self.token}"
+
+        max_retries = getattr(settings, 'BACKREST_HTTP_MAX_RETRIES', 3) if is_idempotent_rpc(url) else 0
+        backoff_factor = getattr(settings, 'BACKREST_HTTP_BACKOFF_FACTOR', 0.5)
+
+        attempt = 0
+        while True:
+            record_http_call()
+            try:
+                if method.lower() == 'get':
+                    response = await self._client.get(url, headers=headers, timeout=timeout)
+                elif method.lower() == 'post':
+                    response = await self._client.post(url, json=data, headers=headers, timeout=timeout)
+                else:
+                    raise ValueError(f"Unsupported HTTP method: {method}")
+
+                if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+                    logger.warning(f"Got HTTP {response.status_code} from {url}, retrying")
+                else:
+                    if response.status_code >= 400:
+                        logger.error(f"Error response body: {response.text}")
+                    response.raise_for_status()
+                    return response.json()
+            except httpx.TransportError as e:
+                if attempt >= max_retries:
+                    logger.error(f"Request error: {str(e) or type(e).__name__}")
+                    if isinstance(e, httpx.TimeoutException):
+                        raise
+                    raise Exception(f"Backrest API error: {str(e)}")
+                logger.warning(f"Request to {url} failed ({str(e)}), retrying")
+            except httpx.HTTPStatusError as e:
+                raise Exception(f"Backrest API error: {str(e)}")
+
+            await asyncio.sleep(backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    async def get_config(self):
+        """Get the current Backrest configuration"""
+        return await self._make_request('post', "/v1.Backrest/GetConfig", {})
+
+    async def get_operations(self, repository_id=None, plan_id=None, last_n=None):
+        """Get operations from Backrest, optionally only the newest `last_n`"""
+        selector = {}
+        if repository_id:
+            selector['repositoryId'] = repository_id
+        if plan_id:
+            selector['planId'] = plan_id
+
+        data = {"selector": selector}
+        if last_n:
+            data['lastN'] = last_n
+
+        response = await self._make_request('post', "/v1.Backrest/GetOperations", data)
+        return response.get('operations', [])
+
+    async def get_snapshots(self, repository_id, plan_id=None):
+        """Get snapshots for a repository"""
+        data = {"repo_id": repository_id}
+        if plan_id:
+            data["plan_id"] = plan_id
+
+        response = await self._make_request('post', "/v1.Backrest/ListSnapshots", data)
+        return response.get('snapshots', [])
+
+    async def trigger_backup(self, plan_id):
+        """Trigger a backup for a plan without waiting for it to finish"""
+        try:
+            await self._make_request('post', "/v1.Backrest/Backup", {"value": plan_id}, timeout=5)
+            logger.info(f"Backup triggered successfully for plan {plan_id}")
+            return {
+                "status": "backup_started",
+                "operation_id": f"op_{plan_id}_{int(time.time())}",
+                "plan_id": plan_id
+            }
+        except httpx.TimeoutException:
+            # Same as the sync service - a timeout means the backup most likely started
+            logger.info(f"Timeout while triggering backup for {plan_id} - backup likely started")
+            return {
+                "status": "backup_initiated",
+                "operation_id": f"op_{plan_id}_{int(time.time())}_{uuid.uuid4().hex[:4]}",
+                "plan_id": plan_id,
+                "note": "Request timed out, but backup may be running. Check operations."
+            }
+
+    async def set_config(self, instance_id=None, users=None, disable_auth=False, data=None):
+        """Set Backrest configuration, preserving the current modno"""
+        endpoint = '/v1.Backrest/SetConfig'
+        if data:
+            return await self._make_request('post', endpoint, data)
+
+        try:
+            current_config = await self.get_config()
+        except Exception as e:
+            logger.warning(f"Error getting current config: {str(e)}")
+            current_config = {}
+
+        current_config = apply_config_changes(current_config, instance_id, users, disable_auth)
+        return await self._make_request('post', endpoint, current_config)
+
+
+async def gather_per_server(jobs, concurrency=None, timeout=None):
+    """
+    Run one coroutine per job with at most `concurrency` in flight.
+
+    `jobs` is an iterable of (key, server, func) where `func` receives an
+    AsyncBackrestService and returns an awaitable. Returns a dict mapping
+    each key to its result, or to the exception it raised (including
+    asyncio.TimeoutError when the per-server `timeout` is exceeded).
+    """
+    if concurrency is None:
+        concurrency = getattr(settings, 'BACKREST_ASYNC_CONCURRENCY', 50)
+    if timeout is None:
+        timeout = getattr(settings, 'BACKREST_ASYNC_SERVER_TIMEOUT', 30)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+    )
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def run(key, server, func):
+            async with semaphore:
+                service = AsyncBackrestService(server, client=client)
+                try:
+                    return key, await asyncio.wait_for(func(service), timeout=timeout)
+                except Exception as e:
+                    logger.error(f"Backrest call for {server.hostname} failed: {str(e) or type(e).__name__}")
+                    return key, e
+
+        results = await asyncio.gather(*(run(key, server, func) for key, server, func in jobs))
+
+    return dict(results)
+
+
+def fan_out(jobs, concurrency=None, timeout=None):
+    """Synchronous entry point for gather_per_server"""
+    jobs = list(jobs)
+    if not jobs:
+        return {}
+    return asyncio.run(gather_per_server(jobs, concurrency=concurrency, timeout=timeout))
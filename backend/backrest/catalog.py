@@ -0,0 +1,298 @@
+# backend/backrest/catalog.py
+"""
+File-level catalog of a tenant's snapshots.
+
+Each tenant gets one SQLite file under BACKREST_CATALOG_DIR. Every indexed
+snapshot gets a per-repository sequence number in time order. File paths
+are interned once per repository, and each path stores "versions": runs of
+consecutive snapshot sequence numbers in which the file existed with the
+same size and mtime. A file that never changes across 500 snapshots is a
+single row, and "when did /etc/nginx/nginx.conf last change" is answered
+by reading that path's versions.
+
+Snapshots are indexed incrementally, oldest first. Only snapshots newer
+than the repository's last indexed one are read, by streaming
+`restic ls --json` over SSH. Search is an indexed lookup on the interned
+paths (exact or GLOB) plus the versions of the matching paths.
+"""
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    repo_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    snapshot_id TEXT NOT NULL,
+    time TEXT NOT NULL,
+    file_count INTEGER NOT NULL,
+    PRIMARY KEY (repo_id, seq),
+    UNIQUE (repo_id, snapshot_id)
+);
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    repo_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    type TEXT NOT NULL,
+    UNIQUE (repo_id, path)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    path_id INTEGER NOT NULL REFERENCES paths (id),
+    first_seq INTEGER NOT NULL,
+    last_seq INTEGER NOT NULL,
+    size INTEGER,
+    mtime TEXT
+);
+CREATE INDEX IF NOT EXISTS versions_path_idx ON versions (path_id, last_seq);
+"""
+
+GLOB_CHARS = set('*?[')
+
+
+def catalog_path(tenant):
+    directory = getattr(settings, 'BACKREST_CATALOG_DIR', os.path.join(settings.BASE_DIR, 'catalog'))
+    return os.path.join(directory, f"{tenant.schema_name}.sqlite3")
+
+
+@contextmanager
+def open_catalog(tenant):
+    """Connection to the tenant's catalog, created on first use"""
+    path = catalog_path(tenant)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        yield conn
+    finally:
+        conn.close()
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class CatalogIndexer:
+    """Adds a repository's new snapshots to the tenant's catalog"""
+
+    def __init__(self, tenant, repository, conn, batch_size=5000):
+        self.tenant = tenant
+        self.repository = repository
+        self.conn = conn
+        self.repo_id = repository.repository_id
+        self.batch_size = batch_size
+
+    def last_indexed(self):
+        """(seq, time) of the newest indexed snapshot, or (0, None)"""
+        row = self.conn.execute(
+            "SELECT seq, time FROM snapshots WHERE repo_id = ? ORDER BY seq DESC LIMIT 1", (self.repo_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def pending_snapshots(self):
+        """Stored snapshots newer than the last indexed one, oldest first"""
+        from .models import BackrestSnapshot
+
+        _, last_time = self.last_indexed()
+        snapshots = BackrestSnapshot.objects.filter(repository=self.repository).order_by('time', 'id')
+        if last_time:
+            snapshots = snapshots.filter(time__gt=last_time)
+        return list(snapshots.only('id', 'snapshot_id', 'time'))
+
+    def stream_nodes(self, client, snapshot_id):
+        """Yield (path, type, size, mtime) for every node of a remote snapshot"""
+        from .restic import exec_restic
+
+        stdin, stdout, stderr = exec_restic(client, self.repository, ['ls', '--json', '--quiet', snapshot_id])
+        for line in stdout:
+            try:
+                node = json.loads(line)
+            except ValueError:
+                continue
+            if node.get('struct_type', 'node') != 'node' or not node.get('path'):
+                continue
+            yield node['path'], node.get('type', 'file'), node.get('size'), node.get('mtime')
+
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            error = stderr.read().decode('utf-8', errors='replace')
+            raise Exception(f"restic ls failed with status {exit_status}: {error[:200]}")
+
+    def add_snapshot(self, snapshot, nodes):
+        """
+        Record one snapshot: extend the versions still unchanged since the
+        previous snapshot and open new ones for new or changed paths.
+        """
+        conn = self.conn
+        prev_seq, _ = self.last_indexed()
+        seq = prev_seq + 1
+
+        # path -> (version id, size, mtime) of the versions alive in the previous snapshot
+        open_versions = {
+            path: (version_id, size, mtime)
+            for version_id, path, size, mtime in conn.execute(
+                "SELECT v.id, p.path, v.size, v.mtime FROM versions v JOIN paths p ON p.id = v.path_id "
+                "WHERE p.repo_id = ? AND v.last_seq = ?",
+                (self.repo_id, prev_seq),
+            )
+        } if prev_seq else {}
+
+        extended = []
+        new_versions = []  # (path, type, size, mtime)
+        seen = set()
+        for path, node_type, size, mtime in nodes:
+            if path in seen:
+                continue
+            seen.add(path)
+            current = open_versions.get(path)
+            if current is not None and current[1] == size and current[2] == mtime:
+                extended.append((seq, current[0]))
+            else:
+                new_versions.append((path, node_type, size, mtime))
+
+        with conn:
+            for chunk in _chunks(extended, self.batch_size):
+                conn.executemany("UPDATE versions SET last_seq = ? WHERE id = ?", chunk)
+
+            for chunk in _chunks(new_versions, self.batch_size):
+                conn.executemany(
+                    "INSERT OR IGNORE INTO paths (repo_id, path, type) VALUES (?, ?, ?)",
+                    [(self.repo_id, path, node_type) for path, node_type, _, _ in chunk],
+                )
+                path_ids = dict(conn.execute(
+                    f"SELECT path, id FROM paths WHERE repo_id = ? AND path IN ({','.join('?' * len(chunk))})",
+                    [self.repo_id, *(path for path, _, _, _ in chunk)],
+                ).fetchall())
+                conn.executemany(
+                    "INSERT INTO versions (path_id, first_seq, last_seq, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                    [(path_ids[path], seq, seq, size, mtime) for path, _, size, mtime in chunk],
+                )
+
+            conn.execute(
+                "INSERT INTO snapshots (repo_id, seq, snapshot_id, time, file_count) VALUES (?, ?, ?, ?, ?)",
+                (self.repo_id, seq, snapshot.snapshot_id, snapshot.time.isoformat(), len(seen)),
+            )
+
+        return {'seq': seq, 'paths': len(seen), 'new_versions': len(new_versions), 'unchanged': len(extended)}
+
+    def run(self, client, max_snapshots=None):
+        """Index the pending snapshots over an open SSH session"""
+        pending = self.pending_snapshots()
+        batch = pending[:max_snapshots] if max_snapshots else pending
+
+        indexed = 0
+        for snapshot in batch:
+            result = self.add_snapshot(snapshot, self.stream_nodes(client, snapshot.snapshot_id))
+            indexed += 1
+            logger.info(
+                f"Indexed snapshot {snapshot.snapshot_id[:8]} of repo {self.repository.name}: "
+                f"{result['paths']} paths, {result['new_versions']} new versions"
+            )
+        return {'indexed': indexed, 'pending': len(pending) - indexed}
+
+
+def _glob_prefix(pattern):
+    """Literal prefix of a glob pattern, for an index range scan"""
+    for index, char in enumerate(pattern):
+        if char in GLOB_CHARS:
+            return pattern[:index]
+    return pattern
+
+
+def search_catalog(tenant, repository, pattern, limit=100):
+    """
+    Find paths of a repository matching `pattern` (an exact path or a glob,
+    e.g. "/etc/nginx/*.conf" or "*/nginx.conf") and return each path's
+    versions with the snapshots where each version begins and ends.
+    """
+    from .models import BackrestSnapshot
+
+    with open_catalog(tenant) as conn:
+        if GLOB_CHARS & set(pattern):
+            prefix = _glob_prefix(pattern)
+            sql = "SELECT id, path, type FROM paths WHERE repo_id = ? AND path GLOB ?"
+            params = [repository.repository_id, pattern]
+            if prefix:
+                # Lets SQLite range-scan the (repo_id, path) index instead of scanning every path
+                sql += " AND path >= ? AND path < ?"
+                params += [prefix, prefix + '\U0010ffff']
+            paths = conn.execute(sql + " ORDER BY path LIMIT ?", params + [limit]).fetchall()
+        else:
+            paths = conn.execute(
+                "SELECT id, path, type FROM paths WHERE repo_id = ? AND path = ?",
+                (repository.repository_id, pattern),
+            ).fetchall()
+
+        if not paths:
+            return []
+
+        path_ids = [path_id for path_id, _, _ in paths]
+        versions = {}
+        for path_id, first_seq, last_seq, size, mtime in conn.execute(
+            f"SELECT path_id, first_seq, last_seq, size, mtime FROM versions "
+            f"WHERE path_id IN ({','.join('?' * len(path_ids))}) ORDER BY first_seq",
+            path_ids,
+        ):
+            versions.setdefault(path_id, []).append((first_seq, last_seq, size, mtime))
+
+        seqs = {seq for path_versions in versions.values() for first, last, _, _ in path_versions for seq in (first, last)}
+        snapshots = {}
+        if seqs:
+            seq_list = list(seqs)
+            snapshots = {
+                seq: (snapshot_id, time)
+                for seq, snapshot_id, time in conn.execute(
+                    f"SELECT seq, snapshot_id, time FROM snapshots WHERE repo_id = ? AND seq IN ({','.join('?' * len(seq_list))})",
+                    [repository.repository_id, *seq_list],
+                )
+            }
+
+    # Snapshots forgotten since they were indexed are still in the catalog; flag them
+    live = set(
+        BackrestSnapshot.objects.filter(
+            repository=repository, snapshot_id__in=[snapshot_id for snapshot_id, _ in snapshots.values()]
+        ).values_list('snapshot_id', flat=True)
+    )
+
+    def describe(seq):
+        snapshot_id, time = snapshots.get(seq, (None, None))
+        return {'snapshot_id': snapshot_id, 'time': time, 'forgotten': snapshot_id not in live}
+
+    return [
+        {
+            'path': path,
+            'type': node_type,
+            'versions': [
+                {
+                    'size': size,
+                    'mtime': mtime,
+                    'snapshots': last_seq - first_seq + 1,
+                    'first': describe(first_seq),
+                    'last': describe(last_seq),
+                }
+                for first_seq, last_seq, size, mtime in versions.get(path_id, [])
+            ],
+        }
+        for path_id, path, node_type in paths
+    ]
+
+
+def index_repository(tenant, repository, max_snapshots=None):
+    """Index a repository's new snapshots into the tenant catalog over a pooled SSH session"""
+    from .ssh import ssh_pool
+
+    with open_catalog(tenant) as conn:
+        indexer = CatalogIndexer(tenant, repository, conn)
+        if not indexer.pending_snapshots():
+            return {'indexed': 0, 'pending': 0}
+        with ssh_pool.session(repository.server) as client:
+            return indexer.run(client, max_snapshots=max_snapshots)
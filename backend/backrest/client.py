@@ -2,6 +2,7 @@ import requests
 import json
 from django.utils import timezone
 import logging
+from . import http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +24,7 @@ class BackrestClient:
     def get_version(self):
         """Get Backrest version"""
         try:
-            response = requests.get(f"{self.server.get_backrest_url()}/version")
+            response = http_pool.request('get', f"{self.server.get_backrest_url()}/version")
             return self._handle_response(response)
         except Exception as e:
             logger.error(f"Error getting Backrest version: {e}")
@@ -37,13 +38,13 @@ class BackrestClient:
             "uri": uri,
             "password": password
         }
-        response = requests.post(url, json=payload)
+        response = http_pool.request('post', url, json=payload)
         return self._handle_response(response)
     
     def get_repositories(self):
         """Get list of repositories"""
         url = f"{self.base_url}.Backrest/GetRepos"
-        response = requests.post(url, json={})
+        response = http_pool.request('post', url, json={})
         return self._handle_response(response)
     
     def create_plan(self, repository_id, name, paths, excludes=None, schedule=None, retention_policy=None):
@@ -57,7 +58,7 @@ class BackrestClient:
             "schedule": schedule or {},
             "retentionPolicy": retention_policy or {}
         }
-        response = requests.post(url, json=payload)
+        response = http_pool.request('post', url, json=payload)
         return self._handle_response(response)
     
     def get_plans(self, repo_id=None):
@@ -66,18 +67,18 @@ class BackrestClient:
         payload = {}
         if repo_id:
             payload["repoId"] = repo_id
-        response = requests.post(url, json=payload)
+        response = http_pool.request('post', url, json=payload)
         return self._handle_response(response)
     
     def trigger_backup(self, plan_id):
         """Trigger a backup for a plan"""
         url = f"{self.base_url}.Backrest/Backup"
         payload = {"value": plan_id}
-        response = requests.post(url, json=payload)
+        response = http_pool.request('post', url, json=payload)
         return self._handle_response(response)
     
-    def get_operations(self, repo_id=None, plan_id=None, limit=100):
-        """Get operations"""
+    def get_operations(self, repo_id=None, plan_id=None, last_n=None):
+        """Get operations, optionally only the newest `last_n`"""
         url = f"{self.base_url}.Backrest/GetOperations"
         selector = {}
         if repo_id:
@@ -85,20 +86,22 @@ class BackrestClient:
         if plan_id:
             selector["planId"] = plan_id
             
-        payload = {"selector": selector, "limit": limit}
-        response = requests.post(url, json=payload)
+        payload = {"selector": selector}
+        if last_n:
+            payload["lastN"] = last_n
+        response = http_pool.request('post', url, json=payload)
         return self._handle_response(response)
     
     def get_operation(self, operation_id):
         """Get a specific operation"""
         url = f"{self.base_url}.Backrest/GetOperation"
         payload = {"value": operation_id}
-        response = requests.post(url, json=payload)
+        response = http_pool.request('post', url, json=payload)
         return self._handle_response(response)
     
     def get_snapshots(self, repo_id):
         """Get snapshots for a repository"""
         url = f"{self.base_url}.Backrest/GetSnapshots"
         payload = {"value": repo_id}
-        response = requests.post(url, json=payload)
+        response = http_pool.request('post', url, json=payload)
         return self._handle_response(response)
\ No newline at end of file
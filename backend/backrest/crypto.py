@@ -0,0 +1,155 @@
+# backend/backrest/crypto.py
+"""
+Key management for encrypted model fields.
+
+The cipher is a MultiFernet built once per process from
+BACKREST_ENCRYPTION_KEYS (newest first) followed by the legacy
+BASE_DIR/.encryption_key file. New values are always encrypted with the
+first key; values encrypted with any of the others still decrypt, so a
+key is rotated by putting a new one in front, running
+`python manage.py reencrypt_secrets`, and then retiring the old key.
+
+Decrypted values are kept in a small LRU with a TTL, keyed on the
+ciphertext, so the sync loops don't pay for a Fernet decrypt (HMAC + AES)
+every time they touch the same server's credentials.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_cipher = None
+_primary = None
+_cipher_lock = threading.Lock()
+
+_secret_cache = OrderedDict()
+_secret_cache_lock = threading.Lock()
+
+
+def key_file_path():
+    return os.path.join(settings.BASE_DIR, '.encryption_key')
+
+
+def _read_key_file(create):
+    """The legacy key file's key, creating the file if asked and missing"""
+    key_path = key_file_path()
+    if os.path.exists(key_path):
+        with open(key_path, 'rb') as f:
+            return f.read().strip()
+    if not create:
+        return None
+
+    key = Fernet.generate_key()
+    with open(key_path, 'wb') as f:
+        f.write(key)
+    os.chmod(key_path, 0o600)  # Secure permissions
+    return key
+
+
+def load_keys():
+    """All configured keys, the one new values are encrypted with first"""
+    keys = [key.encode() if isinstance(key, str) else key
+            for key in getattr(settings, 'BACKREST_ENCRYPTION_KEYS', []) if key]
+    # Only create the key file when nothing else is configured
+    file_key = _read_key_file(create=not keys)
+    if file_key and file_key not in keys:
+        keys.append(file_key)
+    return keys
+
+
+def get_cipher():
+    """The process-wide MultiFernet, built on first use"""
+    global _cipher, _primary
+    if _cipher is None:
+        with _cipher_lock:
+            if _cipher is None:
+                keys = load_keys()
+                _primary = Fernet(keys[0])
+                _cipher = MultiFernet([Fernet(key) for key in keys])
+    return _cipher
+
+
+def primary_key_cipher():
+    """Fernet for the newest key only"""
+    get_cipher()
+    return _primary
+
+
+def reset_cipher():
+    """Forget the cached cipher and decrypted values, e.g. after changing keys"""
+    global _cipher, _primary
+    with _cipher_lock:
+        _cipher = None
+        _primary = None
+    clear_secret_cache()
+
+
+def clear_secret_cache():
+    with _secret_cache_lock:
+        _secret_cache.clear()
+
+
+def _cache_get(token):
+    ttl = getattr(settings, 'BACKREST_SECRET_CACHE_TTL', 300)
+    with _secret_cache_lock:
+        entry = _secret_cache.get(token)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at > ttl:
+            del _secret_cache[token]
+            return None
+        _secret_cache.move_to_end(token)
+        return value
+
+
+def _cache_put(token, value):
+    size = getattr(settings, 'BACKREST_SECRET_CACHE_SIZE', 256)
+    if size <= 0:
+        return
+    with _secret_cache_lock:
+        _secret_cache[token] = (value, time.monotonic())
+        _secret_cache.move_to_end(token)
+        while len(_secret_cache) > size:
+            _secret_cache.popitem(last=False)
+
+
+def encrypt_value(value):
+    """Encrypt a string with the newest key"""
+    if not value:
+        return value
+    token = get_cipher().encrypt(value.encode()).decode()
+    _cache_put(token, value)
+    return token
+
+
+def decrypt_value(value):
+    """Decrypt a string encrypted with any configured key; raises InvalidToken otherwise"""
+    if not value:
+        return value
+    cached = _cache_get(value)
+    if cached is not None:
+        return cached
+    decrypted = get_cipher().decrypt(value.encode()).decode()
+    _cache_put(value, decrypted)
+    return decrypted
+
+
+def is_current(value):
+    """Whether `value` is already encrypted with the newest key"""
+    try:
+        primary_key_cipher().decrypt(value.encode())
+        return True
+    except InvalidToken:
+        return False
+
+
+def rotate_value(value):
+    """Re-encrypt `value` under the newest key, keeping its plaintext"""
+    return get_cipher().rotate(value.encode()).decode()
@@ -0,0 +1,218 @@
+# backend/backrest/events.py
+"""
+Subscriber for Backrest's streaming GetOperationEvents RPC.
+
+Backrest pushes an event whenever an operation is created, updated or
+deleted. OperationEventSubscriber keeps one long-lived connect-protocol
+stream open per server and applies each event as an incremental upsert,
+instead of re-listing the repository's operations. The stream has no
+resume token, so after every (re)connect we run one incremental list call
+per repository to pick up anything that changed while we were away.
+
+Run it with `python manage.py subscribe_operation_events`.
+"""
+import json
+import logging
+import struct
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+EVENTS_ENDPOINT = "/v1.Backrest/GetOperationEvents"
+
+# Connect protocol envelope flags
+FLAG_COMPRESSED = 0x01
+FLAG_END_STREAM = 0x02
+
+
+def encode_envelope(message):
+    """Wrap a JSON message in a connect streaming envelope"""
+    payload = json.dumps(message).encode('utf-8')
+    return struct.pack('>BI', 0, len(payload)) + payload
+
+
+def iter_envelopes(chunks):
+    """Yield (flags, payload bytes) for each envelope in a stream of byte chunks"""
+    buffer = b''
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= 5:
+            flags, length = struct.unpack('>BI', buffer[:5])
+            if len(buffer) < 5 + length:
+                break
+            yield flags, buffer[5:5 + length]
+            buffer = buffer[5 + length:]
+
+
+def split_event(event):
+    """
+    Return (changed operations, deleted operation ids) for one OperationEvent.
+
+    Handles both the batched format (createdOperations / updatedOperations /
+    deletedOperations) and the older single-operation {type, operation} one.
+    """
+    changed = []
+    deleted = []
+
+    for key in ('createdOperations', 'updatedOperations'):
+        changed.extend((event.get(key) or {}).get('operations', []))
+    deleted.extend(str(op_id) for op_id in (event.get('deletedOperations') or {}).get('values', []))
+
+    if event.get('operation'):
+        if event.get('type') == 'EVENT_DELETED':
+            deleted.append(str(event['operation'].get('id')))
+        else:
+            changed.append(event['operation'])
+
+    # OperationUpserter maps Backrest's camelCase fields itself
+    return changed, deleted
+
+
+class OperationEventSubscriber:
+    """Long-lived GetOperationEvents stream for one server"""
+
+    def __init__(self, tenant, server, stop_event=None):
+        self.tenant = tenant
+        self.server = server
+        self.base_url = f"http://{server.hostname}:{server.backrest_port}"
+        self.stop_event = stop_event or threading.Event()
+        self.read_timeout = getattr(settings, 'BACKREST_EVENTS_READ_TIMEOUT', 120)
+        self.max_backoff = getattr(settings, 'BACKREST_EVENTS_MAX_BACKOFF', 60)
+        # Own session - the stream holds its connection for as long as it is open
+        self._session = requests.Session()
+
+    def _repositories(self):
+        from .models import BackrestRepository
+        return {
+            repo.repository_id: repo
+            for repo in BackrestRepository.objects.filter(server=self.server).select_related('server')
+        }
+
+    def catch_up(self):
+        """One incremental list call per repository, for events missed while disconnected"""
+        from .async_service import fan_out
+        from .sync import (
+            OperationUpserter, PlanResolver, advance_operation_cursor, changed_operations,
+            fetch_repo_operations,
+        )
+
+        repos = list(self._repositories().values())
+        remote_operations = fan_out(
+            (repo.id, repo.server, lambda service, repo=repo: fetch_repo_operations(service, repo))
+            for repo in repos
+        )
+        plan_resolver = PlanResolver(self.tenant)
+        for repo in repos:
+            backrest_ops = remote_operations[repo.id]
+            if isinstance(backrest_ops, Exception):
+                logger.error(f"Catch-up for repo {repo.name} failed: {str(backrest_ops)}")
+                continue
+            changed_ops = changed_operations(repo, backrest_ops)
+            OperationUpserter(self.tenant, repo, plan_resolver=plan_resolver).upsert(changed_ops)
+            advance_operation_cursor(repo, backrest_ops)
+
+    def apply_event(self, event, repos, plan_resolver):
+        """Apply one decoded OperationEvent to the database"""
+        from .models import BackrestOperation
+        from .sync import OperationUpserter, advance_operation_cursor
+
+        changed, deleted = split_event(event)
+
+        by_repo = {}
+        for op_data in changed:
+            repo = repos.get(op_data.get('repoId'))
+            if repo is None:
+                # A repo created after we connected
+                repos.update(self._repositories())
+                repo = repos.get(op_data.get('repoId'))
+            if repo is None:
+                logger.debug(f"Ignoring event for unknown repo {op_data.get('repoId')!r}")
+                continue
+            by_repo.setdefault(repo.repository_id, []).append(op_data)
+
+        for repository_id, ops in by_repo.items():
+            repo = repos[repository_id]
+            OperationUpserter(self.tenant, repo, plan_resolver=plan_resolver).upsert(ops)
+            advance_operation_cursor(repo, ops)
+
+        if deleted:
+            BackrestOperation.objects.filter(
+                repository__server=self.server, operation_id__in=deleted
+            ).delete()
+
+    def _open_stream(self):
+        """Open the event stream, returning the streaming response"""
+        url = f"{self.base_url}{EVENTS_ENDPOINT}"
+        response = self._session.post(
+            url,
+            data=encode_envelope({}),
+            headers={
+                'Content-Type': 'application/connect+json',
+                'Connect-Protocol-Version': '1',
+            },
+            stream=True,
+            timeout=(10, self.read_timeout),
+        )
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        return response
+
+    def _events(self, response):
+        """Yield decoded events from an open stream until it ends"""
+        for flags, payload in iter_envelopes(response.iter_content(chunk_size=None)):
+            if flags & FLAG_COMPRESSED:
+                raise Exception("Compressed event envelopes are not supported")
+            message = json.loads(payload or b'{}')
+            if flags & FLAG_END_STREAM:
+                if message.get('error'):
+                    raise Exception(f"Event stream ended with error: {message['error']}")
+                return
+            yield message
+
+    def run_once(self):
+        """Connect, catch up and apply events until the stream drops"""
+        from .sync import PlanResolver
+
+        response = self._open_stream()
+        try:
+            # The stream is already open, so events that happen during the
+            # catch-up list call are buffered rather than lost
+            self.catch_up()
+
+            repos = self._repositories()
+            plan_resolver = PlanResolver(self.tenant)
+            for event in self._events(response):
+                if self.stop_event.is_set():
+                    return
+                self.apply_event(event, repos, plan_resolver)
+        finally:
+            response.close()
+
+    def run(self):
+        """Keep the subscription alive, reconnecting with backoff"""
+        backoff = 1
+        while not self.stop_event.is_set():
+            connected_at = time.monotonic()
+            try:
+                close_old_connections()
+                logger.info(f"Subscribing to operation events on {self.server.hostname}")
+                self.run_once()
+                logger.info(f"Operation event stream from {self.server.hostname} ended, reconnecting")
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"Operation event stream from {self.server.hostname} dropped: {str(e)}")
+            except Exception as e:
+                logger.exception(f"Error in operation event subscriber for {self.server.hostname}: {str(e)}")
+
+            # A stream that stayed up for a while resets the backoff
+            if time.monotonic() - connected_at > self.max_backoff:
+                backoff = 1
+            self.stop_event.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
@@ -0,0 +1,198 @@
+# backend/backrest/hooks.py
+"""
+Push-based operation updates from Backrest.
+
+Plans and repositories created through BackrestService get webhook hooks
+that POST a small JSON document to BackrestHookView whenever a backup,
+prune, check or forget starts, succeeds or fails. The view authenticates
+the call with the server's webhook token and applies the event to the
+matching BackrestOperation straight away, so status no longer waits for
+the next poll.
+
+Backrest's hook context carries no operation id. An event with no operation
+to attach to creates a provisional "hook_*" row. OperationUpserter adopts
+that row under Backrest's real id when the poll brings the operation in
+(see sync.py), so an operation is never listed twice.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PLAN_HOOK_CONDITIONS = [
+    "CONDITION_SNAPSHOT_START",
+    "CONDITION_SNAPSHOT_SUCCESS",
+    "CONDITION_SNAPSHOT_ERROR",
+    "CONDITION_FORGET_START",
+    "CONDITION_FORGET_SUCCESS",
+    "CONDITION_FORGET_ERROR",
+]
+
+REPO_HOOK_CONDITIONS = [
+    "CONDITION_PRUNE_START",
+    "CONDITION_PRUNE_SUCCESS",
+    "CONDITION_PRUNE_ERROR",
+    "CONDITION_CHECK_START",
+    "CONDITION_CHECK_SUCCESS",
+    "CONDITION_CHECK_ERROR",
+]
+
+# Backrest renders this Go template as the webhook body
+HOOK_BODY_TEMPLATE = (
+    '{"event": "{{ .Event }}", '
+    '"plan_id": "{{ with .Plan }}{{ .Id }}{{ end }}", '
+    '"repo_id": "{{ with .Repo }}{{ .Id }}{{ end }}", '
+    '"snapshot_id": "{{ .SnapshotId }}", '
+    '"error": {{ .JsonMarshal .Error }}}'
+)
+
+# Prefix of operations created from hook events before the poll knows their real id
+PROVISIONAL_PREFIX = 'hook_'
+
+# Backrest condition prefix -> our operation type
+_EVENT_TYPES = {
+    'SNAPSHOT': 'backup',
+    'PRUNE': 'prune',
+    'CHECK': 'check',
+    'FORGET': 'forget',
+}
+
+_EVENT_STATUSES = {
+    'START': 'running',
+    'SUCCESS': 'completed',
+    'END': 'completed',
+    'ERROR': 'failed',
+}
+
+
+def hook_url(server):
+    """URL Backrest should POST events for `server` to, or None if it can't be built"""
+    base_url = getattr(settings, 'BACKREST_HOOK_BASE_URL', None)
+    if base_url:
+        domain = server.tenant.get_primary_domain()
+        base_url = base_url.format(domain=domain.domain if domain else '')
+    else:
+        base_url = server.tenant.get_primary_domain_url()
+
+    if not base_url or not server.webhook_token:
+        return None
+    return f"{base_url.rstrip('/')}/api/backrest/hooks/{server.id}/{server.webhook_token}/"
+
+
+def build_hooks(server, conditions):
+    """Backrest hook config entries that report `conditions` to our webhook"""
+    url = hook_url(server)
+    if not url:
+        logger.warning(f"No webhook URL for server {server.hostname}, creating config without hooks")
+        return []
+
+    return [{
+        "conditions": conditions,
+        "onError": "ON_ERROR_IGNORE",
+        "actionWebhook": {
+            "webhookUrl": url,
+            "method": "POST",
+            "template": HOOK_BODY_TEMPLATE,
+        },
+    }]
+
+
+def parse_event(event):
+    """Split a CONDITION_<TYPE>_<PHASE> name into (operation type, status)"""
+    name = (event or '').upper().replace('CONDITION_', '')
+    kind, _, phase = name.rpartition('_')
+    return _EVENT_TYPES.get(kind), _EVENT_STATUSES.get(phase)
+
+
+def apply_hook_event(server, payload):
+    """
+    Apply one hook event to the operations of `server`.
+
+    A start event attaches to the newest open operation of the same type
+    (e.g. the one trigger_backup recorded) or creates one. A finish event
+    closes the newest running operation, creating a finished one if the
+    start was missed. Returns the operation, or None for events we ignore.
+    """
+    from .models import BackrestOperation, BackrestPlan, BackrestRepository
+
+    op_type, status = parse_event(payload.get('event'))
+    if not op_type or not status:
+        logger.info(f"Ignoring Backrest hook event {payload.get('event')!r} from {server.hostname}")
+        return None
+
+    plan = None
+    if payload.get('plan_id'):
+        plan = BackrestPlan.objects.filter(
+            plan_id=payload['plan_id'], repository__server=server
+        ).select_related('repository').first()
+
+    if plan:
+        repository = plan.repository
+    else:
+        repository = BackrestRepository.objects.filter(
+            server=server, repository_id=payload.get('repo_id')
+        ).first()
+    if repository is None:
+        logger.warning(f"Hook event from {server.hostname} for unknown repo {payload.get('repo_id')!r}")
+        return None
+
+    now = timezone.now()
+    open_ops = BackrestOperation.objects.filter(
+        repository=repository,
+        operation_type=op_type,
+        status='running',
+        completed_at__isnull=True,
+    )
+    if plan:
+        open_ops = open_ops.filter(plan=plan)
+    operation = open_ops.order_by('-started_at').first()
+
+    if operation is None and status != 'running':
+        # The poll may already have closed the operation this event finishes
+        window = timedelta(seconds=getattr(settings, 'BACKREST_HOOK_MATCH_WINDOW', 600))
+        recent_ops = BackrestOperation.objects.filter(
+            repository=repository,
+            operation_type=op_type,
+            completed_at__gte=now - window,
+        )
+        if plan:
+            recent_ops = recent_ops.filter(plan=plan)
+        operation = recent_ops.order_by('-completed_at').first()
+        if operation is not None:
+            update_fields = []
+            if payload.get('snapshot_id') and not operation.snapshot_id:
+                operation.snapshot_id = payload['snapshot_id']
+                update_fields.append('snapshot_id')
+            if status == 'failed' and payload.get('error') and not operation.error:
+                operation.error = payload['error']
+                update_fields.append('error')
+            if update_fields:
+                operation.save(update_fields=update_fields)
+            return operation
+
+    if operation is None:
+        source = plan.plan_id if plan else repository.repository_id
+        operation = BackrestOperation(
+            tenant_id=repository.tenant_id,
+            repository=repository,
+            plan=plan,
+            operation_id=f"{PROVISIONAL_PREFIX}{source}_{int(time.time() * 1000)}",
+            operation_type=op_type,
+            started_at=now,
+        )
+
+    operation.status = status
+    if status != 'running':
+        operation.completed_at = now
+    if payload.get('snapshot_id'):
+        operation.snapshot_id = payload['snapshot_id']
+    if status == 'failed' and payload.get('error'):
+        operation.error = payload['error']
+    operation.save()
+
+    logger.info(f"Hook event {payload.get('event')} from {server.hostname} set {operation.operation_id} to {status}")
+    return operation
@@ -0,0 +1,131 @@
+# backend/backrest/http_pool.py
+"""
+Per-process pool of keep-alive HTTP sessions for talking to Backrest servers.
+
+Both BackrestService and BackrestClient go through `request()` so that
+repeated RPCs to the same server reuse an open TCP connection instead of
+doing a fresh connect for every call.
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from .instrumentation import record_http_call
+
+logger = logging.getLogger(__name__)
+
+# Read-only RPCs that are safe to retry after a dropped connection or a
+# transient server error
+IDEMPOTENT_RPCS = {
+    'GetConfig',
+    'GetOperations',
+    'GetOperation',
+    'ListSnapshots',
+    'GetSnapshots',
+    'GetVersion',
+    'GetRepos',
+    'GetPlans',
+}
+
+RETRY_STATUS_CODES = {502, 503, 504}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_sessions_pid = os.getpid()
+
+
+def _get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _server_key(url):
+    """Pool key for a URL - one session per scheme://host:port"""
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+def _build_session():
+    pool_size = _get_setting('BACKREST_HTTP_POOL_SIZE', 10)
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=0,  # Retries are handled in request() so we can tell RPCs apart
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+
+def get_session(url):
+    """Get the shared session for the server that `url` points to"""
+    global _sessions_pid
+
+    key = _server_key(url)
+    with _sessions_lock:
+        # Sockets must not be shared with a forked child (e.g. celery prefork workers)
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+
+        session = _sessions.get(key)
+        if session is None:
+            session = _build_session()
+            _sessions[key] = session
+            logger.debug(f"Created pooled HTTP session for {key}")
+        return session
+
+
+def close_sessions():
+    """Close every pooled session in this process"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def is_idempotent_rpc(url):
+    """Whether the RPC at `url` can safely be retried"""
+    rpc_name = urlparse(url).path.rsplit('/', 1)[-1]
+    return rpc_name in IDEMPOTENT_RPCS
+
+
+def request(method, url, idempotent=None, **kwargs):
+    """
+    Send a request through the pooled session for the target server.
+
+    Idempotent RPCs are retried with exponential backoff on connection
+    errors and 502/503/504 responses. Everything else is sent exactly once.
+    """
+    if idempotent is None:
+        idempotent = is_idempotent_rpc(url)
+
+    max_retries = _get_setting('BACKREST_HTTP_MAX_RETRIES', 3) if idempotent else 0
+    backoff_factor = _get_setting('BACKREST_HTTP_BACKOFF_FACTOR', 0.5)
+    session = get_session(url)
+
+    attempt = 0
+    while True:
+        record_http_call()
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+                logger.warning(f"Got HTTP {response.status_code} from {url}, retrying")
+                # Return the connection to the pool before the next attempt
+                response.close()
+            else:
+                return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+            logger.warning(f"Request to {url} failed ({str(e)}), retrying")
+
+        time.sleep(backoff_factor * (2 ** attempt))
+        attempt += 1
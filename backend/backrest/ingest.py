@@ -0,0 +1,83 @@
+# backend/backrest/ingest.py
+"""
+Batch ingestion of Backrest log lines into BackrestLog.
+
+Every entry gets a content hash over (server, timestamp, message). The
+hash is stored in a uniquely indexed column, so a chunk of entries is
+written with one lookup plus one bulk INSERT ... ON CONFLICT DO NOTHING
+instead of a SELECT and an INSERT per line.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def log_content_hash(server_id, timestamp, message):
+    """Stable dedupe key for a log line"""
+    raw = f"{server_id}\x1f{timestamp.isoformat()}\x1f{message or ''}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest_log_entries(tenant, server, entries, chunk_size=None):
+    """
+    Store log entries for a server, skipping ones that are already stored.
+
+    `entries` is an iterable of dicts with timestamp (aware datetime),
+    level, message, logger_name, error and source. Returns the number of
+    new rows written.
+    """
+    from .models import BackrestLog
+
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'BACKREST_LOG_INGEST_CHUNK_SIZE', 2000)
+
+    logs_added = 0
+    for chunk in _chunks(entries, chunk_size):
+        # Hash and dedupe within the chunk first
+        rows = {}
+        for entry in chunk:
+            content_hash = log_content_hash(server.id, entry['timestamp'], entry.get('message'))
+            rows.setdefault(content_hash, entry)
+
+        existing = set(
+            BackrestLog.objects.filter(content_hash__in=list(rows.keys()))
+            .values_list('content_hash', flat=True)
+        )
+
+        new_logs = [
+            BackrestLog(
+                tenant=tenant,
+                server=server,
+                level=entry.get('level') or 'info',
+                message=entry.get('message') or '',
+                logger_name=entry.get('logger_name') or '',
+                error=entry.get('error') or '',
+                timestamp=entry['timestamp'],
+                source=entry.get('source') or '',
+                content_hash=content_hash,
+            )
+            for content_hash, entry in rows.items()
+            if content_hash not in existing
+        ]
+
+        if new_logs:
+            # ignore_conflicts covers rows inserted concurrently by another worker
+            BackrestLog.objects.bulk_create(new_logs, batch_size=chunk_size, ignore_conflicts=True)
+            logs_added += len(new_logs)
+
+    logger.info(f"Ingested {logs_added} new log lines for server {server.hostname}")
+    return logs_added
@@ -0,0 +1,279 @@
+# backend/backrest/instrumentation.py
+"""
+Per-run resource accounting for Celery tasks and DRF requests.
+
+Every task run and request gets a RunStats that counts database queries
+and time, outbound Backrest HTTP calls and SSH commands. When the run ends
+the stats are logged as one structured line, added to the in-process
+metrics served by BackrestMetricsView, and checked against the budgets in
+BACKREST_RUN_BUDGETS. Over-budget runs log a warning, or raise
+BudgetExceeded when BACKREST_BUDGET_MODE is "raise".
+
+Tests pin a code path's cost with assert_within_budget(), which always
+raises. Work handed to thread pools must be submitted with
+contextvars.copy_context().run so the workers count against the run that
+started them.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('backrest_run_stats', default=None)
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+# Worker threads of one run may record HTTP calls and SSH commands concurrently
+_counter_lock = threading.Lock()
+
+COUNTERS = ('queries', 'db_time_ms', 'http_calls', 'ssh_commands')
+
+
+class BudgetExceeded(Exception):
+    """A task run or request went over its configured resource budget"""
+
+
+class RunStats:
+    """Resource counters for one task run or request"""
+
+    def __init__(self, kind, name, tenant=None):
+        self.kind = kind
+        self.name = name
+        self.tenant = tenant
+        self.queries = 0
+        self.db_time_ms = 0.0
+        self.http_calls = 0
+        self.ssh_commands = 0
+        # schema name -> [queries, db time ms], so multi-tenant tasks can be broken down
+        self.by_schema = {}
+        self.started = time.monotonic()
+        self.duration_ms = 0.0
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'tenant': self.tenant,
+            'queries': self.queries,
+            'db_time_ms': round(self.db_time_ms, 2),
+            'http_calls': self.http_calls,
+            'ssh_commands': self.ssh_commands,
+            'duration_ms': round(self.duration_ms, 2),
+            'by_schema': {
+                schema: {'queries': queries, 'db_time_ms': round(db_time, 2)}
+                for schema, (queries, db_time) in self.by_schema.items()
+            },
+        }
+
+
+def current_stats():
+    """The RunStats of the task or request being executed, if any"""
+    return _current.get()
+
+
+def record_http_call():
+    stats = _current.get()
+    if stats is not None:
+        with _counter_lock:
+            stats.http_calls += 1
+
+
+def record_ssh_command():
+    stats = _current.get()
+    if stats is not None:
+        with _counter_lock:
+            stats.ssh_commands += 1
+
+
+def _query_counter(execute, sql, params, many, context):
+    stats = _current.get()
+    # django-tenants sets the search path ahead of queries; that's connection upkeep, not a query
+    if stats is None or (isinstance(sql, str) and sql.startswith('SET search_path')):
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        stats.queries += 1
+        stats.db_time_ms += elapsed
+        schema = stats.by_schema.setdefault(getattr(context['connection'], 'schema_name', None) or 'public', [0, 0.0])
+        schema[0] += 1
+        schema[1] += elapsed
+
+
+def get_budget(name):
+    """Budget dict for a task/view name, falling back to the 'default' entry"""
+    budgets = getattr(settings, 'BACKREST_RUN_BUDGETS', {})
+    budget = dict(budgets.get('default', {}))
+    budget.update(budgets.get(name, {}))
+    return budget
+
+
+def check_budget(stats, budget=None):
+    """Return a list of "<counter> <value> > <limit>" strings for exceeded limits"""
+    if budget is None:
+        budget = get_budget(stats.name)
+    violations = []
+    for counter, limit in budget.items():
+        value = getattr(stats, counter, None)
+        if value is not None and limit is not None and value > limit:
+            violations.append(f"{counter} {round(value, 2)} > {limit}")
+    return violations
+
+
+def _record_metrics(stats, violations):
+    with _metrics_lock:
+        entry = _metrics.setdefault(stats.name, {
+            'kind': stats.kind,
+            'runs': 0,
+            'over_budget': 0,
+            'totals': {counter: 0 for counter in COUNTERS},
+            'max': {counter: 0 for counter in COUNTERS},
+            'by_tenant': {},
+        })
+        entry['runs'] += 1
+        if violations:
+            entry['over_budget'] += 1
+        for counter in COUNTERS:
+            value = getattr(stats, counter)
+            entry['totals'][counter] += value
+            entry['max'][counter] = max(entry['max'][counter], value)
+        for schema, (queries, db_time) in stats.by_schema.items():
+            tenant_entry = entry['by_tenant'].setdefault(schema, {'runs': 0, 'queries': 0, 'db_time_ms': 0})
+            tenant_entry['runs'] += 1
+            tenant_entry['queries'] += queries
+            tenant_entry['db_time_ms'] += db_time
+
+
+def get_metrics():
+    """Snapshot of the aggregated metrics of this process"""
+    with _metrics_lock:
+        return json.loads(json.dumps(_metrics))
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def start_run(kind, name, tenant=None):
+    """Begin accounting for a run; returns a token for finish_run"""
+    stats = RunStats(kind, name, tenant)
+    wrapper = connection.execute_wrapper(_query_counter)
+    wrapper.__enter__()
+    return stats, _current.set(stats), wrapper
+
+
+def finish_run(token, raise_on_violation=True):
+    """Stop accounting, log and record the run, and enforce its budget"""
+    stats, context_token, wrapper = token
+    wrapper.__exit__(None, None, None)
+    _current.reset(context_token)
+    stats.duration_ms = (time.monotonic() - stats.started) * 1000
+
+    violations = check_budget(stats)
+    _record_metrics(stats, violations)
+
+    data = stats.as_dict()
+    if violations:
+        data['over_budget'] = violations
+        logger.warning(f"run_stats {json.dumps(data)}")
+        if raise_on_violation and getattr(settings, 'BACKREST_BUDGET_MODE', 'warn') == 'raise':
+            raise BudgetExceeded(f"{stats.kind} {stats.name} exceeded its budget: {', '.join(violations)}")
+    else:
+        logger.info(f"run_stats {json.dumps(data)}")
+    return stats
+
+
+@contextmanager
+def instrument(name, kind='block', tenant=None):
+    """Account for everything done inside the block, e.g. in a test"""
+    token = start_run(kind, name, tenant)
+    try:
+        yield token[0]
+    finally:
+        finish_run(token)
+
+
+@contextmanager
+def assert_within_budget(name='block', **limits):
+    """
+    Raise BudgetExceeded if the block goes over `limits`, e.g.
+
+        with assert_within_budget(queries=12, http_calls=0):
+            ...
+
+    Without limits, the configured budget of `name` applies. Unlike the
+    task and request hooks, this raises whatever BACKREST_BUDGET_MODE is.
+    """
+    token = start_run('assert', name)
+    stats = token[0]
+    try:
+        yield stats
+    finally:
+        wrapper = token[2]
+        wrapper.__exit__(None, None, None)
+        _current.reset(token[1])
+        stats.duration_ms = (time.monotonic() - stats.started) * 1000
+
+    violations = check_budget(stats, limits or get_budget(name))
+    if violations:
+        raise BudgetExceeded(f"{name} exceeded its budget: {', '.join(violations)}")
+
+
+class InstrumentationMiddleware:
+    """Account queries, HTTP calls and SSH commands per request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tenant = getattr(getattr(request, 'tenant', None), 'schema_name', None)
+        token = start_run('request', request.path, tenant)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            # Aggregate by route rather than by concrete URL
+            match = getattr(request, 'resolver_match', None)
+            if match is not None and match.route:
+                token[0].name = f"{request.method} {match.route}"
+            else:
+                token[0].name = f"{request.method} {request.path}"
+            finish_run(token, raise_on_violation=response is not None)
+
+
+# Celery hooks - one RunStats per task execution
+_task_tokens = {}
+
+
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    _task_tokens[task_id] = start_run('task', task.name)
+
+
+def _on_task_postrun(task_id=None, task=None, **kwargs):
+    token = _task_tokens.pop(task_id, None)
+    if token is not None:
+        try:
+            finish_run(token)
+        except BudgetExceeded as e:
+            # The task already finished; the budget breach is reported, not raised
+            logger.error(str(e))
+
+
+def connect_celery_signals():
+    from celery.signals import task_prerun, task_postrun
+
+    task_prerun.connect(_on_task_prerun, weak=False, dispatch_uid='backrest-instrumentation-prerun')
+    task_postrun.connect(_on_task_postrun, weak=False, dispatch_uid='backrest-instrumentation-postrun')
@@ -0,0 +1,260 @@
+# backend/backrest/listing.py
+"""
+Keyset pagination and sparse fieldsets for list endpoints.
+
+Both are opt-in so existing clients keep getting plain lists:
+
+    ?page_size=50              first page, as {"next", "previous", "results"}
+    ?cursor=<opaque>           the page a previous response linked to
+    ?fields=id,status,plan     only serialize these fields
+
+Pages are keyed on (sort value, id) of the last row seen rather than an
+OFFSET, so fetching page 500 costs the same as page 1 and rows inserted
+while a client pages through never shift or repeat entries. A view lists
+its key in `cursor_ordering`, e.g. ('-timestamp', '-id').
+
+Requested fields also drive the query: relations behind dotted serializer
+sources (`server.name`) are select_related up front, and when every
+requested field maps to a column the SELECT is narrowed with only().
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+FIELDS_QUERY_PARAM = 'fields'
+
+
+def requested_fields(request):
+    """Field names from ?fields=, or None when the client wants every field"""
+    if request is None or request.method != 'GET':
+        return None
+    raw = request.query_params.get(FIELDS_QUERY_PARAM)
+    if not raw:
+        return None
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    return fields or None
+
+
+class SparseFieldsMixin:
+    """Serializer mixin that drops the fields a GET request didn't ask for"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def optimize_for_serializer(queryset, serializer, extra_columns=()):
+    """
+    select_related the relations the serializer reads through dotted
+    sources, and narrow the SELECT with only() when every serialized field
+    is backed by a column. `extra_columns` are always kept loaded.
+    """
+    relations = set()
+    columns = {'pk', *extra_columns}
+    narrow = True
+
+    for field in serializer.fields.values():
+        attrs = getattr(field, 'source_attrs', None)
+        if not attrs or field.source == '*':
+            narrow = False
+            continue
+
+        model = queryset.model
+        for index, attr in enumerate(attrs):
+            model_field = _model_field(model, attr)
+            if model_field is None:
+                # A property, method or annotation - we can't know which columns it reads
+                narrow = False
+                break
+            path = '__'.join(attrs[:index + 1])
+            columns.add(path)
+            if index == len(attrs) - 1:
+                break
+            if model_field.auto_created or not (model_field.many_to_one or model_field.one_to_one):
+                narrow = False
+                break
+            relations.add(path)
+            model = model_field.related_model
+
+    if relations:
+        queryset = queryset.select_related(*relations)
+    if narrow:
+        queryset = queryset.only(*columns)
+    return queryset
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (sort value, id).
+
+    Only paginates when the request passes `cursor` or `page_size`, so
+    unpaginated clients keep their plain list responses.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def is_requested(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'BACKREST_PAGE_SIZE', 100)
+        maximum = getattr(settings, 'BACKREST_MAX_PAGE_SIZE', 1000)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, maximum))
+
+    # Cursor encoding
+
+    def encode_cursor(self, value, pk, reverse):
+        if isinstance(value, datetime):
+            value = {'t': value.isoformat()}
+        data = json.dumps({'v': value, 'id': pk, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(raw.encode('ascii')).decode('utf-8'))
+            value = data['v']
+            if isinstance(value, dict):
+                value = parse_datetime(value['t'])
+            return value, data['id'], bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error, UnicodeError):
+            raise NotFound("Invalid cursor")
+
+    # Paging
+
+    def _keyset_filter(self, field, descending, value, pk):
+        """Rows strictly after (value, pk) in the given direction"""
+        if descending:
+            return Q(**{f"{field}__lt": value}) | Q(**{field: value, 'id__lt': pk})
+        return Q(**{f"{field}__gt": value}) | Q(**{field: value, 'id__gt': pk})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        ordering = view.get_cursor_ordering() if hasattr(view, 'get_cursor_ordering') else ('-id',)
+        self.sort_field = ordering[0].lstrip('-')
+        descending = ordering[0].startswith('-')
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+        # Walking backwards is walking forwards over the inverted ordering
+        walk_descending = descending != reverse
+
+        if self.sort_field == 'id':
+            order_by = ['-id' if walk_descending else 'id']
+        else:
+            direction = '-' if walk_descending else ''
+            order_by = [f"{direction}{self.sort_field}", f"{direction}id"]
+        queryset = queryset.order_by(*order_by)
+
+        if cursor:
+            value, pk, _ = cursor
+            if self.sort_field == 'id':
+                queryset = queryset.filter(**{'id__lt' if walk_descending else 'id__gt': pk})
+            else:
+                queryset = queryset.filter(self._keyset_filter(self.sort_field, walk_descending, value, pk))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Links: there is always a way back once we've moved, and forward when rows remain
+        self.has_next = has_more if not reverse else bool(cursor)
+        self.has_previous = bool(cursor) if not reverse else has_more
+        self.rows = rows
+        return rows
+
+    def _cursor_for(self, row, reverse):
+        value = getattr(row, self.sort_field)
+        return self.encode_cursor(value, row.pk, reverse)
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self._cursor_for(self.rows[-1], False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.rows:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self._cursor_for(self.rows[0], True))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class SparseFieldsViewMixin:
+    """
+    View mixin that pairs KeysetPagination with ?fields= sparse fieldsets.
+
+    Views set `cursor_ordering` (a sort column followed by id) and pass
+    their queryset through self.optimize_queryset() at the end of
+    get_queryset.
+    """
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-id',)
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def optimize_queryset(self, queryset):
+        # The cursor reads the sort column of the last row, so keep it loaded
+        sort_columns = [
+            name.lstrip('-') for name in self.get_cursor_ordering()
+            if _model_field(queryset.model, name.lstrip('-')) is not None
+        ]
+        return optimize_for_serializer(queryset, self.get_serializer(), extra_columns=sort_columns)
@@ -0,0 +1,59 @@
+# backend/backrest/locks.py
+import logging
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Delete the key only if it still holds our token, in one round trip
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _release(lock_key, token):
+    """Release a lock we own with an atomic compare-and-delete"""
+    client = getattr(cache, 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        # Caches without Redis (e.g. locmem in tests) have no scripting
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+        return
+
+    client.get_client(write=True).eval(
+        RELEASE_SCRIPT, 1, client.make_key(lock_key), client.encode(token)
+    )
+
+
+@contextmanager
+def single_flight(key, timeout=300):
+    """
+    Hold a cache-backed lock for the duration of the block.
+
+    Yields True if the lock was acquired and False if another worker
+    already holds it. The lock expires after `timeout` seconds so a
+    crashed worker cannot block the key forever.
+    """
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    acquired = cache.add(lock_key, token, timeout)
+
+    if not acquired:
+        logger.info(f"Lock {lock_key} is already held, skipping")
+
+    try:
+        yield acquired
+    finally:
+        # Only release a lock we still own - it may have expired and been
+        # taken over by another worker in the meantime
+        if acquired:
+            try:
+                _release(lock_key, token)
+            except Exception as e:
+                # The lock still expires after `timeout`
+                logger.warning(f"Could not release lock {lock_key}: {e}")
@@ -0,0 +1,124 @@
+# backend/backrest/logtail.py
+"""
+Incremental reader for Backrest's JSON process log.
+
+Each (server, path, consumer) has a BackrestLogCursor holding the file's
+inode, the byte offset of the next unread line and the newest timestamp
+seen. A poll fetches only the bytes after that offset. It falls back to
+re-reading the file from the start when the file was rotated or
+truncated, skipping entries that were already seen.
+"""
+import json
+import logging
+import shlex
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BACKREST_LOG_PATH = "/opt/backrest/data/processlogs/backrest.log"
+
+
+def _tail_command(path, inode, offset, max_bytes):
+    """
+    Shell snippet that prints "<inode> <size>" followed by the unread bytes.
+
+    If the inode still matches and the file has not shrunk below the offset
+    we continue from the offset. After a rotation or truncation we read
+    from the start. A new cursor (offset < 0) starts at the last
+    `max_bytes` of the file.
+    """
+    quoted = shlex.quote(path)
+    return (
+        f"s=$(stat -Lc '%i %s' {quoted}) || exit 1; set -- $s; echo \"$1 $2\"; "
+        f"if [ {offset} -lt 0 ]; then tail -c {max_bytes} {quoted}; "
+        f"elif [ \"$1\" = \"{inode or ''}\" ] && [ \"$2\" -ge {offset} ]; then "
+        f"tail -c +{offset + 1} {quoted} | head -c {max_bytes}; "
+        f"else head -c {max_bytes} {quoted}; fi"
+    )
+
+
+def _entry_time(entry):
+    ts = entry.get('ts')
+    if isinstance(ts, (int, float)):
+        return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+    return None
+
+
+def read_new_entries(server, client, consumer, path=BACKREST_LOG_PATH, max_bytes=None):
+    """
+    Return the JSON log entries appended to `path` since the consumer's last poll.
+
+    `client` is a connected SSHClient (normally from ssh_pool). The cursor
+    only advances past complete lines, so a line still being written is
+    picked up whole on the next poll.
+    """
+    from .models import BackrestLogCursor
+
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'BACKREST_LOG_TAIL_MAX_BYTES', 1024 * 1024)
+
+    cursor, created = BackrestLogCursor.objects.get_or_create(
+        server=server,
+        path=path,
+        consumer=consumer,
+        defaults={'tenant_id': server.tenant_id, 'offset': -1},
+    )
+
+    cmd = _tail_command(path, cursor.inode, cursor.offset, max_bytes)
+    stdin, stdout, stderr = client.exec_command(cmd)
+    raw = stdout.read()
+
+    header, _, data = raw.partition(b'\n')
+    try:
+        inode, size = (int(part) for part in header.split())
+    except ValueError:
+        logger.warning(f"Could not stat {path} on {server.hostname}: {stderr.read().decode('utf-8', 'replace')[:200]}")
+        return []
+
+    # Work out where the returned bytes start in the file
+    resync = False
+    if cursor.offset < 0:
+        start = max(size - max_bytes, 0)
+        if start > 0:
+            # We started mid-line - drop the partial first line
+            skipped, _, data = data.partition(b'\n')
+            start += len(skipped) + 1
+    elif cursor.inode == inode and size >= cursor.offset:
+        start = cursor.offset
+    else:
+        logger.info(f"{path} on {server.hostname} was rotated or truncated, resyncing from the start")
+        start = 0
+        resync = True
+
+    # Only consume complete lines
+    end = data.rfind(b'\n')
+    complete = data[:end + 1] if end >= 0 else b''
+
+    entries = []
+    newest = cursor.last_timestamp
+    for line in complete.decode('utf-8', errors='replace').splitlines():
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            logger.debug(f"Could not parse log line: {line[:100]}...")
+            continue
+
+        entry_time = _entry_time(entry)
+        # After a resync the start of the file may hold entries we already saw
+        if resync and entry_time and cursor.last_timestamp and entry_time <= cursor.last_timestamp:
+            continue
+        if entry_time and (newest is None or entry_time > newest):
+            newest = entry_time
+        entries.append(entry)
+
+    cursor.inode = inode
+    cursor.offset = start + len(complete)
+    cursor.last_timestamp = newest
+    cursor.save(update_fields=['inode', 'offset', 'last_timestamp', 'updated_at'])
+
+    logger.info(f"Read {len(entries)} new entries ({len(complete)} bytes) from {path} on {server.hostname}")
+    return entries
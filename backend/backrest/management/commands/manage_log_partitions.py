@@ -0,0 +1,46 @@
+# backend/backrest/management/commands/manage_log_partitions.py
+from django.core.management.base import BaseCommand
+from django_tenants.utils import tenant_context
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly BackrestLog partitions and drop those past each tenant's log retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help="Only manage the partitions of this tenant schema")
+        parser.add_argument('--months-ahead', type=int, default=None,
+                            help="Months to create ahead of the current one (default BACKREST_LOG_PARTITIONS_AHEAD)")
+        parser.add_argument('--no-retention', action='store_true',
+                            help="Only create partitions, don't drop expired ones")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="List the partitions that would be dropped without changing anything")
+
+    def handle(self, *args, **options):
+        from tenants.models import Tenant
+        from backrest.partitions import (
+            drop_expired_log_partitions, list_log_partitions, maintain_log_partitions,
+        )
+
+        tenants = Tenant.objects.exclude(schema_name='public')
+        if options.get('tenant'):
+            tenants = tenants.filter(schema_name=options['tenant'])
+
+        for tenant in tenants:
+            with tenant_context(tenant):
+                if options['dry_run']:
+                    expired = drop_expired_log_partitions(tenant.log_retention_days, dry_run=True)
+                    self.stdout.write(
+                        f"{tenant.schema_name}: {len(list_log_partitions())} partitions, "
+                        f"would drop {', '.join(expired) or 'none'}"
+                    )
+                    continue
+
+                result = maintain_log_partitions(
+                    tenant,
+                    months_ahead=options['months_ahead'],
+                    apply_retention=not options['no_retention'],
+                )
+                self.stdout.write(
+                    f"{tenant.schema_name}: created {', '.join(result['created']) or 'none'}, "
+                    f"dropped {', '.join(result['dropped']) or 'none'}"
+                )
@@ -0,0 +1,77 @@
+# backend/backrest/management/commands/reencrypt_secrets.py
+from cryptography.fernet import InvalidToken
+from django.core.management.base import BaseCommand
+from django_tenants.utils import tenant_context
+
+# (model name, encrypted field)
+ENCRYPTED_FIELDS = [
+    ('SSHKey', 'private_key'),
+    ('BackrestRepository', 'password'),
+]
+
+
+class Command(BaseCommand):
+    help = "Re-encrypt SSH private keys and repository passwords with the newest key in BACKREST_ENCRYPTION_KEYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help="Only re-encrypt the secrets of this tenant schema")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Rows read and written per chunk")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Count the rows that would be re-encrypted without writing")
+
+    def _reencrypt(self, model, field, batch_size, dry_run):
+        """Stream through the table in id order, rotating values not yet under the newest key"""
+        from backrest import crypto
+
+        counts = {'rotated': 0, 'current': 0, 'failed': 0}
+        last_id = 0
+        while True:
+            rows = list(
+                model.objects.filter(id__gt=last_id).order_by('id').only('id', field)[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            changed = []
+            for row in rows:
+                value = getattr(row, field)
+                if not value or crypto.is_current(value):
+                    counts['current'] += 1
+                    continue
+                try:
+                    setattr(row, field, crypto.rotate_value(value))
+                except InvalidToken:
+                    # Stored unencrypted, or under a key that is no longer configured
+                    counts['failed'] += 1
+                    self.stderr.write(f"  {model.__name__} {row.id}: {field} cannot be decrypted with any configured key")
+                    continue
+                changed.append(row)
+
+            if changed and not dry_run:
+                model.objects.bulk_update(changed, [field])
+            counts['rotated'] += len(changed)
+        return counts
+
+    def handle(self, *args, **options):
+        from django.apps import apps
+        from tenants.models import Tenant
+        from backrest import crypto
+
+        crypto.reset_cipher()
+
+        tenants = Tenant.objects.exclude(schema_name='public')
+        if options.get('tenant'):
+            tenants = tenants.filter(schema_name=options['tenant'])
+
+        for tenant in tenants:
+            with tenant_context(tenant):
+                for model_name, field in ENCRYPTED_FIELDS:
+                    model = apps.get_model('backrest', model_name)
+                    counts = self._reencrypt(model, field, options['batch_size'], options['dry_run'])
+                    verb = "would rotate" if options['dry_run'] else "rotated"
+                    self.stdout.write(
+                        f"{tenant.schema_name} {model_name}.{field}: {verb} {counts['rotated']}, "
+                        f"already current {counts['current']}, failed {counts['failed']}"
+                    )
@@ -0,0 +1,70 @@
+# backend/backrest/management/commands/subscribe_operation_events.py
+import logging
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django_tenants.utils import tenant_context
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Keep a GetOperationEvents stream open to every Backrest server and apply events as they arrive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help="Only subscribe to servers of this tenant schema")
+        parser.add_argument('--rescan', type=int, default=300,
+                            help="Seconds between checks for newly added servers")
+
+    def _servers(self, schema_name=None):
+        """(tenant, server) pairs for every active tenant's servers"""
+        from tenants.models import Tenant
+        from backrest.models import Server
+
+        tenants = Tenant.objects.filter(is_active=True).exclude(schema_name='public')
+        if schema_name:
+            tenants = tenants.filter(schema_name=schema_name)
+
+        pairs = []
+        for tenant in tenants:
+            with tenant_context(tenant):
+                pairs.extend((tenant, server) for server in Server.objects.all())
+        return pairs
+
+    def _run_subscriber(self, tenant, server, stop_event):
+        from backrest.events import OperationEventSubscriber
+
+        try:
+            with tenant_context(tenant):
+                OperationEventSubscriber(tenant, server, stop_event=stop_event).run()
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+        threads = {}
+
+        try:
+            while not stop_event.is_set():
+                for tenant, server in self._servers(options.get('tenant')):
+                    key = (tenant.schema_name, server.id)
+                    if key in threads and threads[key].is_alive():
+                        continue
+                    thread = threading.Thread(
+                        target=self._run_subscriber,
+                        args=(tenant, server, stop_event),
+                        name=f"backrest-events-{tenant.schema_name}-{server.id}",
+                        daemon=True,
+                    )
+                    thread.start()
+                    threads[key] = thread
+                    self.stdout.write(f"Subscribed to {server.hostname} for tenant {tenant.name}")
+
+                stop_event.wait(options['rescan'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping operation event subscribers")
+        finally:
+            stop_event.set()
+            for thread in threads.values():
+                thread.join(timeout=5)
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0004_backrestinstance'),
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackrestLogCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text='Path of the log file on the server', max_length=1024)),
+                ('consumer', models.CharField(help_text='Task that reads through this cursor', max_length=100)),
+                ('inode', models.BigIntegerField(blank=True, null=True)),
+                ('offset', models.BigIntegerField(default=0, help_text='Byte offset of the next unread line')),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_cursors', to='backrest.server')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backrest_log_cursors', to='tenants.tenant')),
+            ],
+            options={
+                'unique_together': {('server', 'path', 'consumer')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    """Hash existing rows; duplicates of an already-hashed line keep a NULL hash"""
+    BackrestLog = apps.get_model('backrest', 'BackrestLog')
+
+    seen = set()
+    batch = []
+    for log in BackrestLog.objects.order_by('id').only('id', 'server_id', 'timestamp', 'message').iterator(chunk_size=2000):
+        raw = f"{log.server_id}\x1f{log.timestamp.isoformat()}\x1f{log.message or ''}"
+        content_hash = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        log.content_hash = content_hash
+        batch.append(log)
+        if len(batch) >= 2000:
+            BackrestLog.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        BackrestLog.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0005_backrestlogcursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backrestlog',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of server, timestamp and message, used for dedupe', max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0006_backrestlog_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backrestlogcursor',
+            name='mtime',
+            field=models.BigIntegerField(blank=True, help_text='File mtime when last fully read', null=True),
+        ),
+        migrations.AddField(
+            model_name='backrestlogcursor',
+            name='size',
+            field=models.BigIntegerField(blank=True, help_text='File size when last fully read', null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0007_backrestlogcursor_mtime_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backrestrepository',
+            name='operations_full_sync_at',
+            field=models.DateTimeField(blank=True, help_text='Last full reconciliation of the operation history', null=True),
+        ),
+        migrations.AddField(
+            model_name='backrestrepository',
+            name='operations_high_water_id',
+            field=models.BigIntegerField(blank=True, help_text='Highest Backrest operation id synced', null=True),
+        ),
+        migrations.AddField(
+            model_name='backrestrepository',
+            name='operations_high_water_modno',
+            field=models.BigIntegerField(blank=True, help_text='Highest Backrest operation modno synced', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0008_backrestrepository_operation_sync_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='When the operations sync should next poll this server', null=True),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='poll_interval',
+            field=models.IntegerField(blank=True, help_text='Seconds between polls, grows while the server is idle', null=True),
+        ),
+    ]
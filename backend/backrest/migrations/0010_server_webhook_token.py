@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+import backrest.models
+from django.db import migrations, models
+
+
+def generate_tokens(apps, schema_editor):
+    Server = apps.get_model('backrest', 'Server')
+    for server in Server.objects.filter(webhook_token=''):
+        server.webhook_token = backrest.models.generate_webhook_token()
+        server.save(update_fields=['webhook_token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0009_server_polling_state'),
+    ]
+
+    operations = [
+        # Added with an empty default first so existing servers each get their own token
+        migrations.AddField(
+            model_name='server',
+            name='webhook_token',
+            field=models.CharField(default='', editable=False, help_text='Secret in the hook URL Backrest posts operation events to', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(generate_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='server',
+            name='webhook_token',
+            field=models.CharField(default=backrest.models.generate_webhook_token, editable=False, help_text='Secret in the hook URL Backrest posts operation events to', max_length=64),
+        ),
+    ]
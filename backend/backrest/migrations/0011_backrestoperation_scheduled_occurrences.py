@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0010_server_webhook_token'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='backrestoperation',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='backrestoperation',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('scheduled', 'Scheduled'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='backrestoperation',
+            index=models.Index(condition=models.Q(('status', 'scheduled')), fields=['scheduled_at'], name='backrest_op_scheduled_at_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='backrestoperation',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'scheduled')), fields=('plan', 'scheduled_at'), name='backrest_op_unique_scheduled_occurrence'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+# Rebuild backrest_backrestlog as a table partitioned by month on "timestamp".
+# Postgres requires the partition key in every unique constraint, so the
+# primary key becomes (id, timestamp) and the dedupe key (content_hash,
+# timestamp) - the hash already covers the timestamp, so dedupe is unchanged.
+# Existing rows are copied into one partition per month they span; the
+# current month and the next three are created up front, and a DEFAULT
+# partition catches anything outside the created ranges.
+PARTITION_SQL = """
+ALTER TABLE backrest_backrestlog RENAME TO backrest_backrestlog_unpartitioned;
+
+CREATE TABLE backrest_backrestlog (
+    id bigint NOT NULL,
+    level varchar(20) NOT NULL,
+    message text NOT NULL,
+    logger_name varchar(255) NOT NULL,
+    error text NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    source varchar(255) NOT NULL,
+    content_hash varchar(64) NULL,
+    server_id bigint NOT NULL,
+    tenant_id bigint NOT NULL,
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+
+DO $$
+DECLARE
+    month_start timestamp;
+BEGIN
+    FOR month_start IN
+        SELECT DISTINCT date_trunc('month', "timestamp" AT TIME ZONE 'UTC')
+        FROM backrest_backrestlog_unpartitioned
+        UNION
+        SELECT generate_series(
+            date_trunc('month', now() AT TIME ZONE 'UTC'),
+            date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+            interval '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF backrest_backrestlog FOR VALUES FROM (%L) TO (%L)',
+            'backrest_backrestlog_p' || to_char(month_start, 'YYYYMM'),
+            (month_start AT TIME ZONE 'UTC'),
+            ((month_start + interval '1 month') AT TIME ZONE 'UTC')
+        );
+    END LOOP;
+END $$;
+
+CREATE TABLE backrest_backrestlog_default PARTITION OF backrest_backrestlog DEFAULT;
+
+INSERT INTO backrest_backrestlog
+    (id, level, message, logger_name, error, "timestamp", source, content_hash, server_id, tenant_id)
+SELECT id, level, message, logger_name, error, "timestamp", source, content_hash, server_id, tenant_id
+FROM backrest_backrestlog_unpartitioned;
+
+DROP TABLE backrest_backrestlog_unpartitioned;
+
+CREATE SEQUENCE backrest_backrestlog_id_seq OWNED BY backrest_backrestlog.id;
+SELECT setval('backrest_backrestlog_id_seq', COALESCE((SELECT MAX(id) FROM backrest_backrestlog), 0) + 1, false);
+ALTER TABLE backrest_backrestlog ALTER COLUMN id SET DEFAULT nextval('backrest_backrestlog_id_seq');
+
+ALTER TABLE backrest_backrestlog
+    ADD CONSTRAINT backrest_backrestlog_server_id_fk FOREIGN KEY (server_id)
+    REFERENCES backrest_server (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE backrest_backrestlog
+    ADD CONSTRAINT backrest_backrestlog_tenant_id_fk FOREIGN KEY (tenant_id)
+    REFERENCES tenants_tenant (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE backrest_backrestlog
+    ADD CONSTRAINT backrest_log_unique_content_hash UNIQUE (content_hash, "timestamp");
+
+CREATE INDEX backrest_ba_timesta_d61484_idx ON backrest_backrestlog ("timestamp");
+CREATE INDEX backrest_ba_level_4dc110_idx ON backrest_backrestlog (level);
+CREATE INDEX backrest_ba_server__e57422_idx ON backrest_backrestlog (server_id);
+CREATE INDEX backrest_backrestlog_tenant_id_idx ON backrest_backrestlog (tenant_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0011_backrestoperation_scheduled_occurrences'),
+        ('tenants', '0003_tenant_log_retention_days'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION_SQL),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='backrestlog',
+                    name='content_hash',
+                    field=models.CharField(blank=True, help_text='SHA-256 of server, timestamp and message, used for dedupe', max_length=64, null=True),
+                ),
+                migrations.AddConstraint(
+                    model_name='backrestlog',
+                    constraint=models.UniqueConstraint(fields=('content_hash', 'timestamp'), name='backrest_log_unique_content_hash'),
+                ),
+            ],
+        ),
+    ]
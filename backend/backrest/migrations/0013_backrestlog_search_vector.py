@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0012_partition_backrestlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backrestlog',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('message', config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector('error', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), '||', django.contrib.postgres.search.SearchVector('logger_name', config='english', weight='C'), django.contrib.postgres.search.SearchConfig('english')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        # Created on the partitioned parent, so every monthly partition gets its own GIN index
+        migrations.AddIndex(
+            model_name='backrestlog',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='backrest_log_search_gin'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backrest', '0013_backrestlog_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backrestrepository',
+            name='snapshot_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='backrestrepository',
+            name='storage_measured_at',
+            field=models.DateTimeField(blank=True, help_text="Last time restic measured the repository's size", null=True),
+        ),
+        migrations.AddField(
+            model_name='backrestrepository',
+            name='storage_used_bytes',
+            field=models.BigIntegerField(default=0, help_text='Size on disk at the last measurement plus data added by backups since'),
+        ),
+    ]
@@ -1,39 +1,26 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-import os, uuid
-from cryptography.fernet import Fernet
+import os, uuid, secrets
+from . import crypto
 from jobs.models import BackupJob
 
 TENANT_MODEL = settings.TENANT_MODEL
 
 def get_encryption_key():
-    """Get or create encryption key for sensitive data"""
-    key_path = os.path.join(settings.BASE_DIR, '.encryption_key')
-    if os.path.exists(key_path):
-        with open(key_path, 'rb') as f:
-            return f.read()
-    else:
-        key = Fernet.generate_key()
-        with open(key_path, 'wb') as f:
-            f.write(key)
-        os.chmod(key_path, 0o600)  # Secure permissions
-        return key
+    """Key new values are encrypted with (see crypto.py for rotation)"""
+    return crypto.load_keys()[0]
 
 def encrypt_value(value):
     """Encrypt sensitive values"""
-    if not value:
-        return value
-    f = Fernet(get_encryption_key())
-    return f.encrypt(value.encode()).decode()
+    return crypto.encrypt_value(value)
 
 def decrypt_value(value):
     """Decrypt sensitive values"""
-    if not value:
-        return value
-    f = Fernet(get_encryption_key())
-    return f.decrypt(value.encode()).decode()
+    return crypto.decrypt_value(value)
 
 class SSHKey(models.Model):
     tenant = models.ForeignKey(TENANT_MODEL, on_delete=models.CASCADE, related_name='ssh_keys')
@@ -44,8 +31,10 @@ class SSHKey(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def save(self, *args, **kwargs):
+        plaintext_key = None
         # Encrypt the private key before saving
         if self.private_key and not self.id:  # Only encrypt on first save
+            plaintext_key = self.private_key
             self.private_key = encrypt_value(self.private_key)
             
         # Generate fingerprint if needed
@@ -56,14 +45,19 @@ class SSHKey(models.Model):
         # Save the model
         super().save(*args, **kwargs)
         
-        # Store the key in the filesystem with secure permissions
-        ssh_dir = os.path.join(settings.BASE_DIR, '.ssh', f'tenant_{self.tenant.id}')
+        # Store the key in the filesystem with secure permissions. Only new keys,
+        # or keys whose file is missing (e.g. after a rename), are written -
+        # re-saves such as a key rotation leave the file alone.
+        key_path = self.get_key_path()
+        if plaintext_key is None and os.path.exists(key_path):
+            return
+        
+        ssh_dir = os.path.dirname(key_path)
         os.makedirs(ssh_dir, exist_ok=True)
         os.chmod(ssh_dir, 0o700)
         
-        key_path = os.path.join(ssh_dir, f"{self.name.replace(' ', '_')}")
         with open(key_path, 'w') as f:
-            f.write(decrypt_value(self.private_key))
+            f.write(plaintext_key if plaintext_key is not None else decrypt_value(self.private_key))
         os.chmod(key_path, 0o600)
         
         if self.public_key:
@@ -77,12 +71,16 @@ class SSHKey(models.Model):
     
     def get_key_path(self):
         """Get the path to the key file on disk"""
-        return os.path.join(settings.BASE_DIR, '.ssh', f'tenant_{self.tenant.id}',
+        return os.path.join(settings.BASE_DIR, '.ssh', f'tenant_{self.tenant_id}',
                           f"{self.name.replace(' ', '_')}")
     
     def __str__(self):
         return f"{self.name} ({self.tenant.schema_name})"
 
+def generate_webhook_token():
+    """Random secret used to authenticate Backrest hook calls for a server"""
+    return secrets.token_urlsafe(32)
+
 class Server(models.Model):
     class Status(models.TextChoices):
         PENDING = 'pending', _('Pending')
@@ -105,6 +103,13 @@ class Server(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     backrest_instance_id = models.CharField(max_length=255, blank=True, null=True)
+    # Adaptive polling state, see backrest/polling.py
+    next_poll_at = models.DateTimeField(null=True, blank=True, db_index=True,
+                                        help_text="When the operations sync should next poll this server")
+    poll_interval = models.IntegerField(null=True, blank=True,
+                                        help_text="Seconds between polls, grows while the server is idle")
+    webhook_token = models.CharField(max_length=64, default=generate_webhook_token, editable=False,
+                                     help_text="Secret in the hook URL Backrest posts operation events to")
     
     def __str__(self):
         return f"{self.name} ({self.hostname}:{self.ssh_port})"
@@ -122,6 +127,20 @@ class BackrestRepository(models.Model):
     password = models.CharField(max_length=255)  # Will be encrypted
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Incremental operation sync state
+    operations_high_water_id = models.BigIntegerField(null=True, blank=True,
+                                                      help_text="Highest Backrest operation id synced")
+    operations_high_water_modno = models.BigIntegerField(null=True, blank=True,
+                                                         help_text="Highest Backrest operation modno synced")
+    operations_full_sync_at = models.DateTimeField(null=True, blank=True,
+                                                   help_text="Last full reconciliation of the operation history")
+    # Storage rollup, see backrest/storage.py
+    storage_used_bytes = models.BigIntegerField(
+        default=0, help_text="Size on disk at the last measurement plus data added by backups since"
+    )
+    storage_measured_at = models.DateTimeField(null=True, blank=True,
+                                               help_text="Last time restic measured the repository's size")
+    snapshot_count = models.IntegerField(default=0)
     
     def save(self, *args, **kwargs):
         # Encrypt the password before saving
@@ -182,6 +201,7 @@ class BackrestOperation(models.Model):
         
     class StatusType(models.TextChoices):
         PENDING = 'pending', _('Pending')
+        SCHEDULED = 'scheduled', _('Scheduled')
         RUNNING = 'running', _('Running')
         COMPLETED = 'completed', _('Completed')
         FAILED = 'failed', _('Failed')
@@ -192,7 +212,7 @@ class BackrestOperation(models.Model):
     plan = models.ForeignKey(BackrestPlan, on_delete=models.SET_NULL, null=True, related_name='operations')
     operation_type = models.CharField(max_length=20, choices=OperationType.choices)
     status = models.CharField(max_length=20, choices=StatusType.choices, default=StatusType.PENDING)
-    started_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)  # Unset for scheduled occurrences
     completed_at = models.DateTimeField(null=True, blank=True)
     snapshot_id = models.CharField(max_length=255, null=True, blank=True)
     stats = models.JSONField(null=True, blank=True)
@@ -215,9 +235,32 @@ class BackrestOperation(models.Model):
         if self.status == "scheduled" and self.scheduled_at and self.scheduled_at > timezone.now():
             return f"Waiting - {self.scheduled_at.strftime('%Y-%m-%d %H:%M')}"
         return self.status
+    
+    class Meta:
+        constraints = [
+            # One materialized occurrence per plan fire time (see backrest/schedules.py)
+            models.UniqueConstraint(
+                fields=['plan', 'scheduled_at'],
+                condition=models.Q(status='scheduled'),
+                name='backrest_op_unique_scheduled_occurrence',
+            ),
+        ]
+        indexes = [
+            # Upcoming backups are a range scan over this
+            models.Index(
+                fields=['scheduled_at'],
+                condition=models.Q(status='scheduled'),
+                name='backrest_op_scheduled_at_idx',
+            ),
+        ]
 
 class BackrestLog(models.Model):
-    """Model to store Backrest logs from various sources"""
+    """
+    Model to store Backrest logs from various sources.
+
+    The table is partitioned by month on `timestamp` (see migration 0012 and
+    partitions.py), so the primary key in the database is (id, timestamp).
+    """
     tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE)
     server = models.ForeignKey('Server', on_delete=models.CASCADE)
     level = models.CharField(max_length=20)
@@ -226,6 +269,18 @@ class BackrestLog(models.Model):
     error = models.TextField(blank=True)
     timestamp = models.DateTimeField()
     source = models.CharField(max_length=255, help_text="Source of the log (file path)")
+    content_hash = models.CharField(max_length=64, null=True, blank=True,
+                                    help_text="SHA-256 of server, timestamp and message, used for dedupe")
+    # Maintained by Postgres from message, error and logger_name (see search.py)
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('message', weight='A', config='english')
+            + SearchVector('error', weight='B', config='english')
+            + SearchVector('logger_name', weight='C', config='english')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
     
     class Meta:
         ordering = ['-timestamp']
@@ -233,8 +288,32 @@ class BackrestLog(models.Model):
             models.Index(fields=['timestamp']),
             models.Index(fields=['level']),
             models.Index(fields=['server']),
+            GinIndex(fields=['search_vector'], name='backrest_log_search_gin'),
+        ]
+        constraints = [
+            # Unique constraints on a partitioned table must include the partition key
+            models.UniqueConstraint(fields=['content_hash', 'timestamp'], name='backrest_log_unique_content_hash'),
         ]
 
+class BackrestLogCursor(models.Model):
+    """Read position in a remote log file, so each poll only fetches new data"""
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE, related_name='backrest_log_cursors')
+    server = models.ForeignKey('Server', on_delete=models.CASCADE, related_name='log_cursors')
+    path = models.CharField(max_length=1024, help_text="Path of the log file on the server")
+    consumer = models.CharField(max_length=100, help_text="Task that reads through this cursor")
+    inode = models.BigIntegerField(null=True, blank=True)
+    offset = models.BigIntegerField(default=0, help_text="Byte offset of the next unread line")
+    mtime = models.BigIntegerField(null=True, blank=True, help_text="File mtime when last fully read")
+    size = models.BigIntegerField(null=True, blank=True, help_text="File size when last fully read")
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = [('server', 'path', 'consumer')]
+    
+    def __str__(self):
+        return f"{self.consumer} @ {self.server.name}:{self.path} ({self.offset})"
+
 class BackrestInstance(models.Model):
     tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE, related_name='backrest_instances')
     server = models.ForeignKey('Server', on_delete=models.CASCADE, related_name='backrest_instances')
@@ -0,0 +1,151 @@
+# backend/backrest/partitions.py
+"""
+Monthly partitions of the BackrestLog table.
+
+backrest_backrestlog is range-partitioned on "timestamp" in every tenant
+schema, one partition per calendar month (UTC) named
+backrest_backrestlog_pYYYYMM, plus a DEFAULT partition for rows outside
+the created ranges. ensure_log_partitions creates the coming months ahead
+of ingestion, and drop_expired_log_partitions applies the tenant's
+log_retention_days by dropping whole months instead of running DELETE
+over the live table. All functions work on the current schema, so call
+them inside tenant_context.
+"""
+import logging
+import re
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LOG_TABLE = 'backrest_backrestlog'
+DEFAULT_PARTITION = f'{LOG_TABLE}_default'
+
+_PARTITION_RE = re.compile(rf'^{LOG_TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    """Partition bound literal for the first instant of a month in UTC"""
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def partition_name(month):
+    return f'{LOG_TABLE}_p{month:%Y%m}'
+
+
+def list_log_partitions():
+    """{month start date: partition name} of the current schema's log partitions"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_namespace ns ON ns.oid = parent.relnamespace
+            WHERE parent.relname = %s AND ns.nspname = current_schema()
+            """,
+            [LOG_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = _PARTITION_RE.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def ensure_log_partitions(months_ahead=None, now=None):
+    """
+    Create the partitions for the current month and `months_ahead` after it.
+
+    Returns the names of the partitions that were created. A month whose
+    rows already landed in the DEFAULT partition is skipped with a warning,
+    since Postgres refuses to create a partition overlapping those rows.
+    """
+    if months_ahead is None:
+        months_ahead = getattr(settings, 'BACKREST_LOG_PARTITIONS_AHEAD', 3)
+
+    current = _month_start((now or timezone.now()).astimezone(dt_timezone.utc))
+    existing = list_log_partitions()
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = _add_months(current, offset)
+        if month in existing:
+            continue
+        name = partition_name(month)
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {LOG_TABLE} '
+                    f'FOR VALUES FROM ({_bound(month)}) TO ({_bound(_add_months(month, 1))})'
+                )
+            created.append(name)
+        except Exception as e:
+            logger.warning(f"Could not create log partition {name} in {connection.schema_name}: {str(e)}")
+
+    if created:
+        logger.info(f"Created log partitions {', '.join(created)} in {connection.schema_name}")
+    return created
+
+
+def drop_expired_log_partitions(retention_days, now=None, dry_run=False):
+    """
+    Drop the monthly partitions whose newest possible row is older than
+    `retention_days`, and trim the DEFAULT partition to the same cutoff.
+
+    Months are only dropped once they are entirely past the cutoff, so up
+    to a month of extra history is kept. Returns the dropped partition names.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=retention_days)
+
+    expired = [
+        name for month, name in sorted(list_log_partitions().items())
+        if datetime.combine(_add_months(month, 1), datetime.min.time(), tzinfo=dt_timezone.utc) <= cutoff
+    ]
+    if dry_run:
+        return expired
+
+    for name in expired:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {LOG_TABLE} DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+
+    # The DEFAULT partition only holds stragglers, so a DELETE there stays cheap
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" < %s', [cutoff])
+        trimmed = cursor.rowcount
+
+    if expired or trimmed:
+        logger.info(
+            f"Dropped log partitions {', '.join(expired) or '-'} and {trimmed} default-partition rows "
+            f"older than {retention_days} days in {connection.schema_name}"
+        )
+    return expired
+
+
+def maintain_log_partitions(tenant, months_ahead=None, now=None, apply_retention=True):
+    """Create upcoming partitions and apply the tenant's retention; call inside tenant_context"""
+    result = {
+        "created": ensure_log_partitions(months_ahead=months_ahead, now=now),
+        "dropped": [],
+    }
+    if apply_retention and tenant.log_retention_days:
+        result["dropped"] = drop_expired_log_partitions(tenant.log_retention_days, now=now)
+    return result
@@ -0,0 +1,162 @@
+# backend/backrest/polling.py
+"""
+Adaptive per-server poll scheduling for the operations sync.
+
+Each Server stores when it is next due (`next_poll_at`) and the interval
+that produced it (`poll_interval`). After a sync, servers with running
+operations, fresh changes or a backup scheduled in the near future are
+polled again after BACKREST_POLL_ACTIVE_INTERVAL seconds. Idle servers
+back off by doubling their interval up to BACKREST_POLL_MAX_IDLE_INTERVAL.
+The dispatcher only queues servers whose next_poll_at has passed.
+
+Each Tenant row in the public schema mirrors the earliest next_poll_at of
+its servers, so a dispatcher tick is one query over the tenants table and
+only due tenants' schemas are entered.
+"""
+import logging
+from datetime import datetime, timedelta
+
+import croniter
+from django.conf import settings
+from django.db.models import Min, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _intervals():
+    return (
+        getattr(settings, 'BACKREST_POLL_ACTIVE_INTERVAL', 5),
+        getattr(settings, 'BACKREST_POLL_MIN_IDLE_INTERVAL', 60),
+        getattr(settings, 'BACKREST_POLL_MAX_IDLE_INTERVAL', 900),
+    )
+
+
+def due_server_ids(now=None):
+    """Ids of the current tenant's servers that are due for a poll"""
+    from .models import Server
+
+    now = now or timezone.now()
+    return list(
+        Server.objects.filter(Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now))
+        .values_list('id', flat=True)
+    )
+
+
+def due_tenant_ids(now=None):
+    """Ids of active tenants with at least one server due for a poll"""
+    from tenants.models import Tenant
+
+    now = now or timezone.now()
+    return list(
+        Tenant.objects.filter(is_active=True)
+        .exclude(schema_name='public')
+        .filter(Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now))
+        .values_list('id', flat=True)
+    )
+
+
+def refresh_tenant_next_poll(tenant_id, now=None):
+    """Copy the earliest next_poll_at of the current tenant's servers onto its Tenant row"""
+    from tenants.models import Tenant
+    from .models import Server
+
+    servers = Server.objects.filter(tenant_id=tenant_id)
+    if servers.filter(next_poll_at__isnull=True).exists():
+        next_poll_at = now or timezone.now()
+    else:
+        next_poll_at = servers.aggregate(earliest=Min('next_poll_at'))['earliest']
+        if next_poll_at is None:
+            # No servers: look again after the longest idle interval
+            next_poll_at = (now or timezone.now()) + timedelta(seconds=_intervals()[2])
+    # An UPDATE rather than tenant.save(): no cache invalidation signals on every tick
+    Tenant.objects.filter(id=tenant_id).update(next_poll_at=next_poll_at)
+    return next_poll_at
+
+
+def _next_cron_run(schedule, now):
+    """Next run of a plan's cron schedule, or None if it has none"""
+    from .schedules import cron_expression
+
+    expression = cron_expression(schedule)
+    if not expression:
+        return None
+    try:
+        return croniter.croniter(expression, now).get_next(datetime)
+    except (ValueError, KeyError):
+        return None
+
+
+def active_server_ids(server_ids, now=None):
+    """Servers with running operations or a scheduled backup within the lookahead window"""
+    from .models import BackrestOperation, BackrestPlan
+
+    now = now or timezone.now()
+    lookahead = timedelta(seconds=getattr(settings, 'BACKREST_POLL_SCHEDULE_LOOKAHEAD', 300))
+
+    active = set(
+        BackrestOperation.objects.filter(
+            status='running',
+            repository__server_id__in=server_ids,
+        ).values_list('repository__server_id', flat=True).distinct()
+    )
+
+    plans = BackrestPlan.objects.filter(repository__server_id__in=server_ids).exclude(
+        repository__server_id__in=active
+    ).values_list('repository__server_id', 'schedule')
+    for server_id, schedule in plans:
+        next_run = _next_cron_run(schedule, now)
+        if next_run and next_run - now <= lookahead:
+            active.add(server_id)
+
+    return active
+
+
+def schedule_next_polls(server_ids, changed_server_ids=(), now=None):
+    """
+    Store the next poll time for each polled server.
+
+    Servers in `changed_server_ids` saw new or updated operations in the
+    sync that just ran and are treated as active.
+    """
+    from .models import Server
+
+    if not server_ids:
+        return {}
+
+    now = now or timezone.now()
+    active_interval, min_idle, max_idle = _intervals()
+    active = active_server_ids(server_ids, now) | set(changed_server_ids)
+
+    servers = list(Server.objects.filter(id__in=server_ids).only('id', 'poll_interval', 'next_poll_at'))
+    for server in servers:
+        if server.id in active:
+            interval = active_interval
+        else:
+            # Back off exponentially while nothing is happening
+            interval = min(max((server.poll_interval or 0) * 2, min_idle), max_idle)
+        server.poll_interval = interval
+        server.next_poll_at = now + timedelta(seconds=interval)
+
+    Server.objects.bulk_update(servers, ['poll_interval', 'next_poll_at'])
+    for tenant_id in set(Server.objects.filter(id__in=server_ids).values_list('tenant_id', flat=True)):
+        refresh_tenant_next_poll(tenant_id, now)
+
+    logger.debug(f"Scheduled {len(servers)} servers, {len(active & set(server_ids))} active")
+    return {server.id: server.poll_interval for server in servers}
+
+
+def poll_soon(server):
+    """Make a server due on the next dispatcher tick, e.g. right after triggering a backup"""
+    from .models import Server
+
+    mark_tenant_due(server.tenant_id)
+    active_interval, _, _ = _intervals()
+    Server.objects.filter(id=server.id).update(next_poll_at=timezone.now(), poll_interval=active_interval)
+
+
+def mark_tenant_due(tenant_id, now=None):
+    """Make the dispatcher look at a tenant on its next tick"""
+    from tenants.models import Tenant
+
+    Tenant.objects.filter(id=tenant_id).update(next_poll_at=now or timezone.now())
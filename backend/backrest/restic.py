@@ -0,0 +1,39 @@
+# backend/backrest/restic.py
+"""
+Running restic against a repository over SSH.
+
+Used where Backrest's API has no equivalent: streaming a snapshot's file
+list (catalog.py). The repository password is written to restic's stdin so it
+never shows up in the remote process list.
+"""
+import shlex
+
+from django.conf import settings
+
+# Finds a restic binary: one on PATH, else the one Backrest downloads into its data dir
+RESTIC_LOOKUP = (
+    'RESTIC_BIN=$(command -v restic || ls -1 "$HOME"/.local/share/backrest/restic* '
+    '/opt/backrest/data/restic* 2>/dev/null | head -n 1); '
+    '[ -n "$RESTIC_BIN" ] || { echo "restic not found" >&2; exit 127; }; '
+)
+
+
+def restic_command(repository, args):
+    """Shell command running `restic <args>` against the repository"""
+    binary = getattr(settings, 'BACKREST_RESTIC_BINARY', None)
+    prefix = f'RESTIC_BIN={shlex.quote(binary)}; ' if binary else RESTIC_LOOKUP
+    return (
+        prefix
+        + f'RESTIC_REPOSITORY={shlex.quote(repository.uri)} '
+        + '"$RESTIC_BIN" ' + ' '.join(shlex.quote(arg) for arg in args)
+    )
+
+
+def exec_restic(client, repository, args):
+    """Start restic on an SSH client and hand it the password; returns (stdin, stdout, stderr)"""
+    stdin, stdout, stderr = client.exec_command(restic_command(repository, args))
+    # restic reads the repository password from stdin when it isn't a terminal
+    stdin.write(repository.get_decrypted_password() + "\n")
+    stdin.flush()
+    stdin.channel.shutdown_write()
+    return stdin, stdout, stderr
@@ -0,0 +1,170 @@
+# backend/backrest/retention.py
+"""
+Monthly retention across every tenant's repositories.
+
+For a given month (tag "month-YYYY-MM"), a repository keeps its newest
+snapshot tagged full-backup and monday-backup and forgets the month's
+other snapshots. A month without such a full backup is left alone.
+
+Per repository the engine lists the snapshots once and works out the
+keep/forget sets in a single pass. It then forgets them through Backrest's
+Forget RPC, back to back over the pooled HTTP session, so restic runs with
+the repository's own env and flags (S3, B2, rclone...), under Backrest's
+repo lock and with a forget operation in its log. A prune is started only
+if something was forgotten. Repositories are processed concurrently by a
+bounded thread pool, with at most BACKREST_RETENTION_PER_SERVER
+repositories per Backrest server at a time, so one large server doesn't
+serialize the whole fleet and no server gets more than its share.
+
+A dry run computes the same plan and stops before touching the repository.
+"""
+import contextvars
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+
+from .sync import _snapshot_time
+
+logger = logging.getLogger(__name__)
+
+FULL_BACKUP_TAGS = frozenset(['full-backup', 'monday-backup'])
+MONTH_TAG_RE = re.compile(r'^month-\d{4}-(0[1-9]|1[0-2])$')
+
+
+def month_tag(year, month):
+    return f"month-{year}-{month:02d}"
+
+
+def previous_month_tag(now=None):
+    """Tag of the month before `now`"""
+    now = now or timezone.now()
+    if now.month == 1:
+        return month_tag(now.year - 1, 12)
+    return month_tag(now.year, now.month - 1)
+
+
+# Plan Backrest files snapshots under when they weren't made by one of its plans
+UNASSOCIATED_PLAN = '_unassociated_'
+
+
+def _describe(snapshot_data):
+    snapshot_time = _snapshot_time(snapshot_data)
+    return {
+        'id': snapshot_data.get('id'),
+        'time': snapshot_time.isoformat() if snapshot_time else None,
+        'tags': snapshot_data.get('tags') or [],
+        'plan_id': snapshot_data.get('planId') or UNASSOCIATED_PLAN,
+    }
+
+
+def plan_retention(snapshots, tag):
+    """
+    Keep/forget sets for one repository's remote snapshot list, in one pass.
+
+    Returns {'month', 'keep', 'forget', 'scanned'}. `keep` is None and
+    nothing is forgotten when the month has no full backup.
+    """
+    keep = None
+    keep_time = None
+    in_month = []
+
+    for snapshot_data in snapshots:
+        tags = snapshot_data.get('tags') or []
+        if tag not in tags or not snapshot_data.get('id'):
+            continue
+        in_month.append(snapshot_data)
+        if FULL_BACKUP_TAGS.issubset(tags):
+            snapshot_time = _snapshot_time(snapshot_data)
+            if keep is None or (snapshot_time is not None and (keep_time is None or snapshot_time > keep_time)):
+                keep, keep_time = snapshot_data, snapshot_time
+
+    forget = [] if keep is None else [_describe(s) for s in in_month if s is not keep]
+    return {
+        'month': tag,
+        'keep': _describe(keep) if keep is not None else None,
+        'forget': forget,
+        'scanned': len(snapshots),
+    }
+
+
+class RetentionEngine:
+    """Apply monthly retention to many repositories concurrently"""
+
+    def __init__(self, tag=None, dry_run=False, max_workers=None, per_server=None):
+        self.tag = tag or previous_month_tag()
+        self.dry_run = dry_run
+        self.max_workers = max_workers or getattr(settings, 'BACKREST_RETENTION_WORKERS', 8)
+        self.per_server = per_server or getattr(settings, 'BACKREST_RETENTION_PER_SERVER', 1)
+        self._server_slots = {}
+        self._slots_lock = threading.Lock()
+
+    def _server_slot(self, server):
+        # Server ids repeat across tenant schemas, the Backrest endpoint doesn't
+        key = (server.hostname, server.backrest_port)
+        with self._slots_lock:
+            if key not in self._server_slots:
+                self._server_slots[key] = threading.BoundedSemaphore(self.per_server)
+            return self._server_slots[key]
+
+    def apply(self, repository):
+        """Plan, forget and prune one repository; returns its result dict"""
+        from .services import BackrestService
+
+        service = BackrestService(repository.server)
+        plan = plan_retention(service.get_snapshots(repository.repository_id), self.tag)
+        result = {'status': 'success', 'dry_run': self.dry_run, **plan, 'forgotten': 0, 'prune': None}
+
+        if plan['keep'] is None:
+            result['status'] = 'skipped'
+            result['message'] = f"No full backup tagged {self.tag}"
+            return result
+        if self.dry_run or not plan['forget']:
+            return result
+
+        # Backrest forgets one snapshot per call; stop at the first failure but
+        # report what was forgotten so the snapshot sync still picks it up
+        for snapshot in plan['forget']:
+            try:
+                service.forget_snapshot(repository.repository_id, snapshot['plan_id'], snapshot['id'])
+            except Exception as e:
+                logger.error(f"Error forgetting snapshot {snapshot['id']} in repo {repository.name}: {str(e)}")
+                result['status'] = 'error'
+                result['error'] = str(e)
+                return result
+            result['forgotten'] += 1
+        logger.info(f"Forgot {result['forgotten']} snapshots of {self.tag} in repo {repository.name}")
+
+        # Space is only reclaimed by a prune, and only worth one when something was forgotten
+        result['prune'] = service.prune_repository(repository.repository_id)['status']
+        return result
+
+    def _run_one(self, repository):
+        with self._server_slot(repository.server):
+            try:
+                return self.apply(repository)
+            except Exception as e:
+                logger.error(f"Error applying retention to repository {repository.name}: {str(e)}")
+                return {'status': 'error', 'error': str(e)}
+
+    def run(self, jobs):
+        """
+        Apply retention to (key, repository) pairs and return {key: result}.
+
+        Repositories must come with their server loaded; the worker threads
+        make no database queries.
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+            # Each worker runs in a copy of our context, so its HTTP calls and SSH
+            # commands are counted against the task's RunStats
+            futures = {
+                key: pool.submit(contextvars.copy_context().run, self._run_one, repository)
+                for key, repository in jobs
+            }
+            return {key: future.result() for key, future in futures.items()}
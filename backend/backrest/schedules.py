@@ -0,0 +1,158 @@
+# backend/backrest/schedules.py
+"""
+Materialized schedule occurrences.
+
+Every fire time of every plan inside the next BACKREST_SCHEDULE_HORIZON_HOURS
+is stored as a BackrestOperation with status "scheduled". A partial unique
+constraint on (plan, scheduled_at) makes re-materializing idempotent, so a
+run is one read of the existing occurrences, one bulk INSERT of the missing
+ones and one DELETE of the ones that no longer match their plan's schedule.
+"Upcoming backups" then become a range scan over scheduled_at.
+"""
+import logging
+from datetime import datetime, timedelta
+
+import croniter
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED = 'scheduled'
+PENDING = 'pending'
+
+# What sync.plan_from_config and sync_plans store for plans without a schedule (February 31st)
+DISABLED_CRON = '0 0 31 2 0'
+
+
+def cron_expression(schedule):
+    """The cron string of a plan's schedule, or None if it is disabled"""
+    if isinstance(schedule, dict):
+        if schedule.get('disabled'):
+            return None
+        schedule = schedule.get('cron')
+    if not isinstance(schedule, str) or not schedule.strip() or schedule == "disabled":
+        return None
+    if ' '.join(schedule.split()) == DISABLED_CRON:
+        return None
+    return schedule.strip()
+
+
+def fire_times(schedule, start, end, limit=1000):
+    """
+    Fire times of a cron schedule in (start, end], at most `limit` of them.
+
+    Raises ValueError (croniter's errors) for an invalid expression or one
+    that never fires.
+    """
+    expression = cron_expression(schedule)
+    if not expression:
+        return []
+
+    # Plans use CLOCK_LOCAL, so evaluate the cron in our local time zone
+    cron = croniter.croniter(expression, timezone.localtime(start))
+    times = []
+    while len(times) < limit:
+        fire_time = cron.get_next(datetime)
+        if fire_time > end:
+            break
+        times.append(fire_time)
+    return times
+
+
+def occurrence_id(plan, scheduled_at):
+    return f"scheduled_{plan.plan_id}_{int(scheduled_at.timestamp())}"
+
+
+def materialize_occurrences(tenant, plans=None, horizon_hours=None, now=None):
+    """
+    Bring the stored scheduled occurrences in line with the plans' schedules.
+
+    Creates the missing fire times within the horizon and removes scheduled
+    occurrences that no longer match their plan's schedule, lie beyond the
+    horizon, or were never picked up and are older than the grace period.
+    Pass `plans` to only refresh those plans, e.g. after one was edited.
+    """
+    from .models import BackrestOperation, BackrestPlan
+
+    if horizon_hours is None:
+        horizon_hours = getattr(settings, 'BACKREST_SCHEDULE_HORIZON_HOURS', 48)
+    grace = timedelta(minutes=getattr(settings, 'BACKREST_SCHEDULE_GRACE_MINUTES', 60))
+
+    now = now or timezone.now()
+    end = now + timedelta(hours=horizon_hours)
+
+    if plans is None:
+        plans = BackrestPlan.objects.filter(tenant=tenant)
+    plans = list(plans)
+    if not plans:
+        return {"created": 0, "removed": 0}
+
+    # Everything we currently have scheduled or pending for these plans, in one query
+    existing = {}
+    pending = set()
+    stale_ids = []
+    for op_id, plan_id, scheduled_at, status in BackrestOperation.objects.filter(
+        plan__in=plans, status__in=[SCHEDULED, PENDING],
+    ).values_list('id', 'plan_id', 'scheduled_at', 'status'):
+        if status == PENDING:
+            # Already handed on for this fire time - never duplicated, never removed here
+            if scheduled_at is not None:
+                pending.add((plan_id, scheduled_at.replace(second=0, microsecond=0)))
+        elif scheduled_at is None or scheduled_at < now - grace:
+            stale_ids.append(op_id)
+        elif scheduled_at > now:
+            existing[(plan_id, scheduled_at)] = op_id
+
+    to_create = []
+    for plan in plans:
+        try:
+            plan_fire_times = fire_times(plan.schedule, now, end)
+        except (ValueError, KeyError) as e:
+            # Leave this plan without occurrences rather than failing the tenant's run
+            logger.error(f"Invalid schedule {plan.schedule!r} for plan {plan.name}: {str(e)}")
+            plan_fire_times = []
+
+        for fire_time in plan_fire_times:
+            key = (plan.id, fire_time)
+            if (plan.id, fire_time.replace(second=0, microsecond=0)) in pending:
+                continue
+            if key in existing:
+                # Still wanted - keep it
+                existing.pop(key)
+                continue
+            to_create.append(BackrestOperation(
+                tenant=tenant,
+                repository_id=plan.repository_id,
+                plan=plan,
+                operation_id=occurrence_id(plan, fire_time),
+                operation_type=BackrestOperation.OperationType.BACKUP,
+                status=SCHEDULED,
+                scheduled_at=fire_time,
+            ))
+
+    # Whatever is left in `existing` no longer matches a schedule
+    stale_ids.extend(existing.values())
+    removed = 0
+    if stale_ids:
+        removed, _ = BackrestOperation.objects.filter(id__in=stale_ids, status=SCHEDULED).delete()
+
+    if to_create:
+        BackrestOperation.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+
+    logger.info(f"Materialized {len(to_create)} scheduled occurrences for {len(plans)} plans, removed {removed}")
+    return {"created": len(to_create), "removed": removed}
+
+
+def upcoming_occurrences(hours=None, now=None):
+    """Scheduled occurrences in the next `hours`, soonest first"""
+    from .models import BackrestOperation
+
+    if hours is None:
+        hours = getattr(settings, 'BACKREST_SCHEDULE_HORIZON_HOURS', 48)
+    now = now or timezone.now()
+    return BackrestOperation.objects.filter(
+        status=SCHEDULED,
+        scheduled_at__gte=now,
+        scheduled_at__lt=now + timedelta(hours=hours),
+    ).select_related('plan', 'repository').order_by('scheduled_at')
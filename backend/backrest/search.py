@@ -0,0 +1,86 @@
+# backend/backrest/search.py
+"""
+Full-text search over BackrestLog.
+
+BackrestLog.search_vector is a stored tsvector generated by Postgres from
+message (weight A), error (B) and logger_name (C), with a GIN index on
+every monthly partition. Queries go through that index instead of an
+ILIKE scan, and can be ranked and highlighted.
+
+Modes:
+    websearch  default; "quoted phrases", OR and -exclusions, like a search engine
+    phrase     the words must appear next to each other, in order
+    prefix     every word matches as a prefix, e.g. "repo lock" finds "repository locked"
+"""
+import re
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, Value
+from django.db.models.functions import Replace
+
+SEARCH_CONFIG = 'english'
+SEARCH_MODES = ('websearch', 'phrase', 'prefix')
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Same replacements as django.utils.html.escape; '&' must go first
+_HTML_ESCAPES = (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'), ("'", '&#x27;'))
+
+
+def escaped_html(field):
+    """`field` HTML-escaped in SQL, so markup added around it is the only markup"""
+    expression = F(field)
+    for char, entity in _HTML_ESCAPES:
+        expression = Replace(expression, Value(char), Value(entity))
+    return expression
+
+
+def build_search_query(text, mode='websearch'):
+    """SearchQuery for the user's search text, or None if it has no searchable words"""
+    if mode not in SEARCH_MODES:
+        mode = 'websearch'
+
+    if mode == 'prefix':
+        # Raw tsquery built from word characters only, so user input can't inject operators
+        words = _WORD_RE.findall(text)
+        if not words:
+            return None
+        return SearchQuery(' & '.join(f"{word}:*" for word in words), search_type='raw', config=SEARCH_CONFIG)
+
+    if not _WORD_RE.search(text):
+        return None
+    return SearchQuery(text, search_type=mode, config=SEARCH_CONFIG)
+
+
+def search_logs(queryset, text, mode='websearch', rank=False, highlight=False):
+    """
+    Filter a BackrestLog queryset by full-text search.
+
+    With `rank` the rows get a `search_rank` annotation (ts_rank), with
+    `highlight` a `message_headline` snippet of the message with the matched
+    terms wrapped in <mark>. Both are only computed for the rows fetched.
+
+    Log messages carry text from remote hosts (paths, command output), so
+    the headline is built from the HTML-escaped message: <mark> is the only
+    markup in it and it is safe to render as HTML.
+    """
+    query = build_search_query(text, mode)
+    if query is None:
+        return queryset.none()
+
+    queryset = queryset.filter(search_vector=query)
+    if rank:
+        queryset = queryset.annotate(search_rank=SearchRank(F('search_vector'), query))
+    if highlight:
+        queryset = queryset.annotate(message_headline=SearchHeadline(
+            escaped_html('message'),
+            query,
+            config=SEARCH_CONFIG,
+            start_sel=HIGHLIGHT_START,
+            stop_sel=HIGHLIGHT_STOP,
+            max_fragments=2,
+        ))
+    return queryset
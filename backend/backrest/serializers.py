@@ -5,6 +5,7 @@ from .models import (
     BackrestPlan, BackrestOperation, BackrestSnapshot,
     BackrestLog
 )
+from .listing import SparseFieldsMixin
 
 class SSHKeySerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,11 +32,15 @@ class BackrestRepositorySerializer(serializers.ModelSerializer):
         model = BackrestRepository
         fields = [
             'id', 'server', 'name', 'uri', 'password',
-            'created_at', 'updated_at', 'repository_id'
+            'created_at', 'updated_at', 'repository_id',
+            'storage_used_bytes', 'storage_measured_at', 'snapshot_count'
         ]
         extra_kwargs = {
             'password': {'write_only': True},
-            'repository_id': {'read_only': True}
+            'repository_id': {'read_only': True},
+            'storage_used_bytes': {'read_only': True},
+            'storage_measured_at': {'read_only': True},
+            'snapshot_count': {'read_only': True}
         }
 
 class BackrestPlanSerializer(serializers.ModelSerializer):
@@ -48,7 +53,7 @@ class BackrestPlanSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['plan_id']
 
-class BackrestSnapshotSerializer(serializers.ModelSerializer):
+class BackrestSnapshotSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = BackrestSnapshot
         fields = [
@@ -58,7 +63,7 @@ class BackrestSnapshotSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['indexed_at']
 
-class BackrestOperationSerializer(serializers.ModelSerializer):
+class BackrestOperationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = BackrestOperation
         fields = [
@@ -68,10 +73,14 @@ class BackrestOperationSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['operation_id', 'status']
 
-class BackrestLogSerializer(serializers.ModelSerializer):
+class BackrestLogSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     server_name = serializers.CharField(source='server.name', read_only=True)
+    # Only present when the request searched with ordering=rank / highlight=true
+    search_rank = serializers.FloatField(read_only=True, required=False)
+    message_headline = serializers.CharField(read_only=True, required=False)
     
     class Meta:
         model = BackrestLog
         fields = ['id', 'server', 'server_name', 'level', 'message', 
-                  'logger_name', 'error', 'timestamp', 'source']
\ No newline at end of file
+                  'logger_name', 'error', 'timestamp', 'source',
+                  'search_rank', 'message_headline']
\ No newline at end of file
@@ -4,9 +4,35 @@ import json
 import logging
 from urllib.parse import urlparse
 import bcrypt  # Import bcrypt for password hashing
+from django.conf import settings
+from . import http_pool
+from .hooks import build_hooks, PLAN_HOOK_CONDITIONS, REPO_HOOK_CONDITIONS
 
 logger = logging.getLogger(__name__)
 
+def apply_config_changes(current_config, instance_id=None, users=None, disable_auth=False):
+    """Apply instance/auth changes to a Backrest config dict before SetConfig"""
+    # Update only the specified fields
+    if instance_id:
+        current_config["instance"] = instance_id
+    
+    if "auth" not in current_config:
+        current_config["auth"] = {}
+    
+    if users is not None:
+        # Ensure all passwords are properly hashed
+        for user in users:
+            if user.get("needsBcrypt") == True:
+                # This means password needs to be hashed before sending
+                password = user.get("passwordBcrypt", "")
+                user["passwordBcrypt"] = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+                user["needsBcrypt"] = False
+        
+        current_config["auth"]["users"] = users
+    
+    current_config["auth"]["disabled"] = disable_auth
+    return current_config
+
 class BackrestService:
     """Service for interacting with Backrest API"""
     
@@ -29,11 +55,11 @@ class BackrestService:
         
         try:
             if method.lower() == 'get':
-                response = requests.get(url, headers=headers, timeout=30)
+                response = http_pool.request('get', url, headers=headers, timeout=30)
             elif method.lower() == 'post':
                 # Log exact payload being sent
                 logger.info(f"Request payload: {json.dumps(data)[:1000]}...")  # Limit for logs
-                response = requests.post(url, json=data, headers=headers, timeout=30)
+                response = http_pool.request('post', url, json=data, headers=headers, timeout=30)
             else:
                 raise ValueError(f"Unsupported HTTP method: {method}")
             
@@ -91,7 +117,8 @@ class BackrestService:
                 "cpuNice": "CPU_DEFAULT"
             },
             "autoUnlock": False,
-            "hooks": []
+            # Report prune/check progress back to us as it happens
+            "hooks": build_hooks(self.server, REPO_HOOK_CONDITIONS)
         }
         
         logger.info(f"Repository data: {json.dumps(data)}")
@@ -128,7 +155,8 @@ class BackrestService:
                 "paths": paths,
                 "excludes": excludes,
                 "iexcludes": [],
-                "hooks": []
+                # Report backup progress back to us as it happens
+                "hooks": build_hooks(self.server, PLAN_HOOK_CONDITIONS)
             }
             
             # Fix the schedule format
@@ -294,7 +322,8 @@ class BackrestService:
             
             # Make a non-blocking request - don't wait for backup to complete
             # Just ensure the request is successfully initiated
-            response = requests.post(
+            response = http_pool.request(
+                'post',
                 url, 
                 json=data, 
                 headers={'Content-Type': 'application/json'},
@@ -335,8 +364,72 @@ class BackrestService:
             logger.exception(f"Error triggering backup: {str(e)}")
             raise
     
-    def get_operations(self, repository_id=None, plan_id=None):
-        """Get operations from Backrest"""
+    def prune_repository(self, repository_id):
+        """Start a prune of a repository; like backups, Backrest holds the request open until it finishes"""
+        url = f"{self.base_url}/v1.Backrest/Prune"
+        logger.info(f"Pruning repository {repository_id} at {url}")
+        
+        try:
+            response = http_pool.request(
+                'post',
+                url,
+                json={"value": repository_id},
+                headers={'Content-Type': 'application/json'},
+                timeout=5  # Short timeout just to start the prune
+            )
+            response.raise_for_status()
+            return {"status": "prune_completed", "repository_id": repository_id}
+        
+        except requests.exceptions.Timeout:
+            # The prune keeps running in Backrest and shows up as an operation
+            logger.info(f"Timeout while pruning {repository_id} - prune likely started")
+            return {"status": "prune_initiated", "repository_id": repository_id}
+
+    def get_repository_stats(self, repository_id):
+        """
+        Have Backrest run `restic stats --mode raw-data` on a repository and
+        return the stats it recorded; totalSize is the repository's size on disk.
+        """
+        url = f"{self.base_url}/v1.Backrest/Stats"
+        logger.info(f"Measuring repository {repository_id} at {url}")
+
+        response = http_pool.request(
+            'post',
+            url,
+            json={"value": repository_id},
+            headers={'Content-Type': 'application/json'},
+            timeout=getattr(settings, 'BACKREST_STATS_TIMEOUT', 600)
+        )
+        response.raise_for_status()
+
+        # Stats answers once the operation finished; the numbers are in the operation log
+        for operation in reversed(self.get_operations(repository_id=repository_id, last_n=20)):
+            stats = (operation.get('operationStats') or {}).get('stats')
+            if stats:
+                return stats
+        return None
+
+    def forget_snapshot(self, repository_id, plan_id, snapshot_id):
+        """
+        Forget one snapshot through Backrest, which runs restic with the repo's
+        own env and flags, takes the repo lock and logs a forget operation.
+        Backrest answers once the forget is done, so the timeout is generous.
+        """
+        url = f"{self.base_url}/v1.Backrest/Forget"
+        logger.info(f"Forgetting snapshot {snapshot_id[:8]} of repository {repository_id}")
+
+        response = http_pool.request(
+            'post',
+            url,
+            json={"repo_id": repository_id, "plan_id": plan_id, "snapshot_id": snapshot_id},
+            headers={'Content-Type': 'application/json'},
+            timeout=getattr(settings, 'BACKREST_FORGET_TIMEOUT', 300)
+        )
+        response.raise_for_status()
+        return {"status": "forgotten", "snapshot_id": snapshot_id}
+
+    def get_operations(self, repository_id=None, plan_id=None, last_n=None):
+        """Get operations from Backrest, optionally only the newest `last_n`"""
         selector = {}
         if repository_id:
             selector['repositoryId'] = repository_id
@@ -344,6 +437,8 @@ class BackrestService:
             selector['planId'] = plan_id
             
         data = {"selector": selector}
+        if last_n:
+            data['lastN'] = last_n
         response = self._make_request('post', "/v1.Backrest/GetOperations", data)
         return response.get('operations', [])
     
@@ -378,7 +473,7 @@ class BackrestService:
             url = f"{self.base_url}{endpoint}"
             try:
                 # Simple ping with empty data
-                response = requests.post(url, json={}, timeout=5)
+                response = http_pool.request('post', url, json={}, timeout=5)
                 results[endpoint] = {
                     "status": response.status_code,
                     "message": response.text[:100] if response.text else "No content"
@@ -403,26 +498,7 @@ class BackrestService:
             logger.warning(f"Error getting current config: {str(e)}")
             current_config = {}
         
-        # Update only the specified fields
-        if instance_id:
-            current_config["instance"] = instance_id
-        
-        if "auth" not in current_config:
-            current_config["auth"] = {}
-        
-        if users is not None:
-            # Ensure all passwords are properly hashed
-            for user in users:
-                if user.get("needsBcrypt") == True:
-                    # This means password needs to be hashed before sending
-                    password = user.get("passwordBcrypt", "")
-                    user["passwordBcrypt"] = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-                    user["needsBcrypt"] = False
-            
-            current_config["auth"]["users"] = users
-        
-        current_config["auth"]["disabled"] = disable_auth
-        
+        current_config = apply_config_changes(current_config, instance_id, users, disable_auth)
         return self._make_request('post', endpoint, current_config)
     
     def get_config(self):
@@ -0,0 +1,19 @@
+# backend/backrest/signals.py
+"""
+Make a tenant due for the operations sync as soon as it gets a new server
+(see backrest/polling.py), instead of waiting out its idle interval.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Server
+
+
+@receiver(post_save, sender=Server)
+def server_saved(sender, instance, created, **kwargs):
+    if created:
+        from .polling import mark_tenant_due
+
+        tenant_id = instance.tenant_id
+        transaction.on_commit(lambda: mark_tenant_due(tenant_id))
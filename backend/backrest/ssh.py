@@ -0,0 +1,281 @@
+# backend/backrest/ssh.py
+"""
+Worker-level pool of persistent paramiko SSH sessions.
+
+Sessions are keyed by server connection details and reused between task
+runs, so a log poll costs one command round trip instead of a full SSH
+handshake. Private keys are decrypted and parsed once and kept in memory;
+no key material is ever written to a temporary file.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+from celery.signals import worker_process_shutdown
+from cryptography.fernet import InvalidToken
+from django.conf import settings
+
+from .instrumentation import record_ssh_command
+
+logger = logging.getLogger(__name__)
+
+_KEY_CLASSES = (paramiko.Ed25519Key, paramiko.ECDSAKey, paramiko.RSAKey)
+
+_pkey_cache = {}
+_pkey_cache_lock = threading.Lock()
+
+
+def _decrypted_key_text(ssh_key):
+    """Private key text for an SSHKey, tolerating keys stored unencrypted"""
+    try:
+        return ssh_key.get_decrypted_key()
+    except InvalidToken:
+        return ssh_key.private_key
+
+
+def load_private_key(ssh_key):
+    """Parse an SSHKey's private key into a paramiko key, cached per process"""
+    cache_key = (ssh_key.pk, hashlib.sha256(ssh_key.private_key.encode()).hexdigest())
+
+    with _pkey_cache_lock:
+        pkey = _pkey_cache.get(cache_key)
+    if pkey is not None:
+        return pkey
+
+    key_text = _decrypted_key_text(ssh_key)
+    last_error = None
+    for key_class in _KEY_CLASSES:
+        try:
+            pkey = key_class.from_private_key(io.StringIO(key_text))
+            break
+        except paramiko.SSHException as e:
+            last_error = e
+    else:
+        raise paramiko.SSHException(f"Unsupported or invalid private key: {last_error}")
+
+    with _pkey_cache_lock:
+        _pkey_cache[cache_key] = pkey
+    return pkey
+
+
+class InstrumentedSSHClient(paramiko.SSHClient):
+    """SSHClient that counts commands against the current task/request budget"""
+
+    def exec_command(self, command, *args, **kwargs):
+        record_ssh_command()
+        return super().exec_command(command, *args, **kwargs)
+
+
+def connect_client(server, timeout=30):
+    """Open a new, unpooled SSHClient for a server using the in-memory key"""
+    client = InstrumentedSSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(
+        hostname=server.hostname,
+        port=server.ssh_port,
+        username=server.ssh_user,
+        pkey=load_private_key(server.ssh_key),
+        timeout=timeout,
+        allow_agent=False,
+        look_for_keys=False,
+    )
+    return client
+
+
+class SSHSessionPool:
+    """Reusable SSH sessions with idle timeout, health checks and a per-host cap"""
+
+    def __init__(self, max_sessions_per_host=None, idle_timeout=None, connect_timeout=30, acquire_timeout=None):
+        self.max_sessions_per_host = max_sessions_per_host or getattr(
+            settings, 'BACKREST_SSH_MAX_SESSIONS_PER_HOST', 2)
+        self.idle_timeout = idle_timeout or getattr(settings, 'BACKREST_SSH_IDLE_TIMEOUT', 300)
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout or getattr(settings, 'BACKREST_SSH_ACQUIRE_TIMEOUT', 120)
+        self._idle = {}     # pool key -> list of (client, last_used)
+        self._in_use = {}   # host key -> number of checked out sessions
+        self._condition = threading.Condition()
+        self._pid = os.getpid()
+
+    def _pool_key(self, server):
+        # Sessions are only reusable with the same credentials
+        return (server.hostname, server.ssh_port, server.ssh_user, server.ssh_key_id)
+
+    def _host_key(self, pool_key):
+        # ...but the session cap applies to the host, whatever the credentials
+        return pool_key[:2]
+
+    def _reset_after_fork(self):
+        # Never reuse transports inherited from a parent process
+        if self._pid != os.getpid():
+            self._idle = {}
+            self._in_use = {}
+            self._pid = os.getpid()
+
+    def _is_healthy(self, client):
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _reserve(self, key, deadline, evicted):
+        """
+        Take a session slot for the key's host, waiting until `deadline`.
+        Returns an idle (client, last_used) to try, or None to connect anew.
+        Idle sessions given up to make room are appended to `evicted`.
+        """
+        host = self._host_key(key)
+        with self._condition:
+            self._reset_after_fork()
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    # The idle session already counts against the host, so it moves straight to in-use
+                    self._in_use[host] = self._in_use.get(host, 0) + 1
+                    return idle.pop()
+
+                if self._in_use.get(host, 0) + self._idle_count(host) < self.max_sessions_per_host:
+                    self._in_use[host] = self._in_use.get(host, 0) + 1
+                    return None
+
+                # At the cap with sessions of other credentials idle: close one to make room
+                client = self._evict_idle(host)
+                if client is not None:
+                    evicted.append(client)
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No SSH session to {host[0]}:{host[1]} became available "
+                        f"within {self.acquire_timeout}s"
+                    )
+                self._condition.wait(timeout=remaining)
+
+    def _idle_count(self, host):
+        return sum(len(idle) for key, idle in self._idle.items() if self._host_key(key) == host)
+
+    def _evict_idle(self, host):
+        for key, idle in self._idle.items():
+            if self._host_key(key) == host and idle:
+                client, _ = idle.pop(0)
+                return client
+        return None
+
+    def _acquire(self, server):
+        key = self._pool_key(server)
+        deadline = time.monotonic() + self.acquire_timeout
+        # Expired sessions of other hosts would otherwise stay open until their own key is used again
+        self.close_idle()
+
+        while True:
+            evicted = []
+            try:
+                candidate = self._reserve(key, deadline, evicted)
+            finally:
+                for client in evicted:
+                    client.close()
+            if candidate is None:
+                break
+            # Health checks do network I/O, so they run outside the lock
+            client, last_used = candidate
+            if time.monotonic() - last_used <= self.idle_timeout and self._is_healthy(client):
+                return key, client
+            client.close()
+            self._release(key, None)
+
+        # Connect outside the lock so one slow host does not block the others
+        try:
+            client = connect_client(server, timeout=self.connect_timeout)
+            logger.info(f"Opened pooled SSH session to {server.hostname}:{server.ssh_port}")
+            return key, client
+        except Exception:
+            self._release(key, None)
+            raise
+
+    def _release(self, key, client, discard=False):
+        host = self._host_key(key)
+        with self._condition:
+            self._in_use[host] = max(self._in_use.get(host, 1) - 1, 0)
+            if client is not None:
+                if discard:
+                    client.close()
+                else:
+                    self._idle.setdefault(key, []).append((client, time.monotonic()))
+            self._condition.notify_all()
+
+    @contextmanager
+    def session(self, server):
+        """Check out a connected SSHClient for `server`, returning it to the pool afterwards"""
+        key, client = self._acquire(server)
+        try:
+            yield client
+        except (paramiko.SSHException, OSError, EOFError):
+            # The transport may be broken - don't hand it out again
+            self._release(key, client, discard=True)
+            raise
+        except BaseException:
+            self._release(key, client)
+            raise
+        else:
+            self._release(key, client)
+
+    def exec_command(self, server, command, timeout=None):
+        """Run one command on a pooled session and return (exit_status, stdout, stderr)"""
+        with self.session(server) as client:
+            stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+            output = stdout.read().decode('utf-8', errors='replace')
+            error = stderr.read().decode('utf-8', errors='replace')
+            exit_status = stdout.channel.recv_exit_status()
+        return exit_status, output, error
+
+    def close_idle(self):
+        """Close sessions that have been idle for longer than the idle timeout, for every host"""
+        now = time.monotonic()
+        expired = []
+        with self._condition:
+            self._reset_after_fork()
+            for key in list(self._idle):
+                keep = []
+                for client, last_used in self._idle[key]:
+                    if now - last_used > self.idle_timeout:
+                        expired.append(client)
+                    else:
+                        keep.append((client, last_used))
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        # Closing talks to the remote end, so it happens outside the lock
+        for client in expired:
+            client.close()
+        return len(expired)
+
+    def close_all(self):
+        """Close every idle session in the pool"""
+        with self._condition:
+            self._reset_after_fork()
+            idle_sessions = [client for idle in self._idle.values() for client, _ in idle]
+            self._idle = {}
+        for client in idle_sessions:
+            client.close()
+
+
+# Shared per-process pool
+ssh_pool = SSHSessionPool()
+
+
+def _close_sessions_on_shutdown(**kwargs):
+    ssh_pool.close_all()
+
+
+# Give the remote sshd slots back when a Celery worker process exits
+worker_process_shutdown.connect(_close_sessions_on_shutdown, weak=False, dispatch_uid='backrest-ssh-pool-shutdown')
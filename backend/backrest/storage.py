@@ -0,0 +1,174 @@
+# backend/backrest/storage.py
+"""
+Storage accounting per repository and per tenant.
+
+Usage is what a repository takes on disk. Snapshots share deduplicated
+data, so adding up their sizes (totalBytesProcessed) counts the same
+bytes over and over; only restic can say how big a repository really is.
+Usage is kept in counters rather than computed on demand:
+
+    BackrestRepository.storage_used_bytes / snapshot_count
+    Tenant.storage_used_bytes / storage_snapshot_count
+
+reconcile_tenant_storage() runs nightly. It measures every repository
+through Backrest's Stats RPC (`restic stats --mode raw-data`, run with the
+repository's own config), stores the result as the repository's base
+usage and records the day in TenantStorageUsage.
+
+Between measurements only deltas are applied: SnapshotReconciler adds the
+data each new snapshot added to the repository (its dataAdded), with one
+UPDATE ... SET x = x + n per counter. Forgetting a snapshot frees nothing
+until a prune, so deletions leave the bytes alone and the next measurement
+picks up whatever a prune reclaimed. Dashboards and the quota check read
+the counters and never scan the snapshot table.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+
+def apply_usage_delta(tenant, repository, bytes_delta, snapshots_delta):
+    """Add a change in bytes/snapshot count to the repository and tenant counters"""
+    from tenants.models import Tenant
+    from .models import BackrestRepository
+
+    if not bytes_delta and not snapshots_delta:
+        return
+
+    with transaction.atomic():
+        BackrestRepository.objects.filter(id=repository.id).update(
+            storage_used_bytes=F('storage_used_bytes') + bytes_delta,
+            snapshot_count=F('snapshot_count') + snapshots_delta,
+        )
+        # An UPDATE rather than tenant.save(): no signals, no lost updates from concurrent syncs
+        Tenant.objects.filter(id=tenant.id).update(
+            storage_used_bytes=F('storage_used_bytes') + bytes_delta,
+            storage_snapshot_count=F('storage_snapshot_count') + snapshots_delta,
+        )
+
+
+def measure_repository(repository):
+    """The repository's size on disk according to Backrest's stats, or None if it couldn't be measured"""
+    from .services import BackrestService
+    from .sync import _as_int
+
+    try:
+        stats = BackrestService(repository.server).get_repository_stats(repository.repository_id)
+    except Exception as e:
+        logger.warning(f"Could not measure repository {repository.name}: {str(e)}")
+        return None
+
+    size = _as_int((stats or {}).get('totalSize'))
+    if size is None:
+        logger.warning(f"Backrest returned no stats for repository {repository.name}")
+    return size
+
+
+def reconcile_tenant_storage(tenant, now=None, measure=True):
+    """
+    Measure the current tenant's repositories, recount their snapshots and
+    record the day.
+
+    Must run inside the tenant's context. A repository that can't be
+    measured keeps its counter (last measurement plus deltas since).
+    Returns the totals and how far the counters had drifted.
+    """
+    from tenants.models import Tenant, TenantStorageUsage
+    from .models import BackrestRepository, BackrestSnapshot
+
+    now = now or timezone.now()
+    counts = dict(
+        BackrestSnapshot.objects.filter(tenant=tenant)
+        .values('repository_id')
+        .annotate(count=Count('id'))
+        .order_by()
+        .values_list('repository_id', 'count')
+    )
+
+    repositories = list(BackrestRepository.objects.filter(tenant=tenant).select_related('server'))
+    # HTTP calls, made before the transaction so no row lock is held while restic runs
+    measured = {}
+    if measure:
+        for repository in repositories:
+            size = measure_repository(repository)
+            if size is not None:
+                measured[repository.id] = size
+
+    remeasured = []
+    recounted = []
+    for repository in repositories:
+        count = counts.get(repository.id, 0)
+        if repository.id in measured:
+            repository.storage_used_bytes = measured[repository.id]
+            repository.storage_measured_at = now
+            repository.snapshot_count = count
+            remeasured.append(repository)
+        elif repository.snapshot_count != count:
+            repository.snapshot_count = count
+            recounted.append(repository)
+
+    with transaction.atomic():
+        previous = Tenant.objects.select_for_update().values_list('storage_used_bytes', flat=True).get(id=tenant.id)
+        if remeasured:
+            BackrestRepository.objects.bulk_update(
+                remeasured, ['storage_used_bytes', 'storage_measured_at', 'snapshot_count']
+            )
+        if recounted:
+            # Only the count: their byte counters may have moved since we read them
+            BackrestRepository.objects.bulk_update(recounted, ['snapshot_count'])
+
+        usage = dict(BackrestRepository.objects.filter(tenant=tenant).values_list('repository_id', 'storage_used_bytes'))
+        used_bytes = sum(usage.values())
+        snapshot_count = sum(counts.values())
+        Tenant.objects.filter(id=tenant.id).update(
+            storage_used_bytes=used_bytes,
+            storage_snapshot_count=snapshot_count,
+            storage_reconciled_at=now,
+        )
+        TenantStorageUsage.objects.update_or_create(
+            tenant_id=tenant.id,
+            date=timezone.localdate(now),
+            defaults={
+                'used_bytes': used_bytes,
+                'snapshot_count': snapshot_count,
+                'repositories': usage,
+            },
+        )
+
+    drift = used_bytes - previous
+    if drift:
+        logger.info(f"Storage usage of tenant {tenant.name} moved by {drift} bytes on measurement")
+    return {
+        'used_bytes': used_bytes,
+        'snapshot_count': snapshot_count,
+        'repositories_measured': len(remeasured),
+        'repositories_unmeasured': len(repositories) - len(remeasured),
+        'drift_bytes': drift,
+    }
+
+
+def quota_status(tenant):
+    """
+    The tenant's usage against max_storage_gb, read straight from the
+    tenant row (request.tenant may come from the tenant cache and be stale).
+    """
+    from tenants.models import Tenant
+
+    used_bytes, max_storage_gb = Tenant.objects.values_list(
+        'storage_used_bytes', 'max_storage_gb'
+    ).get(id=tenant.id)
+    limit_bytes = max_storage_gb * GB
+    return {
+        'used_bytes': used_bytes,
+        'limit_bytes': limit_bytes,
+        'max_storage_gb': max_storage_gb,
+        'percent_used': round(used_bytes * 100 / limit_bytes, 2) if limit_bytes else None,
+        # A limit of 0 means unlimited
+        'exceeded': bool(limit_bytes) and used_bytes >= limit_bytes,
+    }
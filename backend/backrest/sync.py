@@ -0,0 +1,571 @@
+# backend/backrest/sync.py
+"""
+Helpers for mirroring Backrest state into the tenant database.
+
+OperationUpserter takes the remote operation list for one repository and
+writes it with a constant number of queries: one lookup for the operation
+ids we already have, one bulk INSERT for new operations and one bulk
+UPDATE per distinct set of changed fields.
+
+The periodic sync is incremental: each repository remembers the highest
+operation id and modno it has seen, asks Backrest only for its newest
+operations and upserts the ones that are new or were modified. The full
+history is pulled again only every BACKREST_OPERATIONS_FULL_SYNC_INTERVAL
+seconds to catch anything the incremental window missed.
+
+SnapshotReconciler does the same for a repository's snapshot list, and
+also deletes the snapshots that were forgotten on the Backrest side. The
+data new snapshots added goes to the storage counters (see storage.py).
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'failed', 'canceled')
+
+
+def normalize_status(raw_status):
+    """Map a Backrest STATUS_* value onto our status names"""
+    if not raw_status:
+        return 'unknown'
+    status = raw_status.replace('STATUS_', '').lower()
+    if status == 'inprogress':
+        return 'running'
+    if status == 'success':
+        return 'completed'
+    if status == 'error':
+        return 'failed'
+    return status
+
+
+def normalize_type(raw_type):
+    """Map a Backrest TYPE_* value onto our operation type names"""
+    op_type = (raw_type or '').lower().replace('type_', '')
+    return op_type or 'unknown'
+
+
+def normalize_operation(op_data):
+    """
+    Copy of a Backrest operation with the snake_case fields OperationUpserter
+    reads (plan_id, snapshot_id, error) filled in from Backrest's camelCase
+    JSON. Fields that are already set are kept.
+    """
+    op_data = dict(op_data)
+    if not op_data.get('plan_id') and op_data.get('planId'):
+        op_data['plan_id'] = op_data['planId']
+    if not op_data.get('snapshot_id'):
+        indexed = (op_data.get('operationIndexSnapshot') or {}).get('snapshot') or {}
+        snapshot_id = op_data.get('snapshotId') or indexed.get('id')
+        if snapshot_id:
+            op_data['snapshot_id'] = snapshot_id
+    if not op_data.get('error') and op_data.get('displayMessage') and op_data.get('status') == 'STATUS_ERROR':
+        op_data['error'] = op_data['displayMessage']
+    return op_data
+
+
+def _remote_started_at(op_data):
+    start_ms = op_data.get('unixTimeStartMs')
+    try:
+        if start_ms:
+            return datetime.fromtimestamp(int(start_ms) / 1000, tz=dt_timezone.utc)
+    except (TypeError, ValueError):
+        pass
+    return timezone.now()
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def needs_full_operation_sync(repository, now=None):
+    """Whether the repository is due a full reconciliation of its operation history"""
+    if repository.operations_full_sync_at is None:
+        return True
+    interval = getattr(settings, 'BACKREST_OPERATIONS_FULL_SYNC_INTERVAL', 3600)
+    now = now or timezone.now()
+    return (now - repository.operations_full_sync_at).total_seconds() >= interval
+
+
+async def fetch_repo_operations(service, repository, full=False, page_size=None, max_pages=None):
+    """
+    Fetch a repository's operations through an AsyncBackrestService.
+
+    A full fetch returns the whole history. Otherwise we request the newest
+    `page_size` operations and widen the window a page at a time, up to
+    `max_pages`, while every returned operation is still newer than the
+    stored high-water id - i.e. while there may be a backlog we haven't seen.
+    """
+    if full:
+        return await service.get_operations(repository_id=repository.repository_id)
+
+    if page_size is None:
+        page_size = getattr(settings, 'BACKREST_OPERATIONS_PAGE_SIZE', 100)
+    if max_pages is None:
+        max_pages = getattr(settings, 'BACKREST_OPERATIONS_MAX_PAGES', 10)
+
+    high_water_id = repository.operations_high_water_id
+    last_n = page_size
+    for page in range(max_pages):
+        operations = await service.get_operations(repository_id=repository.repository_id, last_n=last_n)
+        if len(operations) < last_n or high_water_id is None:
+            break
+
+        ids = [op_id for op_id in (_as_int(op.get('id')) for op in operations) if op_id is not None]
+        if not ids or min(ids) <= high_water_id:
+            break
+        last_n += page_size
+    else:
+        logger.info(f"Operation backlog for repo {repository.name} exceeds {last_n} entries, "
+                    f"the rest will be picked up by the next sync")
+
+    return operations
+
+
+def changed_operations(repository, operations, full=False):
+    """Operations that are new or modified since the repository's high-water marks"""
+    if full or repository.operations_high_water_id is None:
+        return list(operations)
+
+    changed = []
+    for op_data in operations:
+        op_id = _as_int(op_data.get('id'))
+        modno = _as_int(op_data.get('modno'))
+        if op_id is None or op_id > repository.operations_high_water_id:
+            changed.append(op_data)
+        elif modno is None or repository.operations_high_water_modno is None:
+            changed.append(op_data)
+        elif modno > repository.operations_high_water_modno:
+            changed.append(op_data)
+    return changed
+
+
+def advance_operation_cursor(repository, operations, full=False, now=None):
+    """Record the highest id/modno seen, and the time of a full reconciliation"""
+    update_fields = []
+
+    ids = [op_id for op_id in (_as_int(op.get('id')) for op in operations) if op_id is not None]
+    if ids and (repository.operations_high_water_id is None or max(ids) > repository.operations_high_water_id):
+        repository.operations_high_water_id = max(ids)
+        update_fields.append('operations_high_water_id')
+
+    modnos = [modno for modno in (_as_int(op.get('modno')) for op in operations) if modno is not None]
+    if modnos and (repository.operations_high_water_modno is None
+                   or max(modnos) > repository.operations_high_water_modno):
+        repository.operations_high_water_modno = max(modnos)
+        update_fields.append('operations_high_water_modno')
+
+    if full:
+        repository.operations_full_sync_at = now or timezone.now()
+        update_fields.append('operations_full_sync_at')
+
+    if update_fields:
+        repository.save(update_fields=update_fields)
+
+
+def plan_from_config(tenant, repository, plan_data):
+    """Build an unsaved BackrestPlan from a plan entry of Backrest's config"""
+    from .models import BackrestPlan
+
+    schedule_data = plan_data.get('schedule', {})
+    retention = plan_data.get('retention', {}).get('policyTimeBucketed', {})
+    return BackrestPlan(
+        tenant=tenant,
+        repository=repository,
+        name=plan_data.get('id', '').replace('_', ' ').title(),
+        plan_id=plan_data.get('id'),
+        paths=plan_data.get('paths', []),
+        excludes=plan_data.get('excludes', []),
+        schedule=schedule_data.get('cron', '0 0 31 2 0'),
+        retention_policy={
+            'keep_last': retention.get('keepLastN', 0),
+            'keep_hourly': retention.get('hourly', 0),
+            'keep_daily': retention.get('daily', 0),
+            'keep_weekly': retention.get('weekly', 0),
+            'keep_monthly': retention.get('monthly', 0),
+            'keep_yearly': retention.get('yearly', 0)
+        },
+    )
+
+
+class PlanResolver:
+    """
+    Plan lookups for one sync run.
+
+    The tenant's plans are loaded once. Plans we don't know yet are looked
+    up in the server's Backrest config, fetched at most once per server per
+    run, and created in bulk.
+    """
+
+    def __init__(self, tenant):
+        from .models import BackrestPlan
+
+        self.tenant = tenant
+        self.plans = {plan.plan_id: plan for plan in BackrestPlan.objects.filter(tenant=tenant)}
+        self._configs = {}       # server id -> Backrest config ({} if it could not be fetched)
+        self._unresolved = set() # plan ids that are not in their server's config either
+
+    def _config(self, server):
+        if server.id not in self._configs:
+            from .services import BackrestService
+            try:
+                self._configs[server.id] = BackrestService(server).get_config()
+            except Exception as e:
+                logger.warning(f"Could not fetch config from {server.hostname}: {str(e)}")
+                self._configs[server.id] = {}
+        return self._configs[server.id]
+
+    def resolve_many(self, repository, plan_ids):
+        """Return {plan_id: BackrestPlan} for the given ids, creating missing plans"""
+        from .models import BackrestPlan
+
+        missing = {plan_id for plan_id in plan_ids
+                   if plan_id not in self.plans and plan_id not in self._unresolved}
+        if missing:
+            config = self._config(repository.server)
+            new_plans = [
+                plan_from_config(self.tenant, repository, plan_data)
+                for plan_data in config.get('plans', [])
+                if isinstance(plan_data, dict) and plan_data.get('id') in missing
+            ]
+            if new_plans:
+                # Another worker may have created some of them in the meantime
+                BackrestPlan.objects.bulk_create(new_plans, ignore_conflicts=True)
+                for plan in BackrestPlan.objects.filter(plan_id__in=[plan.plan_id for plan in new_plans]):
+                    self.plans[plan.plan_id] = plan
+                logger.info(f"Created {len(new_plans)} plans from the Backrest config of {repository.server.hostname}")
+            self._unresolved.update(missing - self.plans.keys())
+
+        return {plan_id: self.plans[plan_id] for plan_id in plan_ids if plan_id in self.plans}
+
+
+class OperationUpserter:
+    """Bulk create/update BackrestOperation rows from Backrest's operation list"""
+
+    def __init__(self, tenant, repository, plan_resolver=None, batch_size=500):
+        self.tenant = tenant
+        self.repository = repository
+        # Links new operations to their BackrestPlan; share one across a sync run
+        self.plan_resolver = plan_resolver
+        self.batch_size = batch_size
+
+    def _desired_changes(self, operation, op_data, status, now):
+        """Return {field: value} for the fields that differ from the stored operation"""
+        changes = {}
+        if operation.status != status:
+            changes['status'] = status
+        if status in TERMINAL_STATUSES and not operation.completed_at:
+            changes['completed_at'] = now
+        if op_data.get('snapshot_id') and operation.snapshot_id != op_data['snapshot_id']:
+            changes['snapshot_id'] = op_data['snapshot_id']
+        if op_data.get('stats') and operation.stats != op_data['stats']:
+            changes['stats'] = op_data['stats']
+        if status == 'failed' and op_data.get('error') and operation.error != op_data['error']:
+            changes['error'] = op_data['error']
+        return changes
+
+    def _provisional_operations(self):
+        """Operations recorded from hook events that the poll hasn't matched to a real id yet"""
+        from .hooks import PROVISIONAL_PREFIX
+        from .models import BackrestOperation
+
+        return list(
+            BackrestOperation.objects.filter(
+                repository=self.repository, operation_id__startswith=PROVISIONAL_PREFIX
+            ).select_related('plan')
+        )
+
+    def _adopt(self, provisional, op_data):
+        """
+        Pop the provisional operation that `op_data` is the real version of:
+        same type and plan, started closest in time within the match window.
+        """
+        window = getattr(settings, 'BACKREST_HOOK_MATCH_WINDOW', 600)
+        op_type = normalize_type(op_data.get('type'))
+        plan_id = op_data.get('plan_id') or None
+        started_at = _remote_started_at(op_data)
+
+        best = None
+        best_distance = None
+        for operation in provisional:
+            if operation.operation_type != op_type:
+                continue
+            if (operation.plan.plan_id if operation.plan else None) != plan_id:
+                continue
+            distance = abs((operation.started_at - started_at).total_seconds()) if operation.started_at else window
+            if distance <= window and (best is None or distance < best_distance):
+                best, best_distance = operation, distance
+        if best is not None:
+            provisional.remove(best)
+        return best
+
+    def _new_operation(self, op_id, op_data, status, now, plans):
+        from .models import BackrestOperation
+
+        return BackrestOperation(
+            tenant=self.tenant,
+            repository=self.repository,
+            plan=plans.get(op_data.get('plan_id')),
+            operation_id=op_id,
+            operation_type=normalize_type(op_data.get('type')),
+            status=status,
+            started_at=_remote_started_at(op_data),
+            completed_at=now if status in TERMINAL_STATUSES else None,
+            snapshot_id=op_data.get('snapshot_id') or None,
+            stats=op_data.get('stats') or None,
+            error=op_data.get('error') if status == 'failed' else None,
+        )
+
+    def upsert(self, remote_ops):
+        """
+        Apply a list of remote operations.
+
+        Returns a dict with added, updated and unchanged counts, plus
+        completed for operations that reached a terminal state in this run.
+        New operations that a hook event already recorded under a
+        provisional id take over that row instead of adding a second one.
+        """
+        from .models import BackrestOperation
+
+        # Last entry wins if Backrest reports the same id twice
+        by_id = {}
+        for op_data in remote_ops:
+            op_id = op_data.get('id')
+            if op_id:
+                by_id[str(op_id)] = normalize_operation(op_data)
+
+        existing = BackrestOperation.objects.in_bulk(list(by_id.keys()), field_name='operation_id')
+
+        now = timezone.now()
+        new_ops = []
+        to_update = defaultdict(list)  # frozenset of changed fields -> operations
+        result = {'added': 0, 'updated': 0, 'unchanged': 0, 'completed': 0}
+
+        for op_id, op_data in by_id.items():
+            status = normalize_status(op_data.get('status'))
+            operation = existing.get(op_id)
+
+            if operation is None:
+                new_ops.append((op_id, op_data, status))
+                if status in TERMINAL_STATUSES:
+                    result['completed'] += 1
+                continue
+
+            changes = self._desired_changes(operation, op_data, status, now)
+            if not changes:
+                result['unchanged'] += 1
+                continue
+
+            if 'completed_at' in changes:
+                result['completed'] += 1
+            for field, value in changes.items():
+                setattr(operation, field, value)
+            to_update[frozenset(changes)].append(operation)
+
+        if new_ops:
+            provisional = self._provisional_operations()
+            unmatched = []
+            for op_id, op_data, status in new_ops:
+                operation = self._adopt(provisional, op_data) if provisional else None
+                if operation is None:
+                    unmatched.append((op_id, op_data, status))
+                    continue
+                changes = self._desired_changes(operation, op_data, status, now)
+                changes['operation_id'] = op_id
+                changes['started_at'] = _remote_started_at(op_data)
+                for field, value in changes.items():
+                    setattr(operation, field, value)
+                to_update[frozenset(changes)].append(operation)
+            new_ops = unmatched
+
+        plans = {}
+        if new_ops and self.plan_resolver:
+            plan_ids = {op_data.get('plan_id') for _, op_data, _ in new_ops if op_data.get('plan_id')}
+            plans = self.plan_resolver.resolve_many(self.repository, plan_ids)
+
+        to_create = [self._new_operation(op_id, op_data, status, now, plans) for op_id, op_data, status in new_ops]
+        if to_create:
+            BackrestOperation.objects.bulk_create(to_create, batch_size=self.batch_size)
+            result['added'] = len(to_create)
+
+        for fields, operations in to_update.items():
+            BackrestOperation.objects.bulk_update(operations, sorted(fields), batch_size=self.batch_size)
+            result['updated'] += len(operations)
+
+        logger.info(
+            f"Synced operations for repo {self.repository.name}: "
+            f"{result['added']} added, {result['updated']} updated, {result['unchanged']} unchanged"
+        )
+        return result
+
+
+def _snapshot_time(snapshot_data):
+    """Snapshot time from either the ISO `time` or Backrest's unixTimeMs"""
+    raw_time = snapshot_data.get('time')
+    if isinstance(raw_time, str):
+        parsed = parse_datetime(raw_time)
+        if parsed is not None:
+            return parsed
+    unix_ms = _as_int(snapshot_data.get('unixTimeMs'))
+    if unix_ms:
+        return datetime.fromtimestamp(unix_ms / 1000, tz=dt_timezone.utc)
+    return None
+
+
+def snapshot_fields(snapshot_data):
+    """Map one remote snapshot onto BackrestSnapshot field values (plan excluded)"""
+    summary = snapshot_data.get('summary') or snapshot_data.get('snapshotSummary') or {}
+    size = snapshot_data.get('size')
+    if size is None:
+        size = summary.get('totalBytesProcessed')
+    file_count = snapshot_data.get('fileCount')
+    if file_count is None:
+        file_count = summary.get('totalFilesProcessed')
+    return {
+        'time': _snapshot_time(snapshot_data),
+        'hostname': snapshot_data.get('hostname', ''),
+        'username': snapshot_data.get('username', ''),
+        'summary': summary,
+        'size_bytes': _as_int(size) or 0,
+        'file_count': _as_int(file_count) or 0,
+    }
+
+
+def snapshot_data_added(summary):
+    """Bytes a snapshot added to its repository, compressed when restic reports that"""
+    for key in ('dataAddedPacked', 'dataAdded'):
+        value = _as_int((summary or {}).get(key))
+        if value is not None:
+            return value
+    return 0
+
+
+class SnapshotReconciler:
+    """
+    Mirror a repository's remote snapshot list into BackrestSnapshot.
+
+    One query loads the stored snapshots, then new ones are bulk inserted,
+    changed ones bulk updated (grouped by changed fields, like
+    OperationUpserter) and the ones Backrest no longer lists are deleted in
+    a single DELETE. The data the new snapshots added and the change in
+    snapshot count go to the repository and tenant storage counters in the
+    same transaction.
+    """
+
+    COMPARED_FIELDS = ('time', 'hostname', 'username', 'summary', 'size_bytes', 'file_count')
+
+    def __init__(self, tenant, repository, plan_resolver=None, batch_size=500):
+        self.tenant = tenant
+        self.repository = repository
+        self.plan_resolver = plan_resolver
+        self.batch_size = batch_size
+
+    def reconcile(self, remote_snapshots, delete_missing=True):
+        """
+        Apply the full remote snapshot list of the repository.
+
+        Returns added, updated, unchanged and deleted counts, and
+        bytes_delta, the data the new snapshots added. An empty
+        remote list never deletes anything, so a Backrest hiccup that
+        returns no snapshots can't wipe the table.
+        """
+        from .models import BackrestSnapshot
+        from .storage import apply_usage_delta
+
+        remote = {}
+        for snapshot_data in remote_snapshots:
+            snapshot_id = snapshot_data.get('id')
+            if snapshot_id:
+                remote[str(snapshot_id)] = snapshot_data
+
+        existing = {
+            snapshot.snapshot_id: snapshot
+            for snapshot in BackrestSnapshot.objects.filter(repository=self.repository)
+        }
+
+        plans = {}
+        if self.plan_resolver:
+            plan_ids = {data.get('planId') for data in remote.values() if data.get('planId')}
+            if plan_ids:
+                plans = self.plan_resolver.resolve_many(self.repository, plan_ids)
+
+        result = {'added': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'bytes_delta': 0}
+        bytes_delta = 0
+        to_create = []
+        to_update = defaultdict(list)  # frozenset of changed fields -> snapshots
+
+        for snapshot_id, snapshot_data in remote.items():
+            fields = snapshot_fields(snapshot_data)
+            plan = plans.get(snapshot_data.get('planId'))
+            snapshot = existing.get(snapshot_id)
+
+            if snapshot is None:
+                if fields['time'] is None:
+                    logger.warning(f"Skipping snapshot {snapshot_id} of repo {self.repository.name} without a time")
+                    continue
+                to_create.append(BackrestSnapshot(
+                    tenant=self.tenant,
+                    repository=self.repository,
+                    plan=plan,
+                    snapshot_id=snapshot_id,
+                    **fields,
+                ))
+                bytes_delta += snapshot_data_added(fields['summary'])
+                continue
+
+            changes = {
+                field: fields[field] for field in self.COMPARED_FIELDS
+                if fields[field] is not None and getattr(snapshot, field) != fields[field]
+            }
+            if plan is not None and snapshot.plan_id != plan.id:
+                changes['plan'] = plan
+            if not changes:
+                result['unchanged'] += 1
+                continue
+            for field, value in changes.items():
+                setattr(snapshot, field, value)
+            to_update[frozenset(changes)].append(snapshot)
+
+        vanished = [snapshot for snapshot_id, snapshot in existing.items() if snapshot_id not in remote]
+        if vanished and delete_missing and not remote:
+            logger.warning(
+                f"Backrest listed no snapshots for repo {self.repository.name}, "
+                f"keeping the {len(vanished)} stored ones"
+            )
+            vanished = []
+        elif not delete_missing:
+            vanished = []
+
+        with transaction.atomic():
+            if to_create:
+                # ignore_conflicts covers a concurrent sync of the same repository
+                BackrestSnapshot.objects.bulk_create(to_create, batch_size=self.batch_size, ignore_conflicts=True)
+                result['added'] = len(to_create)
+
+            for fields, snapshots in to_update.items():
+                BackrestSnapshot.objects.bulk_update(snapshots, sorted(fields), batch_size=self.batch_size)
+                result['updated'] += len(snapshots)
+
+            if vanished:
+                result['deleted'], _ = BackrestSnapshot.objects.filter(
+                    id__in=[snapshot.id for snapshot in vanished]
+                ).delete()
+                # Forgotten data stays on disk until a prune; the nightly measurement sees that
+
+            apply_usage_delta(self.tenant, self.repository, bytes_delta, result['added'] - len(vanished))
+            result['bytes_delta'] = bytes_delta
+
+        logger.info(
+            f"Synced snapshots for repo {self.repository.name}: {result['added']} added, "
+            f"{result['updated']} updated, {result['deleted']} deleted, {result['unchanged']} unchanged"
+        )
+        return result
@@ -0,0 +1,158 @@
+# backend/backrest/tasklogs.py
+"""
+Incremental export of Backrest's SQLite tasklogs.
+
+The SQLite files stay on the server. A short python3 script runs there,
+selects only the rows newer than the per-file high-water mark and prints
+them as newline-delimited JSON, which we read from the SSH channel line by
+line and pass to the bulk ingester. Files whose mtime and size have not
+changed since the last complete export are skipped without a query.
+"""
+import json
+import logging
+import os
+import shlex
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TASKLOG_DIR = "/opt/backrest/data/tasklogs"
+CURSOR_CONSUMER = 'tasklog-export'
+
+# Runs on the Backrest host. argv: path, high-water timestamp ("-" for none), row limit.
+# With no high-water mark only the newest rows are exported, like the old full-file import.
+EXPORT_SCRIPT = r'''
+import json, sqlite3, sys
+path, since, limit = sys.argv[1], sys.argv[2], int(sys.argv[3])
+conn = sqlite3.connect("file:" + path + "?mode=ro", uri=True)
+cols = "timestamp, level, message, logger, error"
+if since == "-":
+    rows = conn.execute("SELECT " + cols + " FROM (SELECT " + cols + " FROM logs ORDER BY timestamp DESC LIMIT ?) ORDER BY timestamp", (limit,))
+else:
+    rows = conn.execute("SELECT " + cols + " FROM logs WHERE timestamp >= ? ORDER BY timestamp LIMIT ?", (float(since), limit))
+out = sys.stdout
+for row in rows:
+    out.write(json.dumps(row) + "\n")
+out.flush()
+'''
+
+
+def list_tasklog_files(client, directory=TASKLOG_DIR):
+    """Return [(path, mtime, size)] for the tasklog databases on the server"""
+    cmd = f"stat -Lc '%Y %s %n' {shlex.quote(directory)}/*.sqlite 2>/dev/null"
+    stdin, stdout, stderr = client.exec_command(cmd)
+
+    files = []
+    for line in stdout.read().decode('utf-8', errors='replace').splitlines():
+        parts = line.split(' ', 2)
+        if len(parts) != 3:
+            continue
+        try:
+            files.append((parts[2], int(parts[0]), int(parts[1])))
+        except ValueError:
+            continue
+    return files
+
+
+def _export_command(path, since, limit):
+    since_arg = repr(since.timestamp()) if since else '-'
+    return f"python3 -c {shlex.quote(EXPORT_SCRIPT)} {shlex.quote(path)} {since_arg} {int(limit)}"
+
+
+def _stream_rows(stdout):
+    """Yield parsed rows from the exporter's NDJSON output as they arrive"""
+    for line in stdout:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            logger.debug(f"Could not parse tasklog row: {line[:100]}...")
+
+
+def export_tasklog(tenant, server, client, path, mtime, size, limit=None):
+    """
+    Ingest the rows of one tasklog database added since the last export.
+
+    Returns the number of new BackrestLog rows. The cursor records the
+    file's mtime and size only once the export caught up, so a file that
+    had more than `limit` new rows is continued on the next run.
+    """
+    from .ingest import ingest_log_entries
+    from .models import BackrestLogCursor
+
+    if limit is None:
+        limit = getattr(settings, 'BACKREST_TASKLOG_EXPORT_LIMIT', 5000)
+
+    cursor, created = BackrestLogCursor.objects.get_or_create(
+        server=server,
+        path=path,
+        consumer=CURSOR_CONSUMER,
+        defaults={'tenant_id': server.tenant_id},
+    )
+    if cursor.mtime == mtime and cursor.size == size:
+        logger.debug(f"Tasklog {path} on {server.hostname} unchanged, skipping")
+        return 0
+
+    source = f"tasklog/{os.path.basename(path)}"
+    seen = {'rows': 0, 'newest': cursor.last_timestamp}
+
+    def entries(stdout):
+        for row in _stream_rows(stdout):
+            try:
+                timestamp, level, message, logger_name, error = row
+                entry_time = datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+            except (TypeError, ValueError) as row_error:
+                logger.debug(f"Skipping malformed tasklog row: {str(row_error)}")
+                continue
+
+            seen['rows'] += 1
+            if seen['newest'] is None or entry_time > seen['newest']:
+                seen['newest'] = entry_time
+            yield {
+                'timestamp': entry_time,
+                'level': level,
+                'message': message,
+                'logger_name': logger_name,
+                'error': error,
+                'source': source,
+            }
+
+    stdin, stdout, stderr = client.exec_command(_export_command(path, cursor.last_timestamp, limit))
+    # Rows at exactly the high-water mark are selected again and dropped by the content hash
+    logs_added = ingest_log_entries(tenant, server, entries(stdout))
+
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        error = stderr.read().decode('utf-8', errors='replace')
+        raise Exception(f"Tasklog export failed with status {exit_status}: {error[:200]}")
+
+    cursor.last_timestamp = seen['newest']
+    update_fields = ['last_timestamp', 'updated_at']
+    if seen['rows'] < limit:
+        cursor.mtime = mtime
+        cursor.size = size
+        update_fields += ['mtime', 'size']
+    cursor.save(update_fields=update_fields)
+
+    logger.info(f"Exported {seen['rows']} tasklog rows ({logs_added} new) from {path} on {server.hostname}")
+    return logs_added
+
+
+def export_tasklogs(tenant, server, client):
+    """Incrementally ingest every tasklog database on a server"""
+    files = list_tasklog_files(client)
+    if not files:
+        logger.info(f"No tasklog SQLite files found on server {server.hostname}")
+        return 0
+
+    logs_added = 0
+    for path, mtime, size in files:
+        try:
+            logs_added += export_tasklog(tenant, server, client, path, mtime, size)
+        except Exception as e:
+            logger.error(f"Error processing SQLite file {os.path.basename(path)}: {str(e)}")
+    return logs_added
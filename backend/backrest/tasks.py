@@ -6,135 +6,172 @@ from django_tenants.utils import tenant_context
 from django.db import connection
 from datetime import timedelta
 import json
-import paramiko
-import tempfile
-import os
 import re
-import croniter
 
 logger = logging.getLogger(__name__)
 
 @shared_task
 def sync_backrest_operations():
-    """Improved sync to catch scheduled operations"""
+    """
+    Dispatch the operations sync as one child task per tenant with servers due for a poll.
+
+    Runs on a short beat interval; each server's own next_poll_at decides
+    whether it is actually polled (see backrest/polling.py). The children
+    run as a chord so the per-tenant results are merged back into a single
+    {tenant: {...}} dict by collect_sync_results.
+    """
     from tenants.models import Tenant
-    from datetime import datetime, timedelta
+    from celery import chord
+    from .polling import due_server_ids, due_tenant_ids, refresh_tenant_next_poll
     
-    logger.info("Starting improved Backrest operations sync")
-    results = {}
+    now = timezone.now()
+    # One query over the public tenants table; only due tenants' schemas are entered
+    tenant_ids = due_tenant_ids(now)
+    if not tenant_ids:
+        return {}
     
-    for tenant in Tenant.objects.filter(is_active=True).exclude(schema_name='public'):
+    due = {}
+    for tenant in Tenant.objects.filter(id__in=tenant_ids):
         try:
             with tenant_context(tenant):
-                from .models import BackrestRepository, BackrestOperation, BackrestPlan
-                
-                repos = BackrestRepository.objects.filter(tenant=tenant)
-                operations_added = 0
-                operations_updated = 0
-                
-                for repo in repos:
-                    backrest_service = BackrestService(repo.server)
-                    
-                    try:
-                        # Get ALL operations from Backrest for this repo
-                        backrest_ops = backrest_service.get_operations(repository_id=repo.repository_id)
-                        
-                        # Process each operation
-                        for op_data in backrest_ops:
-                            op_id = op_data.get('id')
-                            if not op_id:
-                                continue
-                                
-                            # Determine operation type
-                            op_type = op_data.get('type', '').lower().replace('type_', '')
-                            if not op_type:
-                                op_type = 'unknown'
-                                
-                            # Determine operation status
-                            status = 'unknown'
-                            raw_status = op_data.get('status', '')
-                            if raw_status:
-                                status = raw_status.replace('STATUS_', '').lower()
-                                if status == 'inprogress':
-                                    status = 'running'
-                                elif status == 'success':
-                                    status = 'completed'
-                            
-                            # Get plan if available
-                            plan = None
-                            plan_id = op_data.get('plan_id')
-                            if plan_id:
-                                try:
-                                    plan = BackrestPlan.objects.get(plan_id=plan_id)
-                                except BackrestPlan.DoesNotExist:
-                                    # Try to create the plan in the database
-                                    try:
-                                        config = backrest_service.get_config()
-                                        for plan_data in config.get('plans', []):
-                                            if plan_data.get('id') == plan_id:
-                                                plan = BackrestPlan.objects.create(
-                                                    tenant=tenant,
-                                                    repository=repo,
-                                                    name=plan_id.replace('_', ' ').title(),
-                                                    plan_id=plan_id,
-                                                    paths=','.join(plan_data.get('paths', [])),
-                                                    excludes=','.join(plan_data.get('excludes', []))
-                                                )
-                                                break
-                                    except Exception as plan_error:
-                                        logger.warning(f"Could not create plan: {str(plan_error)}")
-                            
-                            # Check for existing operation
-                            try:
-                                operation = BackrestOperation.objects.get(operation_id=op_id)
-                                
-                                # Update if status changed
-                                if operation.status != status:
-                                    operation.status = status
-                                    
-                                    # Set completion time if newly completed
-                                    if status in ['completed', 'failed', 'canceled'] and not operation.completed_at:
-                                        operation.completed_at = timezone.now()
-                                        
-                                    # Update other fields
-                                    if 'snapshot_id' in op_data and op_data['snapshot_id']:
-                                        operation.snapshot_id = op_data['snapshot_id']
-                                    if 'stats' in op_data and op_data['stats']:
-                                        operation.stats = op_data['stats']
-                                    
-                                    operation.save()
-                                    operations_updated += 1
-                                
-                            except BackrestOperation.DoesNotExist:
-                                # Create new operation
-                                operation, is_new = create_or_update_operation(
-                                    tenant=tenant,
-                                    repository=repo,
-                                    plan=plan,  
-                                    op_data=op_data,
-                                    op_type=op_type,
-                                    status=status
-                                )
+                server_ids = due_server_ids(now)
+                if not server_ids:
+                    # The tenant's marker was stale (e.g. a server was deleted)
+                    refresh_tenant_next_poll(tenant.id, now)
+            if server_ids:
+                due[tenant.id] = server_ids
+        except Exception as e:
+            logger.error(f"Error finding due servers for tenant {tenant.name}: {str(e)}")
+    
+    if not due:
+        logger.debug("No servers due for an operations sync")
+        return {}
+    
+    logger.info(f"Dispatching Backrest operations sync for {sum(len(ids) for ids in due.values())} "
+                f"servers in {len(due)} tenants")
+    result = chord(
+        sync_tenant_operations.s(tenant_id, server_ids) for tenant_id, server_ids in due.items()
+    )(collect_sync_results.s())
+    
+    return {"status": "dispatched", "tenants": len(due), "result_id": result.id}
 
-                                if is_new:
-                                    operations_added += 1
-                                else:
-                                    operations_updated += 1
-                                
-                    except Exception as repo_error:
-                        logger.error(f"Error processing repo {repo.name}: {str(repo_error)}")
-                
-                results[tenant.name] = {
-                    "status": "success", 
-                    "operations_added": operations_added,
-                    "operations_updated": operations_updated
-                }
-                
+@shared_task
+def collect_sync_results(tenant_results):
+    """Merge the per-tenant results of a sync chord into one dict"""
+    results = {}
+    for tenant_result in tenant_results:
+        if tenant_result:
+            results.update(tenant_result)
+    
+    logger.info(f"Backrest operations sync finished for {len(results)} tenants")
+    return results
+
+@shared_task
+def sync_tenant_operations(tenant_id, server_ids=None):
+    """Sync Backrest operations for a single tenant, at most once at a time"""
+    from tenants.models import Tenant
+    from django.conf import settings
+    from .locks import single_flight
+    
+    try:
+        tenant = Tenant.objects.get(id=tenant_id)
+    except Tenant.DoesNotExist:
+        logger.warning(f"Tenant {tenant_id} no longer exists, skipping operations sync")
+        return {}
+    
+    lock_timeout = getattr(settings, 'BACKREST_SYNC_LOCK_TIMEOUT', 300)
+    with single_flight(f"backrest:sync-operations:{tenant.id}", timeout=lock_timeout) as acquired:
+        if not acquired:
+            return {tenant.name: {"status": "skipped", "message": "Sync already in progress"}}
+        
+        try:
+            with tenant_context(tenant):
+                return {tenant.name: _sync_tenant_operations(tenant, server_ids)}
         except Exception as e:
             logger.exception(f"Error processing tenant {tenant.name}")
-            results[tenant.name] = {"status": "error", "error": str(e)}
+            return {tenant.name: {"status": "error", "error": str(e)}}
+
+def _sync_tenant_operations(tenant, server_ids=None):
+    """
+    Pull operations for the current tenant's repositories into the database.
+
+    Only repositories on `server_ids` are synced when given. Afterwards the
+    polled servers get their next poll time from their activity.
+    """
+    from .models import BackrestRepository
+    from .async_service import fan_out
+    from .polling import schedule_next_polls
+    from .sync import (
+        OperationUpserter, PlanResolver, advance_operation_cursor, changed_operations,
+        fetch_repo_operations, needs_full_operation_sync,
+    )
     
-    return results
+    repos = BackrestRepository.objects.filter(tenant=tenant).select_related('server')
+    if server_ids is not None:
+        repos = repos.filter(server_id__in=server_ids)
+    repos = list(repos)
+    changed_servers = set()
+    repos_with_new_data = []
+    operations_added = 0
+    operations_updated = 0
+    operations_unchanged = 0
+    
+    # Most runs only look at each repo's newest operations; the whole history
+    # is reconciled on a slower cadence
+    now = timezone.now()
+    full_sync = {repo.id: needs_full_operation_sync(repo, now) for repo in repos}
+    
+    # Poll every repo's server concurrently, then apply the results one repo at a time
+    remote_operations = fan_out(
+        (repo.id, repo.server,
+         lambda service, repo=repo: fetch_repo_operations(service, repo, full=full_sync[repo.id]))
+        for repo in repos
+    )
+    
+    # Plans are loaded once and remote configs fetched at most once per server
+    plan_resolver = PlanResolver(tenant)
+    
+    for repo in repos:
+        try:
+            # Operations fetched from Backrest for this repo
+            backrest_ops = remote_operations[repo.id]
+            if isinstance(backrest_ops, Exception):
+                raise backrest_ops
+            
+            changed_ops = changed_operations(repo, backrest_ops, full=full_sync[repo.id])
+            result = OperationUpserter(tenant, repo, plan_resolver=plan_resolver).upsert(changed_ops)
+            operations_added += result['added']
+            operations_updated += result['updated']
+            operations_unchanged += result['unchanged'] + len(backrest_ops) - len(changed_ops)
+            if result['added'] or result['updated']:
+                changed_servers.add(repo.server_id)
+            if result['completed']:
+                # Finished backups/forgets/prunes change the snapshot list, and with it the storage counters
+                repos_with_new_data.append(repo.id)
+            
+            advance_operation_cursor(repo, backrest_ops, full=full_sync[repo.id], now=now)
+                    
+        except Exception as repo_error:
+            logger.error(f"Error processing repo {repo.name}: {str(repo_error)}")
+    
+    polled_servers = server_ids if server_ids is not None else list({repo.server_id for repo in repos})
+    try:
+        schedule_next_polls(polled_servers, changed_servers, now=now)
+    except Exception as schedule_error:
+        logger.error(f"Error scheduling next polls: {str(schedule_error)}")
+    
+    for repo_id in repos_with_new_data:
+        try:
+            sync_repository_snapshots.delay(tenant.id, repo_id)
+        except Exception as queue_error:
+            logger.error(f"Error queueing snapshot sync for repo {repo_id}: {str(queue_error)}")
+    
+    return {
+        "status": "success", 
+        "operations_added": operations_added,
+        "operations_updated": operations_updated,
+        "operations_unchanged": operations_unchanged
+    }
 
 @shared_task
 def process_backrest_logs():
@@ -148,44 +185,41 @@ def process_backrest_logs():
     for tenant in Tenant.objects.filter(is_active=True).exclude(schema_name='public'):
         try:
             with tenant_context(tenant):
-                from .models import BackrestRepository, BackrestOperation, Server
+                from .models import BackrestOperation
                 
-                # Get all running operations
-                running_ops = BackrestOperation.objects.filter(
-                    status='running', 
-                    completed_at__isnull=True
+                # Get all running operations, with everything the loop below touches, in one query
+                running_ops = list(
+                    BackrestOperation.objects.filter(
+                        status='running', 
+                        completed_at__isnull=True
+                    ).select_related('plan', 'repository__server__ssh_key')
                 )
                 
-                if not running_ops.exists():
+                if not running_ops:
                     logger.info(f"No running operations found for tenant {tenant.name}")
                     results[tenant.name] = {"status": "skipped", "message": "No running operations"}
                     continue
                     
-                logger.info(f"Processing {running_ops.count()} running operations for tenant {tenant.name}")
+                logger.info(f"Processing {len(running_ops)} running operations for tenant {tenant.name}")
                 
-                # Get unique servers that need log processing
-                server_ids = set()
+                # Group operations by server, then by plan name for easier matching
+                servers = {}
+                ops_by_server = {}
                 for op in running_ops:
-                    if op.repository and op.repository.server:
-                        server_ids.add(op.repository.server.id)
+                    server = op.repository.server
+                    servers[server.id] = server
+                    plans = ops_by_server.setdefault(server.id, {})
+                    if op.plan:
+                        plans[op.plan.plan_id] = op
                 
                 operations_updated = 0
                 
                 # Process each server
-                for server_id in server_ids:
-                    server = Server.objects.get(id=server_id)
+                for server_id, server in servers.items():
                     logger.info(f"Processing logs from server {server.hostname}")
                     
                     try:
-                        # Get relevant operations for this server
-                        server_ops = running_ops.filter(repository__server=server)
-                        ops_by_plan = {}
-                        
-                        # Group operations by plan name for easier matching
-                        for op in server_ops:
-                            if op.plan:
-                                plan_name = op.plan.plan_id
-                                ops_by_plan[plan_name] = op
+                        ops_by_plan = ops_by_server[server_id]
                         
                         # Fetch and process logs
                         log_entries = fetch_backrest_logs(server)
@@ -210,52 +244,13 @@ def process_backrest_logs():
     return results
 
 def fetch_backrest_logs(server):
-    """Fetch backrest logs from the server"""
+    """Fetch backrest log entries written since the last poll of this server"""
+    from .ssh import ssh_pool
+    from .logtail import read_new_entries
+    
     try:
-        log_entries = []
-        
-        # Create temporary key file
-        with tempfile.NamedTemporaryFile(delete=False, mode='w') as key_file:
-            key_path = key_file.name
-            key_file.write(server.ssh_key.private_key)
-        
-        # Set proper permissions
-        os.chmod(key_path, 0o600)
-        
-        # Connect with paramiko
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(
-            hostname=server.hostname,
-            port=server.ssh_port,
-            username=server.ssh_user,
-            key_filename=key_path,
-            timeout=30
-        )
-        
-        # Get the last 1000 lines from the log file (adjust as needed)
-        cmd = "tail -n 1000 /opt/backrest/data/processlogs/backrest.log"
-        stdin, stdout, stderr = client.exec_command(cmd)
-        
-        # Read log lines
-        log_data = stdout.read().decode('utf-8')
-        
-        # Clean up
-        client.close()
-        os.unlink(key_path)
-        
-        # Split into lines and parse JSON
-        for line in log_data.strip().split('\n'):
-            if not line:
-                continue
-                
-            try:
-                entry = json.loads(line)
-                log_entries.append(entry)
-            except json.JSONDecodeError:
-                logger.warning(f"Could not parse log line: {line[:100]}...")
-        
-        return log_entries
+        with ssh_pool.session(server) as client:
+            return read_new_entries(server, client, consumer='operation-status')
         
     except Exception as e:
         logger.exception(f"Error fetching logs from server {server.hostname}: {str(e)}")
@@ -335,103 +330,49 @@ def process_log_entry(entry, ops_by_plan):
     return operations_updated
 
 @shared_task
-def manage_monthly_retention():
+def manage_monthly_retention(dry_run=False):
     """
     Monthly task that keeps only the most recent full backup from the previous month
     and removes all other backups from that month.
+    
+    Repositories of every tenant go through one RetentionEngine run, so they
+    are processed concurrently (bounded per Backrest server) with a single
+    batched forget per repository.
     """
     from tenants.models import Tenant
-    from datetime import datetime
-    import calendar
+    from .models import BackrestRepository
+    from .retention import RetentionEngine
     
     logger.info("Starting monthly backup retention management")
     results = {}
+    jobs = []
     
-    # Current date information
-    now = timezone.now()
-    current_month = now.month
-    current_year = now.year
-    
-    # Calculate previous month
-    if current_month == 1:
-        previous_month = 12
-        previous_year = current_year - 1
-    else:
-        previous_month = current_month - 1
-        previous_year = current_year
-    
-    # Format for tag matching
-    previous_month_tag = f"month-{previous_year}-{previous_month:02d}"
-    
-    # Process each tenant
+    # Load everything the worker threads need up front; they don't touch the database
     for tenant in Tenant.objects.filter(is_active=True).exclude(schema_name='public'):
         try:
             with tenant_context(tenant):
-                from .models import BackrestRepository, BackrestPlan
-                from .services import BackrestService
-                
-                repos = BackrestRepository.objects.all()
-                for repo in repos:
-                    try:
-                        # Get the backrest service for this repository
-                        backrest_service = BackrestService(repo.server)
-                        
-                        # 1. Identify snapshots from previous month with "full-backup" tag
-                        snapshots = backrest_service.get_snapshots(repo.repository_id)
-                        
-                        full_snapshots = []
-                        for snapshot in snapshots:
-                            tags = snapshot.get('tags', [])
-                            if (previous_month_tag in tags and 
-                                "full-backup" in tags and 
-                                "monday-backup" in tags):
-                                full_snapshots.append(snapshot)
-                        
-                        # Sort by time to find the last full backup of the month
-                        if full_snapshots:
-                            # Sort by timestamp (newest first)
-                            sorted_snapshots = sorted(
-                                full_snapshots, 
-                                key=lambda s: s.get('time', ''), 
-                                reverse=True
-                            )
-                            
-                            # The latest full backup from previous month
-                            latest_full = sorted_snapshots[0]
-                            
-                            # 2. Keep this snapshot but forget the others from previous month
-                            for snapshot in snapshots:
-                                tags = snapshot.get('tags', [])
-                                snapshot_id = snapshot.get('id')
-                                
-                                # If it's from the previous month but not the latest full backup
-                                if (previous_month_tag in tags and 
-                                    snapshot_id != latest_full.get('id')):
-                                    
-                                    logger.info(f"Forgetting snapshot {snapshot_id} " 
-                                                f"from previous month {previous_month_tag}")
-                                    
-                                    # Forget this snapshot
-                                    try:
-                                        backrest_service.forget_snapshot(
-                                            repo.repository_id, 
-                                            snapshot_id
-                                        )
-                                    except Exception as forget_error:
-                                        logger.error(f"Error forgetting snapshot {snapshot_id}: {forget_error}")
-                        
-                        # 3. After forgetting snapshots, run prune to actually reclaim space
-                        backrest_service.prune_repository(repo.repository_id)
-                        
-                    except Exception as repo_error:
-                        logger.error(f"Error processing repository {repo.id}: {str(repo_error)}")
-                
-                results[tenant.name] = {"status": "success", "message": "Retention management completed"}
-                
+                # Only queued once the whole tenant loaded, so a failed tenant keeps its error entry
+                tenant_jobs = [
+                    ((tenant, repo.id, repo.repository_id), repo)
+                    for repo in BackrestRepository.objects.filter(tenant=tenant).select_related('server')
+                ]
+            jobs.extend(tenant_jobs)
+            results[tenant.name] = {}
         except Exception as e:
             logger.exception(f"Error processing tenant {tenant.name}")
-            results[tenant.name] = f"Error: {str(e)}"
+            results[tenant.name] = {"status": "error", "error": str(e)}
     
+    engine = RetentionEngine(dry_run=dry_run)
+    outcomes = engine.run(jobs)
+    
+    for (tenant, repo_id, repository_id), outcome in outcomes.items():
+        # Keyed by Backrest's repository id: display names need not be unique
+        results[tenant.name][repository_id] = outcome
+        if outcome.get("forgotten"):
+            # Drop the forgotten snapshots (and their storage) from the database
+            sync_repository_snapshots.delay(tenant.id, repo_id)
+    
+    logger.info(f"Monthly retention for {engine.tag} finished for {len(jobs)} repositories")
     return results
 
 @shared_task
@@ -452,7 +393,7 @@ def handle_stuck_plans():
                 operations = BackrestOperation.objects.filter(
                     started_at__gte=recent_time,
                     operation_type="backup"
-                )
+                ).select_related('plan', 'repository__server')
                 
                 # Group by plan and count
                 plan_counts = {}
@@ -497,9 +438,9 @@ def handle_stuck_plans():
 
 @shared_task
 def sync_scheduled_operations():
-    """Sync upcoming scheduled operations from plans to database"""
+    """Materialize every plan's scheduled backups within the schedule horizon"""
     from tenants.models import Tenant
-    from datetime import datetime
+    from .schedules import materialize_occurrences
     
     logger.info("Syncing scheduled backup operations")
     results = {}
@@ -507,84 +448,155 @@ def sync_scheduled_operations():
     for tenant in Tenant.objects.filter(is_active=True).exclude(schema_name='public'):
         try:
             with tenant_context(tenant):
-                from .models import BackrestPlan, BackrestOperation, BackrestRepository
-                
-                # Get all plans with schedules
-                plans = BackrestPlan.objects.all()
-                scheduled_count = 0
+                result = materialize_occurrences(tenant)
+                results[tenant.name] = {
+                    "status": "success",
+                    "scheduled_operations": result["created"],
+                    "removed_operations": result["removed"]
+                }
                 
-                for plan in plans:
-                    # Skip plans without schedules
-                    if not plan.schedule or plan.schedule == "disabled":
-                        continue
-                    
-                    try:
-                        # Parse cron expression
-                        cron_schedule = plan.schedule
-                        
-                        # Get a croniter instance for this schedule
-                        now = datetime.now()
-                        cron = croniter.croniter(cron_schedule, now)
-                        
-                        # Get the next execution time
-                        next_execution = cron.get_next(datetime)
-                        
-                        # Check if we already have a pending operation for this execution time
-                        existing_operation = BackrestOperation.objects.filter(
-                            plan=plan,
-                            status__in=['pending', 'scheduled'],
-                            scheduled_at__year=next_execution.year,
-                            scheduled_at__month=next_execution.month,
-                            scheduled_at__day=next_execution.day,
-                            scheduled_at__hour=next_execution.hour,
-                            scheduled_at__minute=next_execution.minute,
-                        ).first()
-                        
-                        if not existing_operation:
-                            # Create a pending operation for this plan
-                            operation = BackrestOperation.objects.create(
-                                tenant=tenant,
-                                repository=plan.repository,
-                                plan=plan,
-                                operation_id=f"scheduled_{plan.plan_id}_{int(next_execution.timestamp())}",
-                                operation_type="backup",
-                                status="scheduled",  # Use "scheduled" status to distinguish from "pending"
-                                started_at=None,  # Will be set when actually started
-                                scheduled_at=timezone.make_aware(next_execution)  # Add this field to the model
-                            )
-                            scheduled_count += 1
-                            
-                            # If you have job tables, create corresponding job records
-                            try:
-                                from jobs.models import BackupJob, JobLog
-                                
-                                backup_job = BackupJob.objects.create(
-                                    tenant=tenant,
-                                    name=f"Scheduled backup: {plan.name}",
-                                    status="scheduled",
-                                    scheduled_at=timezone.make_aware(next_execution),
-                                    operation_id=operation.operation_id
-                                )
-                                
-                                JobLog.objects.create(
-                                    job=backup_job,
-                                    message=f"Backup scheduled for {next_execution.strftime('%Y-%m-%d %H:%M')}",
-                                    level="info",
-                                    timestamp=timezone.now()
-                                )
-                            except Exception as job_error:
-                                logger.warning(f"Failed to create job record: {str(job_error)}")
-                    
-                    except Exception as plan_error:
-                        logger.error(f"Error processing plan {plan.name}: {str(plan_error)}")
+        except Exception as tenant_error:
+            logger.exception(f"Error processing tenant {tenant.name}")
+            results[tenant.name] = {"status": "error", "error": str(tenant_error)}
+    
+    return results
+
+@shared_task
+def sync_backrest_snapshots():
+    """Queue a snapshot reconciliation for every repository of every active tenant"""
+    from tenants.models import Tenant
+    from celery import group
+    from .models import BackrestRepository
+    
+    jobs = []
+    for tenant in Tenant.objects.filter(is_active=True).exclude(schema_name='public'):
+        try:
+            with tenant_context(tenant):
+                jobs.extend(
+                    sync_repository_snapshots.s(tenant.id, repo_id)
+                    for repo_id in BackrestRepository.objects.values_list('id', flat=True)
+                )
+        except Exception as e:
+            logger.error(f"Error listing repositories for tenant {tenant.name}: {str(e)}")
+    
+    if not jobs:
+        return {}
+    
+    group(jobs).apply_async()
+    logger.info(f"Dispatched snapshot sync for {len(jobs)} repositories")
+    return {"status": "dispatched", "repositories": len(jobs)}
+
+@shared_task
+def sync_repository_snapshots(tenant_id, repository_id):
+    """Reconcile one repository's snapshots with Backrest, at most once at a time"""
+    from tenants.models import Tenant
+    from django.conf import settings
+    from .locks import single_flight
+    from .models import BackrestRepository
+    from .sync import PlanResolver, SnapshotReconciler
+    
+    try:
+        tenant = Tenant.objects.get(id=tenant_id)
+    except Tenant.DoesNotExist:
+        logger.warning(f"Tenant {tenant_id} no longer exists, skipping snapshot sync")
+        return {}
+    
+    lock_timeout = getattr(settings, 'BACKREST_SYNC_LOCK_TIMEOUT', 300)
+    with single_flight(f"backrest:sync-snapshots:{tenant.id}:{repository_id}", timeout=lock_timeout) as acquired:
+        if not acquired:
+            return {"status": "skipped", "message": "Snapshot sync already in progress"}
+        
+        try:
+            with tenant_context(tenant):
+                repository = BackrestRepository.objects.select_related('server').get(id=repository_id)
+                snapshots = BackrestService(repository.server).get_snapshots(repository.repository_id)
+                result = SnapshotReconciler(tenant, repository, plan_resolver=PlanResolver(tenant)).reconcile(snapshots)
+            
+            if result.get("added") and getattr(settings, 'BACKREST_CATALOG_ENABLED', True):
+                index_snapshot_catalog.delay(tenant.id, repository_id)
+            return {"status": "success", "repository": repository.name, **result}
+        except BackrestRepository.DoesNotExist:
+            return {"status": "skipped", "message": f"Repository {repository_id} no longer exists"}
+        except Exception as e:
+            logger.exception(f"Error syncing snapshots of repository {repository_id} for tenant {tenant.name}")
+            return {"status": "error", "error": str(e)}
+
+@shared_task
+def index_snapshot_catalog(tenant_id, repository_id):
+    """Add a repository's new snapshots to the tenant's file catalog"""
+    from tenants.models import Tenant
+    from django.conf import settings
+    from .catalog import index_repository
+    from .locks import single_flight
+    from .models import BackrestRepository
+    
+    try:
+        tenant = Tenant.objects.get(id=tenant_id)
+    except Tenant.DoesNotExist:
+        logger.warning(f"Tenant {tenant_id} no longer exists, skipping catalog indexing")
+        return {}
+    
+    lock_timeout = getattr(settings, 'BACKREST_CATALOG_LOCK_TIMEOUT', 3600)
+    max_snapshots = getattr(settings, 'BACKREST_CATALOG_MAX_SNAPSHOTS_PER_RUN', 20)
+    with single_flight(f"backrest:index-catalog:{tenant.id}:{repository_id}", timeout=lock_timeout) as acquired:
+        if not acquired:
+            return {"status": "skipped", "message": "Catalog indexing already in progress"}
+        
+        try:
+            with tenant_context(tenant):
+                repository = BackrestRepository.objects.select_related('server').get(id=repository_id)
+                result = index_repository(tenant, repository, max_snapshots=max_snapshots)
+        except BackrestRepository.DoesNotExist:
+            return {"status": "skipped", "message": f"Repository {repository_id} no longer exists"}
+        except Exception as e:
+            logger.exception(f"Error indexing snapshots of repository {repository_id} for tenant {tenant.name}")
+            return {"status": "error", "error": str(e)}
+    
+    # Large backlogs are worked off a few snapshots per run
+    if result["pending"]:
+        index_snapshot_catalog.delay(tenant_id, repository_id)
+    return {"status": "success", "repository": repository.name, **result}
+
+@shared_task
+def reconcile_storage_usage():
+    """Measure every tenant's repositories, reset the storage counters to that and record the day's usage"""
+    from tenants.models import Tenant
+    from .storage import reconcile_tenant_storage
+    
+    results = {}
+    
+    for tenant in Tenant.objects.filter(is_active=True).exclude(schema_name='public'):
+        try:
+            with tenant_context(tenant):
+                result = reconcile_tenant_storage(tenant)
+                results[tenant.name] = {"status": "success", **result}
                 
+        except Exception as tenant_error:
+            logger.exception(f"Error reconciling storage usage for tenant {tenant.name}")
+            results[tenant.name] = {"status": "error", "error": str(tenant_error)}
+    
+    return results
+
+@shared_task
+def maintain_log_partitions():
+    """Create upcoming BackrestLog partitions and drop those past each tenant's retention"""
+    from tenants.models import Tenant
+    from .partitions import maintain_log_partitions as maintain_tenant_partitions
+    
+    results = {}
+    
+    for tenant in Tenant.objects.filter(is_active=True).exclude(schema_name='public'):
+        try:
+            with tenant_context(tenant):
+                result = maintain_tenant_partitions(tenant)
                 results[tenant.name] = {
                     "status": "success",
-                    "scheduled_operations": scheduled_count
+                    "partitions_created": result["created"],
+                    "partitions_dropped": result["dropped"]
                 }
                 
         except Exception as tenant_error:
-            logger.exception(f"Error processing tenant {tenant.name}")
+            logger.exception(f"Error maintaining log partitions for tenant {tenant.name}")
             results[tenant.name] = {"status": "error", "error": str(tenant_error)}
     
     return results
@@ -593,7 +605,7 @@ def sync_scheduled_operations():
 def process_backrest_db_logs():
     """Process Backrest SQLite tasklog files to get detailed logs"""
     from tenants.models import Tenant
-    import sqlite3
+    from .ssh import ssh_pool
     
     logger.info("Processing Backrest SQLite logs")
     results = {}
@@ -601,157 +613,16 @@ def process_backrest_db_logs():
     for tenant in Tenant.objects.filter(is_active=True).exclude(schema_name='public'):
         try:
             with tenant_context(tenant):
-                from .models import Server, BackrestLog
+                from .models import Server
                 
-                servers = Server.objects.all()
+                servers = Server.objects.select_related('ssh_key')
                 logs_added = 0
                 
                 for server in servers:
                     try:
-                        # Connect to remote server via SSH
-                        with tempfile.NamedTemporaryFile(delete=False, mode='w') as key_file:
-                            key_path = key_file.name
-                            key_file.write(server.ssh_key.private_key)
-                        
-                        os.chmod(key_path, 0o600)
-                        
-                        # Setup SSH client
-                        client = paramiko.SSHClient()
-                        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                        client.connect(
-                            hostname=server.hostname,
-                            port=server.ssh_port,
-                            username=server.ssh_user,
-                            key_filename=key_path,
-                            timeout=30
-                        )
-                        
-                        # First check if tasklog files exist
-                        cmd = "ls -la /opt/backrest/data/tasklogs/*.sqlite"
-                        stdin, stdout, stderr = client.exec_command(cmd)
-                        tasklog_files = stdout.read().decode('utf-8')
-                        
-                        if not tasklog_files:
-                            logger.info(f"No tasklog SQLite files found on server {server.hostname}")
-                            continue
-                        
-                        # Create a temporary directory
-                        temp_dir = tempfile.mkdtemp()
-                        
-                        # Download the SQLite files
-                        sftp = client.open_sftp()
-                        for line in tasklog_files.strip().split('\n'):
-                            parts = line.split()
-                            if len(parts) > 8:  # Basic check for ls -la output format
-                                remote_path = parts[-1]
-                                filename = os.path.basename(remote_path)
-                                local_path = os.path.join(temp_dir, filename)
-                                
-                                try:
-                                    sftp.get(remote_path, local_path)
-                                    
-                                    # Process this SQLite file
-                                    conn = sqlite3.connect(local_path)
-                                    cursor = conn.cursor()
-                                    
-                                    # Query the logs table - adjust this based on actual schema
-                                    cursor.execute("""
-                                        SELECT timestamp, level, message, logger, error
-                                        FROM logs
-                                        ORDER BY timestamp DESC
-                                        LIMIT 1000
-                                    """)
-                                    
-                                    logs = cursor.fetchall()
-                                    cursor.close()
-                                    conn.close()
-                                    
-                                    # Store in the database
-                                    for log in logs:
-                                        timestamp, level, message, logger_name, error = log
-                                        
-                                        # Convert timestamp to datetime
-                                        log_time = datetime.fromtimestamp(timestamp)
-                                        
-                                        # Check if log already exists
-                                        existing_log = BackrestLog.objects.filter(
-                                            timestamp=timezone.make_aware(log_time),
-                                            message=message,
-                                            server=server
-                                        ).first()
-                                        
-                                        if not existing_log:
-                                            BackrestLog.objects.create(
-                                                tenant=tenant,
-                                                server=server,
-                                                level=level,
-                                                message=message,
-                                                logger_name=logger_name,
-                                                error=error if error else "",
-                                                timestamp=timezone.make_aware(log_time),
-                                                source=f"tasklog/{filename}"
-                                            )
-                                            logs_added += 1
-                                    
-                                except Exception as sqlite_error:
-                                    logger.error(f"Error processing SQLite file {filename}: {str(sqlite_error)}")
-                        
-                        # Also process the backrest.log text file
-                        try:
-                            cmd = "cat /opt/backrest/data/processlogs/backrest.log | tail -n 1000"
-                            stdin, stdout, stderr = client.exec_command(cmd)
-                            log_data = stdout.read().decode('utf-8')
-                            
-                            for line in log_data.strip().split('\n'):
-                                if not line:
-                                    continue
-                                
-                                try:
-                                    # Parse JSON log entry
-                                    log_entry = json.loads(line)
-                                    
-                                    # Extract fields
-                                    timestamp = log_entry.get('ts', 0)
-                                    level = log_entry.get('level', 'info')
-                                    message = log_entry.get('msg', '')
-                                    logger_name = log_entry.get('logger', '')
-                                    error = log_entry.get('error', '')
-                                    
-                                    # Convert timestamp to datetime
-                                    log_time = datetime.fromtimestamp(timestamp)
-                                    
-                                    # Check if log already exists
-                                    existing_log = BackrestLog.objects.filter(
-                                        timestamp=timezone.make_aware(log_time),
-                                        message=message,
-                                        server=server
-                                    ).first()
-                                    
-                                    if not existing_log:
-                                        BackrestLog.objects.create(
-                                            tenant=tenant,
-                                            server=server,
-                                            level=level,
-                                            message=message,
-                                            logger_name=logger_name,
-                                            error=error,
-                                            timestamp=timezone.make_aware(log_time),
-                                            source="processlogs/backrest.log"
-                                        )
-                                        logs_added += 1
-                                        
-                                except json.JSONDecodeError:
-                                    # Not a valid JSON line - might be a plain text log
-                                    logger.debug(f"Could not parse log line: {line[:100]}...")
-                                
-                        except Exception as log_error:
-                            logger.error(f"Error processing backrest.log: {str(log_error)}")
-                        
-                        # Clean up
-                        sftp.close()
-                        client.close()
-                        shutil.rmtree(temp_dir)
-                        os.unlink(key_path)
+                        # Reuse a pooled SSH session to the remote server
+                        with ssh_pool.session(server) as client:
+                            logs_added += _process_server_db_logs(tenant, server, client)
                         
                     except Exception as server_error:
                         logger.error(f"Error processing logs from server {server.hostname}: {str(server_error)}")
@@ -767,61 +638,41 @@ def process_backrest_db_logs():
     
     return results
 
-# Update the operation creation part in sync_backrest_operations task
-def create_or_update_operation(tenant, repository, plan, op_data, op_type, status):
-    """Helper to create or update operation with complete data"""
-    from .models import BackrestOperation
+def _process_server_db_logs(tenant, server, client):
+    """Import tasklog and backrest.log entries from one server over an open SSH session"""
+    from datetime import datetime, timezone as dt_timezone
+    from .ingest import ingest_log_entries
+    from .tasklogs import export_tasklogs
     
-    op_id = op_data.get('id')
-    if not op_id:
-        return None
-        
+    logs_added = 0
+    
+    # Tasklog databases are queried in place - only new rows cross the wire
     try:
-        # Try to get existing operation
-        operation = BackrestOperation.objects.get(operation_id=op_id)
-        
-        # Update fields
-        operation.status = status
-        
-        # Set completion time if newly completed
-        if status in ['completed', 'failed', 'canceled'] and not operation.completed_at:
-            operation.completed_at = timezone.now()
-            
-        # Update other fields
-        if 'snapshot_id' in op_data and op_data['snapshot_id']:
-            operation.snapshot_id = op_data['snapshot_id']
-        if 'stats' in op_data and op_data['stats']:
-            operation.stats = op_data['stats']
-        
-        operation.save()
-        return operation, False  # False means updated existing
-        
-    except BackrestOperation.DoesNotExist:
-        # Create new operation with all fields properly set
-        operation = BackrestOperation(
-            tenant=tenant,
-            repository=repository,
-            plan=plan,
-            operation_id=op_id,
-            operation_type=op_type,
-            status=status,
-            started_at=timezone.now() - timedelta(minutes=5)  # Approximate start time
-        )
-        
-        # Set snapshot ID and stats if available
-        if 'snapshot_id' in op_data and op_data['snapshot_id']:
-            operation.snapshot_id = op_data['snapshot_id']
-        if 'stats' in op_data and op_data['stats']:
-            operation.stats = op_data['stats']
+        logs_added += export_tasklogs(tenant, server, client)
+    except Exception as tasklog_error:
+        logger.error(f"Error processing tasklogs on {server.hostname}: {str(tasklog_error)}")
+    
+    # Also process the new part of the backrest.log text file
+    try:
+        from .logtail import read_new_entries
         
-        # Set completion time if already done
-        if status in ['completed', 'failed', 'canceled']:
-            operation.completed_at = timezone.now()
+        entries = []
+        for log_entry in read_new_entries(server, client, consumer='log-ingest'):
+            try:
+                entries.append({
+                    'timestamp': datetime.fromtimestamp(log_entry.get('ts', 0), tz=dt_timezone.utc),
+                    'level': log_entry.get('level', 'info'),
+                    'message': log_entry.get('msg', ''),
+                    'logger_name': log_entry.get('logger', ''),
+                    'error': log_entry.get('error', ''),
+                    'source': "processlogs/backrest.log",
+                })
+            except (TypeError, ValueError) as entry_error:
+                logger.debug(f"Skipping malformed log entry: {str(entry_error)}")
         
-        # Ensure non-null fields for foreign keys
-        if not repository:
-            logger.warning(f"Missing repository for operation {op_id}")
-            return None
+        logs_added += ingest_log_entries(tenant, server, entries)
             
-        operation.save()
-        return operation, True  # True means newly created
\ No newline at end of file
+    except Exception as log_error:
+        logger.error(f"Error processing backrest.log: {str(log_error)}")
+    
+    return logs_added
@@ -1,3 +1,488 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.db.models import Model, Q
+from django.test import SimpleTestCase
+from django_tenants.test.cases import TenantTestCase
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .instrumentation import BudgetExceeded, assert_within_budget, record_http_call, record_ssh_command
+
+
+class StubBackrestHandler(BaseHTTPRequestHandler):
+    """Answers GetOperations with the requested repository id; /v1.Backrest/Slow never answers in time"""
+
+    delay = 0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        cls = type(self)
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'{}')
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(5 if self.path == '/v1.Backrest/Slow' else cls.delay)
+            payload = json.dumps({'operations': [{'id': body.get('selector', {}).get('repositoryId')}]}).encode()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FanOutTests(SimpleTestCase):
+    """gather_per_server/fan_out against a local stub of the Backrest API"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubBackrestHandler)
+        cls.httpd.daemon_threads = True
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+        cls.server = SimpleNamespace(hostname='127.0.0.1', backrest_port=cls.httpd.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubBackrestHandler.delay = 0
+        StubBackrestHandler.max_in_flight = 0
+
+    def operations_job(self, repository_id):
+        return (repository_id, self.server, lambda service: service.get_operations(repository_id=repository_id))
+
+    def test_results_are_keyed_per_job(self):
+        from .async_service import fan_out
+
+        results = fan_out([self.operations_job(f"repo{index}") for index in range(5)])
+
+        self.assertEqual(results, {f"repo{index}": [{'id': f"repo{index}"}] for index in range(5)})
+
+    def test_slow_server_times_out_without_failing_the_others(self):
+        from .async_service import fan_out
+
+        jobs = [
+            self.operations_job('repo0'),
+            ('slow', self.server, lambda service: service._make_request('post', '/v1.Backrest/Slow', {})),
+        ]
+        started = time.monotonic()
+        results = fan_out(jobs, timeout=0.5)
+
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertIsInstance(results['slow'], asyncio.TimeoutError)
+        self.assertEqual(results['repo0'], [{'id': 'repo0'}])
+
+    def test_concurrency_is_bounded_by_the_semaphore(self):
+        from .async_service import fan_out
+
+        StubBackrestHandler.delay = 0.1
+        results = fan_out([self.operations_job(f"repo{index}") for index in range(6)], concurrency=2)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(StubBackrestHandler.max_in_flight, 2)
+
+    def test_no_jobs_starts_no_event_loop(self):
+        from .async_service import fan_out
+
+        with mock.patch('backrest.async_service.asyncio.run') as run:
+            self.assertEqual(fan_out([]), {})
+        run.assert_not_called()
+
+
+class BackrestTenantTestCase(TenantTestCase):
+    """TenantTestCase whose test tenant can be deleted again"""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = cls.__name__
+        tenant.last_name = 'Test'
+        tenant.email = f"{cls.__name__.lower()}@example.com"
+
+    @classmethod
+    def tearDownClass(cls):
+        # Tenant.delete(force_drop=True) drops the schema before collecting the
+        # rows that point at the tenant, which live in that schema's tables
+        # (jobs_backupjob, backrest_*). Collect them on the tenant's search path
+        # instead and let auto_drop_schema drop the schema afterwards. That
+        # happens in the same transaction, so the foreign key checks must run
+        # before their triggers go with the schema.
+        connection.set_tenant(cls.tenant)
+        cls.domain.delete()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            Model.delete(cls.tenant)
+        connection.set_schema_to_public()
+        cls.remove_allowed_test_domain()
+
+
+def create_repositories(tenant, count):
+    """Servers with one repository each; the SSH key skips SSHKey.save(), which writes the key to disk"""
+    from .models import BackrestRepository, Server, SSHKey
+
+    ssh_key = SSHKey.objects.bulk_create([
+        SSHKey(tenant=tenant, name='key', private_key='unused', public_key='')
+    ])[0]
+    repositories = []
+    for index in range(count):
+        server = Server.objects.create(
+            tenant=tenant, name=f"server{index}", hostname=f"host{index}.example.com",
+            ip_address='10.0.0.1', ssh_user='backup', ssh_key=ssh_key,
+        )
+        repositories.append(BackrestRepository.objects.create(
+            tenant=tenant, server=server, repository_id=f"repo{index}",
+            name=f"repo{index}", uri=f"/backups/repo{index}", password='unused',
+        ))
+    return repositories
+
+
+class OperationUpserterTests(BackrestTenantTestCase):
+    def setUp(self):
+        self.repo = create_repositories(self.tenant, 1)[0]
+
+    def remote(self, op_id, status):
+        return {'id': op_id, 'type': 'TYPE_BACKUP', 'status': status, 'unixTimeStartMs': '1760000000000'}
+
+    def test_insert_update_and_unchanged(self):
+        from .models import BackrestOperation
+        from .sync import OperationUpserter
+
+        upserter = OperationUpserter(self.tenant, self.repo)
+        first = upserter.upsert([self.remote('1', 'STATUS_INPROGRESS'), self.remote('2', 'STATUS_INPROGRESS')])
+        second = upserter.upsert([self.remote('1', 'STATUS_SUCCESS'), self.remote('2', 'STATUS_INPROGRESS')])
+
+        self.assertEqual(first, {'added': 2, 'updated': 0, 'unchanged': 0, 'completed': 0})
+        self.assertEqual(second, {'added': 0, 'updated': 1, 'unchanged': 1, 'completed': 1})
+        finished = BackrestOperation.objects.get(operation_id='1')
+        self.assertEqual(finished.status, 'completed')
+        self.assertIsNotNone(finished.completed_at)
+        self.assertEqual(BackrestOperation.objects.get(operation_id='2').status, 'running')
+
+
+def create_plan(repository, plan_id):
+    from .models import BackrestPlan
+
+    return BackrestPlan.objects.create(
+        tenant=repository.tenant, repository=repository, plan_id=plan_id, name=plan_id.title(),
+        paths=['/etc'], schedule={}, retention_policy={},
+    )
+
+
+class PolledOperationTests(BackrestTenantTestCase):
+    """Operations as the poll returns them: Backrest's camelCase JSON"""
+
+    def setUp(self):
+        self.repo = create_repositories(self.tenant, 1)[0]
+        self.plan = create_plan(self.repo, 'daily')
+
+    def test_polled_operations_get_their_plan_snapshot_and_error(self):
+        from .models import BackrestOperation
+        from .sync import OperationUpserter, PlanResolver
+
+        OperationUpserter(self.tenant, self.repo, plan_resolver=PlanResolver(self.tenant)).upsert([
+            {'id': '1', 'planId': 'daily', 'type': 'TYPE_BACKUP', 'status': 'STATUS_SUCCESS',
+             'snapshotId': 'abc123', 'unixTimeStartMs': '1760000000000'},
+            {'id': '2', 'planId': 'daily', 'type': 'TYPE_BACKUP', 'status': 'STATUS_ERROR',
+             'displayMessage': 'repository is locked', 'unixTimeStartMs': '1760000060000'},
+        ])
+
+        backup = BackrestOperation.objects.get(operation_id='1')
+        failed = BackrestOperation.objects.get(operation_id='2')
+        self.assertEqual(backup.plan, self.plan)
+        self.assertEqual(backup.snapshot_id, 'abc123')
+        self.assertEqual(failed.plan, self.plan)
+        self.assertEqual(failed.error, 'repository is locked')
+
+
+class HookOperationAdoptionTests(BackrestTenantTestCase):
+    def setUp(self):
+        self.repo = create_repositories(self.tenant, 1)[0]
+        self.plan = create_plan(self.repo, 'daily')
+
+    def test_polled_operation_takes_over_the_hook_row(self):
+        from .models import BackrestOperation
+        from .sync import OperationUpserter
+
+        started = datetime(2026, 10, 18, 1, 0, tzinfo=dt_timezone.utc)
+        BackrestOperation.objects.create(
+            tenant=self.tenant, repository=self.repo, plan=self.plan,
+            operation_id='hook_daily_1760749200000', operation_type='backup',
+            status='completed', started_at=started, completed_at=started,
+        )
+
+        result = OperationUpserter(self.tenant, self.repo).upsert([{
+            'id': '77', 'planId': 'daily', 'type': 'TYPE_BACKUP', 'status': 'STATUS_SUCCESS',
+            'snapshotId': 'abc123', 'unixTimeStartMs': str(int(started.timestamp() * 1000) + 4000),
+        }])
+
+        self.assertEqual(result['added'], 0)
+        operation = BackrestOperation.objects.get()
+        self.assertEqual(operation.operation_id, '77')
+        self.assertEqual(operation.plan, self.plan)
+        self.assertEqual(operation.snapshot_id, 'abc123')
+
+
+class BudgetAssertionTests(SimpleTestCase):
+    def test_raises_when_a_limit_is_exceeded(self):
+        with self.assertRaisesMessage(BudgetExceeded, "ssh_commands 2 > 1"):
+            with assert_within_budget(ssh_commands=1):
+                record_ssh_command()
+                record_ssh_command()
+
+    def test_passes_within_limits(self):
+        with assert_within_budget(http_calls=1, ssh_commands=0) as stats:
+            record_http_call()
+        self.assertEqual(stats.http_calls, 1)
+
+
+class SyncTenantOperationsBudgetTests(BackrestTenantTestCase):
+    """Pins the query cost of the per-tenant operations sync"""
+
+    def setUp(self):
+        self.repos = create_repositories(self.tenant, 3)
+
+    def test_query_count_does_not_grow_with_operations(self):
+        from .tasks import _sync_tenant_operations
+
+        remote = {
+            repo.id: [
+                {'id': str(repo.id * 1000 + number), 'modno': str(number), 'type': 'TYPE_BACKUP',
+                 'status': 'STATUS_INPROGRESS', 'unixTimeStartMs': '1760000000000'}
+                for number in range(20)
+            ]
+            for repo in self.repos
+        }
+
+        # About 10 queries per run plus 4 per repository (lookup, provisional
+        # rows, one bulk insert, cursor save) - one query per operation would
+        # add 60 more.
+        with mock.patch('backrest.async_service.fan_out', return_value=remote):
+            with assert_within_budget(queries=30, http_calls=0):
+                result = _sync_tenant_operations(self.tenant)
+
+        self.assertEqual(result['operations_added'], 60)
+
+
+class KeysetCursorTests(SimpleTestCase):
+    def setUp(self):
+        from .listing import KeysetPagination
+
+        self.pagination = KeysetPagination()
+
+    def decode(self, cursor):
+        return self.pagination.decode_cursor(Request(APIRequestFactory().get('/', {'cursor': cursor})))
+
+    def test_search_rank_cursor_round_trip(self):
+        self.pagination.sort_field = 'search_rank'
+        row = SimpleNamespace(search_rank=0.0607927106, pk=42)
+
+        self.assertEqual(self.decode(self.pagination._cursor_for(row, True)), (0.0607927106, 42, True))
+
+    def test_datetime_cursor_round_trip(self):
+        value = datetime(2026, 10, 18, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        cursor = self.pagination.encode_cursor(value, 7, False)
+
+        self.assertEqual(self.decode(cursor), (value, 7, False))
+
+    def test_descending_search_rank_continues_below_the_cursor(self):
+        self.assertEqual(
+            self.pagination._keyset_filter('search_rank', True, 0.5, 42),
+            Q(search_rank__lt=0.5) | Q(search_rank=0.5, id__lt=42),
+        )
+
+    def test_garbage_cursor_is_not_found(self):
+        with self.assertRaises(NotFound):
+            self.decode('not-a-cursor')
+
+
+def remote_snapshot(snapshot_id, data_added=0):
+    return {'id': snapshot_id, 'unixTimeMs': '1760000000000', 'hostname': 'host',
+            'summary': {'dataAdded': str(data_added), 'totalBytesProcessed': '1000000'}}
+
+
+class SnapshotReconcilerTests(BackrestTenantTestCase):
+    def setUp(self):
+        self.repo = create_repositories(self.tenant, 1)[0]
+
+    def test_vanished_snapshots_are_deleted(self):
+        from .models import BackrestSnapshot
+        from .sync import SnapshotReconciler
+
+        added = SnapshotReconciler(self.tenant, self.repo).reconcile([remote_snapshot('a'), remote_snapshot('b')])
+        result = SnapshotReconciler(self.tenant, self.repo).reconcile([remote_snapshot('b')])
+
+        self.assertEqual(added['added'], 2)
+        self.assertEqual(result['deleted'], 1)
+        self.assertEqual(result['unchanged'], 1)
+        self.assertEqual(list(BackrestSnapshot.objects.values_list('snapshot_id', flat=True)), ['b'])
+
+    def test_empty_remote_list_deletes_nothing(self):
+        from .models import BackrestSnapshot
+        from .sync import SnapshotReconciler
+
+        SnapshotReconciler(self.tenant, self.repo).reconcile([remote_snapshot('a')])
+        result = SnapshotReconciler(self.tenant, self.repo).reconcile([])
+
+        self.assertEqual(result['deleted'], 0)
+        self.assertEqual(BackrestSnapshot.objects.count(), 1)
+
+
+class StorageAccountingTests(BackrestTenantTestCase):
+    def setUp(self):
+        self.repo = create_repositories(self.tenant, 1)[0]
+
+    def test_counters_grow_by_data_added_only(self):
+        from .sync import SnapshotReconciler
+
+        result = SnapshotReconciler(self.tenant, self.repo).reconcile([remote_snapshot('a', 100), remote_snapshot('b', 20)])
+        SnapshotReconciler(self.tenant, self.repo).reconcile([remote_snapshot('b', 20)])
+
+        self.assertEqual(result['bytes_delta'], 120)
+        self.repo.refresh_from_db()
+        # Forgetting frees nothing until a prune, which the nightly measurement picks up
+        self.assertEqual(self.repo.storage_used_bytes, 120)
+        self.assertEqual(self.repo.snapshot_count, 1)
+
+    def test_nightly_measurement_replaces_the_counters(self):
+        from tenants.models import Tenant, TenantStorageUsage
+        from .storage import reconcile_tenant_storage
+        from .sync import SnapshotReconciler
+
+        SnapshotReconciler(self.tenant, self.repo).reconcile([remote_snapshot('a', 100)])
+        with mock.patch('backrest.storage.measure_repository', return_value=5000):
+            result = reconcile_tenant_storage(self.tenant)
+
+        self.assertEqual(result['used_bytes'], 5000)
+        self.assertEqual(result['drift_bytes'], 4900)
+        self.repo.refresh_from_db()
+        self.assertEqual(self.repo.storage_used_bytes, 5000)
+        self.assertIsNotNone(self.repo.storage_measured_at)
+        self.assertEqual(Tenant.objects.get(id=self.tenant.id).storage_used_bytes, 5000)
+        self.assertEqual(TenantStorageUsage.objects.get(tenant_id=self.tenant.id).repositories, {'repo0': 5000})
+
+
+class StorageQuotaTests(BackrestTenantTestCase):
+    def setUp(self):
+        from accounts.models import User
+
+        self.repo = create_repositories(self.tenant, 1)[0]
+        self.plan = create_plan(self.repo, 'daily')
+        self.user = User.objects.create_user(
+            'owner@example.com', 'unused-password', self.tenant,
+            User.Role.TENANT_OWNER, User.RoleInTenant.OWNER, 'Owner', 'Test',
+        )
+
+    def trigger_backup(self):
+        from .api_views import BackrestPlanViewSet
+
+        request = APIRequestFactory().post(f"/api/backrest/plans/{self.plan.pk}/trigger_backup/")
+        force_authenticate(request, user=self.user)
+        request.tenant = self.tenant
+        return BackrestPlanViewSet.as_view({'post': 'trigger_backup'})(request, pk=self.plan.pk)
+
+    def test_over_quota_tenant_cannot_start_backups(self):
+        from tenants.models import Tenant
+        from .storage import GB
+
+        Tenant.objects.filter(id=self.tenant.id).update(max_storage_gb=1, storage_used_bytes=2 * GB)
+        with mock.patch('backrest.api_views.BackrestService') as service:
+            response = self.trigger_backup()
+
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(response.data['quota']['exceeded'])
+        service.assert_not_called()
+
+
+class PlanRetentionTests(SimpleTestCase):
+    TAG = 'month-2026-09'
+
+    def test_keeps_newest_full_backup_and_forgets_the_rest_of_the_month(self):
+        from .retention import plan_retention
+
+        snapshots = [
+            {'id': 'full-old', 'unixTimeMs': 1000, 'tags': [self.TAG, 'full-backup', 'monday-backup']},
+            {'id': 'full-new', 'time': '2026-09-28T01:00:00Z', 'tags': [self.TAG, 'full-backup', 'monday-backup']},
+            {'id': 'daily', 'unixTimeMs': 2000, 'planId': 'daily', 'tags': [self.TAG]},
+            {'id': 'other-month', 'unixTimeMs': 3000, 'tags': ['month-2026-08', 'full-backup', 'monday-backup']},
+        ]
+
+        plan = plan_retention(snapshots, self.TAG)
+
+        self.assertEqual(plan['keep']['id'], 'full-new')
+        self.assertEqual([snapshot['id'] for snapshot in plan['forget']], ['full-old', 'daily'])
+        self.assertEqual(plan['forget'][1]['plan_id'], 'daily')
+        self.assertEqual(plan['forget'][0]['plan_id'], '_unassociated_')
+        self.assertEqual(plan['scanned'], 4)
+
+    def test_month_without_full_backup_is_left_alone(self):
+        from .retention import plan_retention
+
+        plan = plan_retention([{'id': 'daily', 'unixTimeMs': 1000, 'tags': [self.TAG, 'full-backup']}], self.TAG)
+
+        self.assertIsNone(plan['keep'])
+        self.assertEqual(plan['forget'], [])
+
+    def test_previous_month_wraps_the_year(self):
+        from .retention import previous_month_tag
+
+        self.assertEqual(previous_month_tag(datetime(2027, 1, 1, tzinfo=dt_timezone.utc)), 'month-2026-12')
+
+
+class RetentionEngineTests(SimpleTestCase):
+    def test_worker_threads_count_against_the_run(self):
+        from .retention import RetentionEngine
+
+        snapshots = [
+            {'id': 'keep', 'unixTimeMs': 2000, 'planId': 'daily',
+             'tags': ['month-2026-09', 'full-backup', 'monday-backup']},
+            {'id': 'old', 'unixTimeMs': 1000, 'planId': 'daily', 'tags': ['month-2026-09']},
+        ]
+
+        class FakeService:
+            def __init__(self, server):
+                pass
+
+            def get_snapshots(self, repository_id):
+                record_http_call()
+                return snapshots
+
+            def forget_snapshot(self, repository_id, plan_id, snapshot_id):
+                record_http_call()
+                return {'status': 'forgotten'}
+
+            def prune_repository(self, repository_id):
+                record_http_call()
+                return {'status': 'prune_initiated'}
+
+        jobs = [
+            (index, SimpleNamespace(name=f"repo{index}", repository_id=f"repo{index}",
+                                    server=SimpleNamespace(hostname=f"host{index}", backrest_port=9898)))
+            for index in range(3)
+        ]
+        with mock.patch('backrest.services.BackrestService', FakeService):
+            with assert_within_budget(http_calls=9, ssh_commands=0) as stats:
+                outcomes = RetentionEngine(tag='month-2026-09', max_workers=3).run(jobs)
+
+        self.assertEqual(stats.http_calls, 9)
+        self.assertEqual({outcome['forgotten'] for outcome in outcomes.values()}, {1})
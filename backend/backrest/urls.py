@@ -4,7 +4,7 @@ from .api_views import (
     SSHKeyViewSet, ServerViewSet, BackrestRepositoryViewSet,
     BackrestPlanViewSet, BackrestSnapshotViewSet, BackrestOperationViewSet,
     BackrestLogViewSet, MarkInstanceCompleteView, CheckBackrestServiceStatusView,
-    BackrestStatusView
+    BackrestStatusView, BackrestHookView, BackrestMetricsView, StorageUsageView
 )
 
 router = DefaultRouter()
@@ -21,4 +21,7 @@ urlpatterns = [
     path('status/', BackrestStatusView.as_view(), name='backrest-status'),
     path('instances/<str:instance_id>/mark-complete/', MarkInstanceCompleteView.as_view(), name='mark-instance-complete'),
     path('servers/<int:server_id>/check_service_status/', CheckBackrestServiceStatusView.as_view(), name='check-service-status'),
+    path('hooks/<int:server_id>/<str:token>/', BackrestHookView.as_view(), name='backrest-hook'),
+    path('metrics/', BackrestMetricsView.as_view(), name='backrest-metrics'),
+    path('storage/usage/', StorageUsageView.as_view(), name='storage-usage'),
 ]
\ No newline at end of file
@@ -26,7 +26,8 @@ app.conf.beat_schedule = {
     # Existing tasks
     'sync-backrest-operations': {
         'task': 'backrest.tasks.sync_backrest_operations',
-        'schedule': 60.0,  # Every 60 seconds
+        # Dispatcher tick - each server is only polled when its next_poll_at is due
+        'schedule': 5.0,
     },
     'process-backrest-logs': {
         'task': 'backrest.tasks.process_backrest_logs',
@@ -41,6 +42,18 @@ app.conf.beat_schedule = {
         'task': 'backrest.tasks.sync_scheduled_operations',
         'schedule': 900.0,  # Every 15 minutes
     },
+    'sync-backrest-snapshots': {
+        'task': 'backrest.tasks.sync_backrest_snapshots',
+        'schedule': 900.0,  # Every 15 minutes, one child task per repository
+    },
+    'maintain-log-partitions': {
+        'task': 'backrest.tasks.maintain_log_partitions',
+        'schedule': crontab(hour=2, minute=30),  # Daily
+    },
+    'reconcile-storage-usage': {
+        'task': 'backrest.tasks.reconcile_storage_usage',
+        'schedule': crontab(hour=3, minute=0),  # Nightly
+    },
 }
 
 
@@ -122,7 +122,8 @@ INSTALLED_APPS = list(SHARED_APPS) + [app for app in TENANT_APPS if app not in S
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
-    'django_tenants.middleware.main.TenantMainMiddleware', # Should be high up
+    'tenants.middleware.CachedTenantMainMiddleware', # TenantMainMiddleware with a cached hostname lookup; should be high up
+    'backrest.instrumentation.InstrumentationMiddleware', # Per-request query/HTTP/SSH accounting
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -293,4 +294,142 @@ CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_SERIALIZER = 'json'
\ No newline at end of file
+CELERY_RESULT_SERIALIZER = 'json'
+
+# Cache Configuration
+# Shared Redis cache, used for cross-worker locks and short-lived lookups
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+}
+
+# Backrest sync settings
+# How long a per-tenant sync lock is held before it is considered stale (seconds)
+BACKREST_SYNC_LOCK_TIMEOUT = 300
+
+# Backrest HTTP connection pool
+# Max keep-alive connections kept open per Backrest server, per process
+BACKREST_HTTP_POOL_SIZE = 10
+# Retries (with exponential backoff) for idempotent RPCs like GetConfig/GetOperations
+BACKREST_HTTP_MAX_RETRIES = 3
+BACKREST_HTTP_BACKOFF_FACTOR = 0.5
+# Max Backrest servers polled at once by the async fan-out, and per-server time limit (seconds)
+BACKREST_ASYNC_CONCURRENCY = 50
+BACKREST_ASYNC_SERVER_TIMEOUT = 30
+
+# Backrest SSH session pool
+# Concurrent SSH sessions kept per host, and how long an unused session stays open (seconds)
+BACKREST_SSH_MAX_SESSIONS_PER_HOST = 2
+BACKREST_SSH_IDLE_TIMEOUT = 300
+# Longest a task waits for a free pooled SSH session to a host before giving up (seconds)
+BACKREST_SSH_ACQUIRE_TIMEOUT = 120
+
+# Backrest log tailing
+# Max bytes of backrest.log fetched per server per poll; the rest is picked up next poll
+BACKREST_LOG_TAIL_MAX_BYTES = 1024 * 1024
+# Log lines written per bulk INSERT when ingesting Backrest logs
+BACKREST_LOG_INGEST_CHUNK_SIZE = 2000
+
+# Maximum number of rows exported from one tasklog database per poll
+BACKREST_TASKLOG_EXPORT_LIMIT = 5000
+
+# Incremental operation sync
+# Operations requested per page, and how many pages one sync may widen to for a backlog
+BACKREST_OPERATIONS_PAGE_SIZE = 100
+BACKREST_OPERATIONS_MAX_PAGES = 10
+# Seconds between full reconciliations of a repository's operation history
+BACKREST_OPERATIONS_FULL_SYNC_INTERVAL = 3600
+
+# Adaptive operation polling (seconds)
+# Servers with running operations or a backup due within the lookahead are polled every ACTIVE_INTERVAL;
+# idle servers double their interval from MIN_IDLE_INTERVAL up to MAX_IDLE_INTERVAL
+BACKREST_POLL_ACTIVE_INTERVAL = 5
+BACKREST_POLL_MIN_IDLE_INTERVAL = 60
+BACKREST_POLL_MAX_IDLE_INTERVAL = 900
+BACKREST_POLL_SCHEDULE_LOOKAHEAD = 300
+
+# Base URL Backrest hooks post operation events to, e.g. "https://{domain}" or "http://{domain}:8000".
+# {domain} is the tenant's primary domain; when unset the tenant's primary domain URL is used.
+BACKREST_HOOK_BASE_URL = os.environ.get('BACKREST_HOOK_BASE_URL')
+# How far apart (seconds) a hook-created operation and Backrest's own record of it may start and still be merged
+BACKREST_HOOK_MATCH_WINDOW = 600
+
+# Operation event subscriber (manage.py subscribe_operation_events)
+# Seconds without any bytes on the stream before reconnecting, and the cap on reconnect backoff
+BACKREST_EVENTS_READ_TIMEOUT = 120
+BACKREST_EVENTS_MAX_BACKOFF = 60
+
+# Per task run / request resource budgets (backrest/instrumentation.py)
+# Keys are Celery task names or "<METHOD> <route>"; 'default' applies to everything else.
+# Limits: queries, db_time_ms, http_calls, ssh_commands
+BACKREST_RUN_BUDGETS = {
+    'default': {'queries': 200, 'db_time_ms': 2000},
+    'backrest.tasks.process_backrest_logs': {'queries': 500, 'ssh_commands': 100},
+    'backrest.tasks.process_backrest_db_logs': {'queries': 1000, 'ssh_commands': 500},
+    'backrest.tasks.sync_tenant_operations': {'queries': 500, 'http_calls': 500},
+}
+# 'warn' logs over-budget runs; 'raise' also raises BudgetExceeded (use in tests)
+BACKREST_BUDGET_MODE = os.environ.get('BACKREST_BUDGET_MODE', 'warn')
+
+# Scheduled backup occurrences (backrest/schedules.py)
+# How far ahead plan schedules are materialized, and how long a missed occurrence is kept
+BACKREST_SCHEDULE_HORIZON_HOURS = 48
+BACKREST_SCHEDULE_GRACE_MINUTES = 60
+
+# Monthly BackrestLog partitions (backrest/partitions.py)
+# Months created ahead of time; retention itself is Tenant.log_retention_days
+BACKREST_LOG_PARTITIONS_AHEAD = 3
+
+# Keyset pagination for list endpoints (backrest/listing.py), used when a client passes ?page_size= or ?cursor=
+BACKREST_PAGE_SIZE = 100
+BACKREST_MAX_PAGE_SIZE = 1000
+
+# Field encryption keys (backrest/crypto.py), comma separated, newest first.
+# Empty means the BASE_DIR/.encryption_key file; when set, that file's key is still accepted for decryption.
+# Rotate by prepending a new key and running `manage.py reencrypt_secrets`.
+BACKREST_ENCRYPTION_KEYS = [key.strip() for key in os.environ.get('BACKREST_ENCRYPTION_KEYS', '').split(',') if key.strip()]
+# Decrypted secrets kept in memory per process, and for how many seconds
+BACKREST_SECRET_CACHE_SIZE = 256
+BACKREST_SECRET_CACHE_TTL = 300
+
+# JWT user resolution cache (accounts/authentication.py)
+# Redis entries are cleared when a User is saved/deleted; the per-process copy
+# expires after AUTH_USER_CACHE_LOCAL_TTL seconds, which bounds how long a
+# deactivated user can still authenticate against another worker.
+AUTH_USER_CACHE_TTL = 300
+AUTH_USER_CACHE_LOCAL_TTL = 5
+AUTH_USER_CACHE_LOCAL_SIZE = 1000
+
+# Tenant resolution cache (tenants/middleware.py)
+# Redis entries are cleared on Tenant/Domain save/delete; per-process entries expire after TENANT_CACHE_LOCAL_TTL seconds
+TENANT_CACHE_TTL = 300
+TENANT_CACHE_LOCAL_TTL = 10
+TENANT_CACHE_LOCAL_SIZE = 512
+
+# File-level snapshot catalog (backrest/catalog.py), one SQLite file per tenant.
+# The web and worker containers must share BACKREST_CATALOG_DIR.
+BACKREST_CATALOG_ENABLED = True
+BACKREST_CATALOG_DIR = os.environ.get('BACKREST_CATALOG_DIR', os.path.join(BASE_DIR, 'catalog'))
+# Snapshots indexed per task run; the task re-queues itself until caught up
+BACKREST_CATALOG_MAX_SNAPSHOTS_PER_RUN = 20
+BACKREST_CATALOG_LOCK_TIMEOUT = 3600
+
+# Storage accounting (backrest/storage.py)
+# trigger_backup refuses to start backups once Tenant.storage_used_bytes reaches max_storage_gb (0 = unlimited)
+BACKREST_ENFORCE_STORAGE_QUOTA = True
+# Longest to wait for Backrest to measure one repository with restic stats (seconds)
+BACKREST_STATS_TIMEOUT = 600
+
+# Monthly retention (backrest/retention.py)
+# Repositories processed at once, and at most this many per Backrest server
+BACKREST_RETENTION_WORKERS = 8
+BACKREST_RETENTION_PER_SERVER = 1
+# Longest to wait for Backrest to finish forgetting one snapshot (seconds)
+BACKREST_FORGET_TIMEOUT = 300
+# restic on the Backrest servers (backrest/restic.py); unset finds it on PATH or in Backrest's data dir
+BACKREST_RESTIC_BINARY = os.environ.get('BACKREST_RESTIC_BINARY') or None
@@ -14,6 +14,7 @@ from django.conf import settings
 import ansible_runner # Import ansible_runner
 import uuid # For unique run identifiers
 
+from backrest.listing import SparseFieldsViewMixin
 from .models import BackupJob, JobLog # Import JobLog
 from .serializers import ( # Import ActivityLogSerializer
     CreateBackupJobSerializer,
@@ -193,20 +194,25 @@ class CreateBackupJobView(generics.CreateAPIView):
             logger.error(f"Failed to create/dispatch backup job for tenant {request.tenant.schema_name}: {e}", exc_info=True)
             return Response({"detail": "Failed to create or dispatch backup job."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class RecentActivityListView(generics.ListAPIView):
+class RecentActivityListView(SparseFieldsViewMixin, generics.ListAPIView):
     """
     API endpoint to retrieve recent activity logs (JobLog entries)
     for the current tenant's dashboard.
+    Pass ?page_size= / ?cursor= to page through the full history.
     """
     serializer_class = ActivityLogSerializer
     permission_classes = [permissions.IsAuthenticated] # Ensure user is logged in
+    cursor_ordering = ('-timestamp', '-id')
 
     def get_queryset(self):
         # Filter logs belonging to jobs of the current tenant
         # Order by timestamp descending to get the latest first
-        # Limit the number of results (e.g., last 20)
         tenant = self.request.tenant
-        return JobLog.objects.filter(job__tenant=tenant).order_by('-timestamp')[:20] # Adjust limit as needed
+        queryset = self.optimize_queryset(JobLog.objects.filter(job__tenant=tenant).order_by('-timestamp'))
+        if not self.paginator.is_requested(self.request):
+            # Unpaginated dashboard call - just the last 20
+            return queryset[:20]
+        return queryset
 
 class TriggerMysqlDumpBackupView(views.APIView):
     """
@@ -1,5 +1,6 @@
 # filepath: c:\Users\defin\WCTPROJECTMVP6.0\backend\jobs\serializers.py
 from rest_framework import serializers
+from backrest.listing import SparseFieldsMixin
 from .models import BackupJob, JobLog # Import JobLog
 
 class CreateBackupJobSerializer(serializers.Serializer):
@@ -18,7 +19,7 @@ class BackupJobResponseSerializer(serializers.ModelSerializer):
         model = BackupJob
         fields = ('job_id', 'status', 'uuid') # Return ID, status, uuid
 
-class ActivityLogSerializer(serializers.ModelSerializer):
+class ActivityLogSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for displaying recent activity logs on the dashboard.
     Maps JobLog fields to a format suitable for the frontend timeline.
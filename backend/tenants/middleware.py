@@ -0,0 +1,92 @@
+# backend/tenants/middleware.py
+"""
+Tenant resolution with a cache in front of django-tenants' domain lookup.
+
+TenantMainMiddleware resolves the request's hostname with a Domain ⨝
+Tenant query on every request. CachedTenantMainMiddleware keeps the
+resolved tenant in a per-process LRU (short TTL) backed by Redis (longer
+TTL). Saves and deletes of Tenant and Domain rows clear both (see
+tenants/signals.py); the local TTL bounds how long other processes can
+keep using a changed tenant.
+"""
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django_tenants.middleware.main import TenantMainMiddleware
+
+logger = logging.getLogger(__name__)
+
+_local_tenants = OrderedDict()
+_local_tenants_lock = threading.Lock()
+
+
+def tenant_cache_key(hostname):
+    return f"tenant:domain:{hostname}"
+
+
+def _local_get(hostname):
+    with _local_tenants_lock:
+        entry = _local_tenants.get(hostname)
+        if entry is None:
+            return None
+        data, expires = entry
+        if expires < time.monotonic():
+            del _local_tenants[hostname]
+            return None
+        _local_tenants.move_to_end(hostname)
+        return data
+
+
+def _local_put(hostname, data):
+    ttl = getattr(settings, 'TENANT_CACHE_LOCAL_TTL', 10)
+    size = getattr(settings, 'TENANT_CACHE_LOCAL_SIZE', 512)
+    with _local_tenants_lock:
+        _local_tenants[hostname] = (data, time.monotonic() + ttl)
+        _local_tenants.move_to_end(hostname)
+        while len(_local_tenants) > size:
+            _local_tenants.popitem(last=False)
+
+
+def invalidate_hostnames(hostnames):
+    """Forget the cached tenant of each hostname, here and in Redis"""
+    hostnames = [hostname for hostname in hostnames if hostname]
+    if not hostnames:
+        return
+    with _local_tenants_lock:
+        for hostname in hostnames:
+            _local_tenants.pop(hostname, None)
+    try:
+        cache.delete_many([tenant_cache_key(hostname) for hostname in hostnames])
+    except Exception as e:
+        logger.warning(f"Could not invalidate cached tenants for {hostnames}: {e}")
+
+
+class CachedTenantMainMiddleware(TenantMainMiddleware):
+    """TenantMainMiddleware that resolves hostnames through the tenant cache"""
+
+    def get_tenant(self, domain_model, hostname):
+        data = _local_get(hostname)
+        if data is None:
+            try:
+                data = cache.get(tenant_cache_key(hostname))
+            except Exception as e:
+                logger.warning(f"Tenant cache unavailable, falling back to the database: {e}")
+                data = None
+
+            if data is None:
+                # Raises domain_model.DoesNotExist for unknown hosts, as before
+                tenant = super().get_tenant(domain_model, hostname)
+                data = pickle.dumps(tenant)
+                try:
+                    cache.set(tenant_cache_key(hostname), data, getattr(settings, 'TENANT_CACHE_TTL', 300))
+                except Exception as e:
+                    logger.warning(f"Could not cache tenant for {hostname}: {e}")
+            _local_put(hostname, data)
+
+        # A fresh instance per request - the middleware sets attributes on it
+        return pickle.loads(data)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
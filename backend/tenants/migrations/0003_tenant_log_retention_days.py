@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0002_tenant_next_poll_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='log_retention_days',
+            field=models.PositiveIntegerField(default=90, help_text='Backrest logs older than this are dropped, a month partition at a time'),
+        ),
+    ]
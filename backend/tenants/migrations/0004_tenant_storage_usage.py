@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0003_tenant_log_retention_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='storage_reconciled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='storage_snapshot_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='storage_used_bytes',
+            field=models.BigIntegerField(default=0, help_text="Size on disk of the tenant's repositories, measured nightly plus data added since"),
+        ),
+        migrations.CreateModel(
+            name='TenantStorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('used_bytes', models.BigIntegerField()),
+                ('snapshot_count', models.IntegerField()),
+                ('repositories', models.JSONField(default=dict, help_text='Used bytes per repository id')),
+                ('recorded_at', models.DateTimeField(auto_now=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='storage_usage', to='tenants.tenant')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('tenant', 'date')},
+            },
+        ),
+    ]
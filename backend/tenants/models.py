@@ -7,6 +7,10 @@ import uuid
 import re # Import re for potential use, though save method is removed
 
 
+def primary_domain_cache_key(tenant_id):
+    return f"tenant:primary-domain:{tenant_id}"
+
+
 class Tenant(TenantMixin):
     """
     Tenant model for multi-tenancy.
@@ -31,6 +35,20 @@ class Tenant(TenantMixin):
     # Tenant settings
     max_users = models.PositiveIntegerField(default=10) # Increased default
     max_storage_gb = models.PositiveIntegerField(default=5) # Decreased default
+    log_retention_days = models.PositiveIntegerField(
+        default=90,
+        help_text="Backrest logs older than this are dropped, a month partition at a time"
+    )
+    # Storage rollup, see backrest/storage.py; updated with queryset.update() so saves don't race the sync
+    storage_used_bytes = models.BigIntegerField(
+        default=0,
+        help_text="Size on disk of the tenant's repositories, measured nightly plus data added since"
+    )
+    storage_snapshot_count = models.IntegerField(default=0)
+    storage_reconciled_at = models.DateTimeField(null=True, blank=True)
+    # Earliest next_poll_at of the tenant's servers (backrest/polling.py), so the sync
+    # dispatcher finds due tenants with one query instead of entering every schema
+    next_poll_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     # Required by django-tenants
     auto_create_schema = True
@@ -44,22 +62,56 @@ class Tenant(TenantMixin):
         return self.name
 
     def get_primary_domain(self):
-        """Get the primary domain object for the tenant."""
-        return self.domains.filter(is_primary=True).first()
+        """Get the primary domain object for the tenant (memoized on the instance)."""
+        if not hasattr(self, '_primary_domain'):
+            self._primary_domain = self.domains.filter(is_primary=True).first()
+        return self._primary_domain
 
     def get_primary_domain_url(self):
         """Get the tenant's primary domain URL (assuming http for local)."""
-        domain = self.get_primary_domain()
-        if domain:
+        from django.core.cache import cache
+
+        # Cached across requests; cleared by tenants/signals.py when domains change
+        key = primary_domain_cache_key(self.pk)
+        try:
+            domain_name = cache.get(key)
+        except Exception:
+            domain_name = None
+        if domain_name is None:
+            domain = self.get_primary_domain()
+            domain_name = domain.domain if domain else ''
+            try:
+                cache.set(key, domain_name, 300)
+            except Exception:
+                pass
+
+        if domain_name:
             # Use http for localhost development
             protocol = "http" # Change to https if using SSL locally or in production
-            return f"{protocol}://{domain.domain}"
+            return f"{protocol}://{domain_name}"
         return None
 
     # Removed the generate_domain_name method - logic moved to view
     # Removed the save method - schema_name generation moved to view
 
 
+class TenantStorageUsage(models.Model):
+    """Daily record of a tenant's storage usage, written by the nightly reconciliation"""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='storage_usage')
+    date = models.DateField()
+    used_bytes = models.BigIntegerField()
+    snapshot_count = models.IntegerField()
+    repositories = models.JSONField(default=dict, help_text="Used bytes per repository id")
+    recorded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('tenant', 'date')]
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.tenant} storage on {self.date}"
+
+
 class Domain(DomainMixin):
     """
     Domain model for django-tenants.
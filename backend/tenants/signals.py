@@ -0,0 +1,53 @@
+# backend/tenants/signals.py
+"""
+Clear the tenant resolution cache (tenants/middleware.py) and the cached
+primary domain URL whenever a Tenant or Domain is saved or deleted.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .middleware import invalidate_hostnames
+from .models import Domain, Tenant, primary_domain_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+def _invalidate(tenant_id, hostnames):
+    from django.core.cache import cache
+
+    def invalidate():
+        invalidate_hostnames(hostnames)
+        try:
+            cache.delete(primary_domain_cache_key(tenant_id))
+        except Exception as e:
+            logger.warning(f"Could not invalidate primary domain of tenant {tenant_id}: {e}")
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_save, sender=Domain, dispatch_uid='tenants-domain-cache-pre-save')
+def remember_old_hostname(sender, instance, **kwargs):
+    # A renamed domain must also drop the cache entry of its old hostname
+    instance._old_hostname = None
+    if instance.pk:
+        instance._old_hostname = Domain.objects.filter(pk=instance.pk).values_list('domain', flat=True).first()
+
+
+@receiver(post_save, sender=Domain, dispatch_uid='tenants-domain-cache-save')
+@receiver(post_delete, sender=Domain, dispatch_uid='tenants-domain-cache-delete')
+def invalidate_domain(sender, instance, **kwargs):
+    _invalidate(instance.tenant_id, [instance.domain, getattr(instance, '_old_hostname', None)])
+
+
+@receiver(post_save, sender=Tenant, dispatch_uid='tenants-tenant-cache-save')
+@receiver(post_delete, sender=Tenant, dispatch_uid='tenants-tenant-cache-delete')
+def invalidate_tenant(sender, instance, **kwargs):
+    try:
+        hostnames = list(Domain.objects.filter(tenant_id=instance.pk).values_list('domain', flat=True))
+    except Exception as e:
+        logger.warning(f"Could not list domains of tenant {instance.pk}: {e}")
+        hostnames = []
+    _invalidate(instance.pk, hostnames)